@@ -0,0 +1,194 @@
+"""
+ai_cache.py – Caché persistente de respuestas de la IA (LRU + TTL).
+
+Las claves no son el texto del prompt sino el perfil normalizado de la red
+(ver ``ai_suggestions.network_profile``), así que cientos de redes con la
+misma seguridad, banda, tecnología y nivel de señal comparten una respuesta.
+
+* ``OrderedDict`` acotado a ``max_entries`` (se expulsa la menos usada) y
+  caducidad ``ttl``; se guarda en ``ai_cache.json`` con escritura atómica,
+  agrupando los cambios de ``save_delay`` segundos en una sola escritura
+  (y solo si hay cambios: sin ellos la salida no toca el fichero).
+* ``get_or_compute`` (o ``claim``/``resolve`` para respuestas en streaming)
+  deduplica peticiones en vuelo: si dos clics piden la misma clave a la vez,
+  solo uno llama a la API y el otro espera su resultado.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_cache.json")
+
+
+class ResponseCache:
+    """Clave de perfil → respuesta, con LRU, TTL y persistencia en JSON."""
+
+    def __init__(self, path: Optional[str] = CACHE_FILE, max_entries: int = 512,
+                 ttl: float = 7 * 24 * 3600, save_delay: float = 2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_delay = save_delay
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()      # una escritura del fichero a la vez
+        self._save_timer: Optional[threading.Timer] = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            # El fichero se guarda del menos al más usado: se respeta ese orden
+            for key, entry in data.items():
+                if isinstance(entry, dict) and entry.get("text") and now - entry.get("ts", 0) < self.ttl:
+                    self._entries[key] = {"text": entry["text"], "ts": float(entry["ts"])}
+            print(f"✅ Caché de IA cargada: {len(self._entries)} respuestas")
+        except Exception as e:
+            print(f"⚠️ Error cargando caché de IA: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with self._save_lock:
+                with self._lock:
+                    if not self._dirty:
+                        return
+                    data = dict(self._entries)
+                    self._dirty = False
+                tmp_file = self.path + ".tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_file, self.path)
+        except Exception as e:
+            with self._lock:
+                self._dirty = True      # se reintenta en la próxima escritura
+            print(f"⚠️ Error guardando caché de IA: {e}")
+
+    def _schedule_save(self):
+        """Programa una escritura dentro de ``save_delay`` s (si ya hay una pendiente, esa sirve)."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Escribe ya los cambios pendientes (nada si no los hay)."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+        self._save()
+
+    def _fresh_locked(self, key: str) -> Optional[str]:
+        """Texto vigente de ``key`` (con ``_lock`` tomado); quita la entrada si caducó."""
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["ts"] >= self.ttl:
+            if entry is not None:
+                del self._entries[key]
+                self._dirty = True
+            return None
+        self._entries.move_to_end(key)
+        return entry["text"]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._fresh_locked(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._entries[key] = {"text": text, "ts": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        self._schedule_save()
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Petición en vuelo para ``key``: (future, True) si la hace este llamador, (future, False)
+        si ya hay otra o si la respuesta llegó a la caché entre el ``get`` y este ``claim``.
+        """
+        with self._lock:
+            text = self._fresh_locked(key)
+            if text is not None:
+                self.deduplicated += 1
+                done = Future()
+                done.set_result(text)
+                return done, False
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self.deduplicated += 1
+                return pending, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def resolve(self, key: str, future: Future, text: Optional[str] = None,
+                error: Optional[BaseException] = None,
+                cacheable: Callable[[str], bool] = lambda text: bool(text)):
+        """Cierra una petición reclamada con ``claim``: despierta a los que esperan y guarda el texto."""
+        # Se guarda antes de soltar la clave: quien llegue después la encuentra en caché
+        if error is None and cacheable(text):
+            self.put(key, text)
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(text)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str],
+                       cacheable: Callable[[str], bool] = lambda text: bool(text)) -> str:
+        """Respuesta cacheada, o ``compute()`` una sola vez aunque lo pidan varios hilos."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        future, owner = self.claim(key)
+        if not owner:
+            return future.result()
+        try:
+            text = compute()
+        except BaseException as e:
+            self.resolve(key, future, error=e)
+            raise
+        self.resolve(key, future, text, cacheable=cacheable)
+        return text
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "deduplicated": self.deduplicated, "inflight": len(self._inflight)}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,126 @@
+"""
+ai_rules.py – Recomendaciones locales (sin red) para tecnología y seguridad WiFi.
+
+Motor de reglas determinista sobre los campos que ya trae cada red del
+escaneo (``Seguridad``, ``Tecnologia``, ``Banda``, ``Señal``, ``Canal``):
+responde al instante y sin conexión. La consulta a la IA de
+``ai_suggestions`` solo refina esta respuesta cuando está disponible.
+
+Las reglas trabajan sobre el perfil normalizado (``network_profile``), así
+que el texto de cada combinación se calcula una vez y queda memorizado.
+"""
+
+from functools import lru_cache
+from typing import List, Optional
+
+ENLACES_SEGURIDAD = ("https://www.wi-fi.org/discover-wi-fi/security",)
+ENLACES_TECNOLOGIA = ("https://www.wi-fi.org/discover-wi-fi/wi-fi-certified-6",
+                      "https://www.wi-fi.org/discover-wi-fi/wi-fi-certified-7")
+
+# Canales de 2.4 GHz que no se solapan entre sí
+CANALES_24_LIBRES = (1, 6, 11)
+
+_SEGURIDAD = {
+    "ABIERTA": ("🔓 Red abierta: todo el tráfico viaja sin cifrar y cualquiera puede conectarse.",
+                ["Activa WPA3-Personal (SAE) con una contraseña larga.",
+                 "Si tiene que ser pública, usa OWE (Enhanced Open): cifra sin pedir contraseña.",
+                 "Mientras tanto, usa solo sitios HTTPS o una VPN en esta red."]),
+    "WEP": ("⛔ WEP está roto: la clave se recupera en minutos.",
+            ["Cambia a WPA3-Personal o, como mínimo, WPA2 con AES (CCMP).",
+             "Si el router solo ofrece WEP, hay que sustituirlo."]),
+    "WPA": ("⚠️ WPA (TKIP) está obsoleto y tiene ataques conocidos.",
+            ["Cambia a WPA2-AES o, mejor, WPA3-Personal.",
+             "Desactiva TKIP en la configuración del router."]),
+    "WPA2": ("🔒 WPA2 es aceptable si usa AES (CCMP), pero es vulnerable a diccionario con claves débiles.",
+             ["Migra a WPA3-Personal (SAE) o al modo de transición WPA2/WPA3 si hay equipos antiguos.",
+              "Usa una contraseña de 12+ caracteres y desactiva WPS.",
+              "Comprueba que el cifrado sea AES y no TKIP."]),
+    "WPA2+WPA3": ("🔒 Modo de transición WPA2/WPA3: compatible, pero los equipos WPA2 siguen siendo el punto débil.",
+                  ["Cuando todos los dispositivos soporten WPA3, deja solo WPA3-Personal.",
+                   "Activa PMF (Protected Management Frames)."]),
+    "WPA3": ("✅ WPA3 es el protocolo recomendado actualmente.",
+             ["Mantén PMF obligatorio y el firmware del router actualizado.",
+              "Desactiva WPS si sigue activo."]),
+    "OWE": ("✅ OWE (Enhanced Open) cifra redes públicas sin contraseña.",
+            ["Para una red privada, usa WPA3-Personal en su lugar."]),
+    "DESCONOCIDA": ("❔ No se pudo determinar la seguridad de la red.",
+                    ["Comprueba en el router que use WPA3-Personal o, como mínimo, WPA2-AES."]),
+}
+
+_CONSEJO_SENAL = {
+    "excelente": None,
+    "buena": None,
+    "regular": "📶 Señal regular: antes de cambiar de estándar, acerca el router o reubícalo en alto y despejado.",
+    "débil": "📶 Señal débil: la tecnología no es el cuello de botella; un sistema mesh o un punto de acceso "
+             "adicional mejorará más que un router nuevo.",
+}
+
+
+def _familia(seguridad: str) -> str:
+    """Clave de ``_SEGURIDAD``; en modos mixtos manda la familia más débil (salvo WPA2/WPA3)."""
+    base = seguridad.replace("-ENT", "")
+    if base in _SEGURIDAD:
+        return base
+    partes = base.split("+")
+    for familia in ("WEP", "WPA", "WPA2", "OWE", "WPA3"):
+        if familia in partes:
+            return familia
+    return "DESCONOCIDA"
+
+
+def _canal(canal) -> Optional[int]:
+    try:
+        return int(str(canal).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=256)
+def _texto_protocolo(seguridad: str) -> str:
+    familia = _familia(seguridad)
+    resumen, pasos = _SEGURIDAD[familia]
+    if seguridad.endswith("-ENT"):
+        pasos = pasos + ["Red Enterprise (802.1X): usa WPA3-Enterprise y valida siempre el certificado del servidor RADIUS."]
+    return _componer(resumen, pasos, ENLACES_SEGURIDAD)
+
+
+@lru_cache(maxsize=256)
+def _texto_tecnologia(banda: str, tecnologia: str, senal: str, canal: Optional[int]) -> str:
+    estandares = set(tecnologia.split("/"))
+    pasos: List[str] = []
+    if banda == "2.4 GHz":
+        resumen = "📡 Red en 2.4 GHz: más alcance, pero banda saturada y más lenta."
+        pasos.append("Actualiza a un router WiFi 6 (802.11ax) de doble banda y conecta los equipos cercanos a 5 GHz.")
+        if canal is not None and canal not in CANALES_24_LIBRES:
+            pasos.append(f"El canal {canal} se solapa con los vecinos: usa 1, 6 u 11.")
+    elif banda == "6 GHz" or "6e" in estandares or "be" in estandares:
+        resumen = "✅ Red en 6 GHz (WiFi 6E/7): tecnología actual, con canales anchos y sin interferencias heredadas."
+        pasos.append("Solo WiFi 7 (802.11be) aporta más: MLO y canales de 320 MHz.")
+    elif banda == "5 GHz":
+        if "ax" in estandares and "ac" not in estandares:
+            resumen = "✅ WiFi 6 en 5 GHz: buena tecnología para la mayoría de usos."
+            pasos.append("WiFi 6E/7 solo compensa si tienes muchos dispositivos o necesitas la banda de 6 GHz.")
+        else:
+            resumen = "📡 Red en 5 GHz (WiFi 5 o posible WiFi 6)."
+            pasos.append("Actualiza a WiFi 6 (802.11ax): OFDMA y MU-MIMO reparten mejor el canal entre muchos equipos.")
+        if canal is not None and 52 <= canal <= 144:
+            pasos.append(f"El canal {canal} es DFS: puede cortarse si se detecta un radar; los canales 36–48 son más estables.")
+    else:
+        resumen = "❔ No se pudo identificar la banda ni el estándar de la red."
+        pasos.append("Un router WiFi 6 (802.11ax) de doble banda es la opción recomendada hoy.")
+    consejo = _CONSEJO_SENAL.get(senal)
+    if consejo:
+        pasos.insert(0, consejo)
+    return _componer(resumen, pasos, ENLACES_TECNOLOGIA)
+
+
+def _componer(resumen: str, pasos: List[str], enlaces) -> str:
+    lineas = [resumen, ""] + [f"• {p}" for p in pasos] + ["", "Más información:"] + [f"  {e}" for e in enlaces]
+    return "\n".join(lineas)
+
+
+def recomendacion_local(perfil: dict, tipo: str, canal=None) -> str:
+    """Recomendación inmediata para un perfil de red (``ai_suggestions.network_profile``)."""
+    if tipo == "protocolo":
+        return _texto_protocolo(perfil["seguridad"])
+    return _texto_tecnologia(perfil["banda"], perfil["tecnologia"], perfil["senal"], _canal(canal))
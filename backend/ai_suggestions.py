@@ -1,8 +1,14 @@
-import requests
-import time
+import re
+import threading
 import random
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
+from typing import Iterator, Optional
+
+from ai_cache import ResponseCache
+from ai_rules import recomendacion_local
+from llm_client import LLMClient, LLMError
 # ---------------- Configuración OpenRouter ----------------
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("API_KEY")
@@ -26,117 +32,208 @@ MODELOS = [
     
 ]
 
-# Cache simple para evitar consultas repetidas
-_cache = {}
-_CACHE_DURATION = 30  # segundos
+# Segundos que puede tardar la IA en total (todos los modelos) antes de quedarse con la respuesta local
+AI_BUDGET = float(os.getenv("AI_BUDGET", "15"))
 
-def _query_tecnologia(prompt: str) -> str:
-    """Consulta directa a OpenRouter sin reintentos"""
-    cache_key = prompt.strip()
-
-    # 🔹 Verificar cache
-    if cache_key in _cache:
-        timestamp, response_cached = _cache[cache_key]
-        if time.time() - timestamp < _CACHE_DURATION:
-            #print("⚡ Respuesta desde cache")
-            return response_cached
-        
-    MODELO = "stepfun/step-3.5-flash:free"  # usa uno válido
-
-    payload = {
-        "model": MODELO,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.4
-    }
+# Modelo preferido por tipo de consulta (si falla se prueba el resto de MODELOS)
+MODELO_TECNOLOGIA = "stepfun/step-3.5-flash:free"
+MODELO_PROTOCOLO = "arcee-ai/trinity-large-preview:free"
+
+# Caché persistente por perfil de red (no por SSID): ver network_profile()
+_response_cache = ResponseCache()
 
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> LLMClient:
+    """Cliente compartido (una sesión con keep-alive para toda la aplicación)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(OPENROUTER_URL, HEADERS, MODELOS,
+                                timeout=min(15.0, AI_BUDGET), budget=AI_BUDGET)
+        return _client
+
+def _query(prompt: str, modelo: str) -> str:
+    """Consulta con fallback entre modelos; los errores se devuelven como texto"""
+    if not OPENROUTER_URL:
+        return "Error de conexión: OPENROUTER no configurado"
     try:
-        response = requests.post(
-            OPENROUTER_URL,
-            headers=HEADERS,
-            json=payload,
-            timeout=15
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
-        else:
-            return f"Error {response.status_code}: {response.text}"
+        return get_client().complete(prompt, preferred=modelo)
+    except LLMError as e:
+        return _texto_error(e)
 
-    except Exception as e:
-        return f"Error de conexión: {e}"
-    
+def _texto_error(error: LLMError) -> str:
+    """Los errores empiezan por "Error" (así no se cachean como respuesta)."""
+    texto = str(error)
+    return texto if texto.startswith("Error") else f"Error: {texto}"
+
+def _query_tecnologia(prompt: str) -> str:
+    return _query(prompt, MODELO_TECNOLOGIA)
 
 def _query_Protocolo(prompt: str) -> str:
-    """Consulta directa a OpenRouter sin reintentos"""
-    cache_key = prompt.strip()
-
-    # 🔹 Verificar cache
-    if cache_key in _cache:
-        timestamp, response_cached = _cache[cache_key]
-        if time.time() - timestamp < _CACHE_DURATION:
-            #print("⚡ Respuesta desde cache")
-            return response_cached
-        
-    MODELO = "arcee-ai/trinity-large-preview:free"  # usa uno válido
-
-    payload = {
-        "model": MODELO,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.4
-    }
+    return _query(prompt, MODELO_PROTOCOLO)
+
+
+# ---------------- Perfil de red ----------------
+# Equivalencias "WiFi N" → estándar 802.11
+_WIFI_GENERATIONS = {"7": "be", "6e": "6e", "6": "ax", "5": "ac", "4": "n"}
 
+def _normalizar_seguridad(seguridad) -> str:
+    """'WPA2-Personal', 'WPA2-PSK', 'wpa2 psk'... → 'WPA2'; transiciones → 'WPA2+WPA3'."""
+    texto = str(seguridad or "").upper()
+    if not texto or "DESCONOC" in texto:
+        return "DESCONOCIDA"
+    if "ABIERTA" in texto or "OPEN" in texto or texto in ("NINGUNA", "NONE", "--"):
+        return "ABIERTA"
+    familias = [f for f in ("WPA3", "WPA2", "OWE", "WEP") if f in texto]
+    if not familias and "WPA" in texto:
+        familias = ["WPA"]
+    if not familias:
+        return texto.strip()
+    clave = "+".join(sorted(familias))
+    if "ENTERPRISE" in texto or "802.1X" in texto or "EAP" in texto:
+        clave += "-ENT"
+    return clave
+
+def _normalizar_banda(banda) -> str:
+    texto = str(banda or "").lower()
+    for valor in ("2.4", "5", "6"):
+        if texto.startswith(valor):
+            return f"{valor} GHz"
+    return "Desconocida"
+
+def _normalizar_tecnologia(tecnologia) -> str:
+    """'WiFi 5 (802.11ac)', '5 GHz (ac/ax posible)' → 'ac' / 'ac/ax'."""
+    texto = str(tecnologia or "").lower()
+    estandares = set(re.findall(r"\b(be|ax|ac|6e|[abgn])\b", re.sub(r"[\d.]+\s*ghz", "", texto)))
+    for gen in re.findall(r"wi-?fi\s*(\d+e?)", texto):
+        if gen in _WIFI_GENERATIONS:
+            estandares.add(_WIFI_GENERATIONS[gen])
+    return "/".join(sorted(estandares)) or "desconocida"
+
+def _nivel_senal(senal) -> str:
+    """Señal en dBm → nivel (mismos umbrales que el resumen del escaneo)."""
     try:
-        response = requests.post(
-            OPENROUTER_URL,
-            headers=HEADERS,
-            json=payload,
-            timeout=15
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
-        else:
-            return f"Error {response.status_code}: {response.text}"
+        dbm = float(senal)
+    except (TypeError, ValueError):
+        return "desconocida"
+    if dbm > -55:
+        return "excelente"
+    if dbm > -67:
+        return "buena"
+    if dbm > -75:
+        return "regular"
+    return "débil"
 
-    except Exception as e:
-        return f"Error de conexión: {e}"
-    
-    
+def network_profile(red_meta: dict) -> dict:
+    """Perfil normalizado de una red: lo único que usan los prompts (y las claves de caché)."""
+    return {
+        "seguridad": _normalizar_seguridad(red_meta.get("Seguridad")),
+        "banda": _normalizar_banda(red_meta.get("Banda")),
+        "tecnologia": _normalizar_tecnologia(red_meta.get("Tecnologia")),
+        "senal": _nivel_senal(red_meta.get("Señal")),
+    }
 
+def _clave_cache(tipo: str, perfil: dict) -> str:
+    campos = ("seguridad",) if tipo == "protocolo" else ("banda", "tecnologia", "senal")
+    return "|".join([tipo] + [perfil[c] for c in campos])
 
-def _respuesta_predefinida(prompt: str) -> str:
-    """Respuestas predefinidas inteligentes cuando la IA no está disponible"""
-    if "tecnología" in prompt.lower() or "wifi 6" in prompt.lower():
-        return "📡 WiFi 5 detectado. Actualiza a WiFi 6 para mejor eficiencia y menor latencia."
-    elif "seguridad" in prompt.lower() or "wpa" in prompt.lower():
-        return "🔒 WPA2 es seguro. Migra a WPA3 para protección mejorada."
-    else:
-        return "💡 Consulta no disponible temporalmente. Intenta más tarde."
+def _respuesta_cacheable(texto: str) -> bool:
+    return bool(texto) and not texto.startswith("Error")
 
-def _crear_prompt_tecnologia(red_meta: dict) -> str:
+def _crear_prompt_tecnologia(perfil: dict) -> str:
     """Crea prompt ultra corto para tecnología"""
-    return f"Analiza WiFi: {red_meta.get('SSID')} | Señal: {red_meta.get('Señal')}dBm | Banda: {red_meta.get('Banda')} | Tech: {red_meta.get('Tecnologia')}. ¿A que wifi recomiendas actualizar y por qué?  Respuesta  clara y puedes sugerir sitios o plataformas que me ayuden a entender el por que de dicha sugerencia."
+    return f"Analiza WiFi: Señal: {perfil['senal']} | Banda: {perfil['banda']} | Tech: 802.11 {perfil['tecnologia']}. ¿A que wifi recomiendas actualizar y por qué?  Respuesta  clara y puedes sugerir sitios o plataformas que me ayuden a entender el por que de dicha sugerencia."
 
-def _crear_prompt_protocolo(red_meta: dict) -> str:
+def _crear_prompt_protocolo(perfil: dict) -> str:
     """Crea prompt ultra corto para seguridad"""
-    return f"Analiza seguridad: {red_meta.get('SSID')} | Seguridad: {red_meta.get('Seguridad')}. ¿Protocolo recomendado? se preciso en la respuesta y da sitios donde puedo saber más"
+    return f"Analiza seguridad: Seguridad: {perfil['seguridad']}. ¿Protocolo recomendado? se preciso en la respuesta y da sitios donde puedo saber más"
+
+def respuesta_local(red_meta: dict, tipo: str = "tecnologia") -> str:
+    """Recomendación del motor de reglas local: inmediata y sin conexión."""
+    return recomendacion_local(network_profile(red_meta), tipo, red_meta.get("Canal"))
 
 # ---------------- Funciones principales ----------------
 def sugerencia_tecnologia(red_meta: dict) -> str:
-    """Obtiene recomendación de tecnología"""
-    prompt = _crear_prompt_tecnologia(red_meta)
-    return _query_tecnologia(prompt)
+    """Obtiene recomendación de tecnología (compartida por redes con el mismo perfil)"""
+    perfil = network_profile(red_meta)
+    prompt = _crear_prompt_tecnologia(perfil)
+    texto = _response_cache.get_or_compute(_clave_cache("tecnologia", perfil),
+                                           lambda: _query_tecnologia(prompt), _respuesta_cacheable)
+    # Sin IA (error, sin conexión o fuera de presupuesto): recomendación local
+    return texto if _respuesta_cacheable(texto) else respuesta_local(red_meta, "tecnologia")
 
 def sugerencia_protocolo(red_meta: dict) -> str:
-    """Obtiene recomendación de seguridad"""
-    prompt = _crear_prompt_protocolo(red_meta)
-    return _query_Protocolo(prompt)
+    """Obtiene recomendación de seguridad (compartida por redes con el mismo perfil)"""
+    perfil = network_profile(red_meta)
+    prompt = _crear_prompt_protocolo(perfil)
+    texto = _response_cache.get_or_compute(_clave_cache("protocolo", perfil),
+                                           lambda: _query_Protocolo(prompt), _respuesta_cacheable)
+    return texto if _respuesta_cacheable(texto) else respuesta_local(red_meta, "protocolo")
+
+def stream_sugerencia(red_meta: dict, tipo: str = "tecnologia") -> Iterator[str]:
+    """
+    Sugerencia de la IA por fragmentos según llegan del modelo (SSE).
+    Si ya está en caché (o la está pidiendo otro hilo) se entrega entera de una vez.
+    Lanza ``LLMError`` si la IA no está disponible o corta la respuesta: quien
+    llama se queda entonces con ``respuesta_local``.
+    """
+    perfil = network_profile(red_meta)
+    clave = _clave_cache(tipo, perfil)
+    cached = _response_cache.get(clave)
+    if cached is not None:
+        yield cached
+        return
+    future, owner = _response_cache.claim(clave)
+    if not owner:
+        texto = future.result()
+        if not _respuesta_cacheable(texto):
+            raise LLMError(texto)
+        yield texto
+        return
+
+    partes = []
+    try:
+        if not OPENROUTER_URL:
+            raise LLMError("Error de conexión: OPENROUTER no configurado")
+        if tipo == "tecnologia":
+            prompt, modelo = _crear_prompt_tecnologia(perfil), MODELO_TECNOLOGIA
+        else:
+            prompt, modelo = _crear_prompt_protocolo(perfil), MODELO_PROTOCOLO
+        for fragmento in get_client().stream(prompt, preferred=modelo):
+            partes.append(fragmento)
+            yield fragmento
+    except LLMError as e:
+        # Los que esperan reciben el error (no se cachea)
+        _response_cache.resolve(clave, future, _texto_error(e), cacheable=lambda _: False)
+        raise
+    except BaseException:
+        # Consumidor que deja de leer (GeneratorExit) u otro fallo: quien espere recibe un error
+        _response_cache.resolve(clave, future, "Error: respuesta interrumpida", cacheable=lambda _: False)
+        raise
+    _response_cache.resolve(clave, future, "".join(partes).strip(), cacheable=_respuesta_cacheable)
+
+def prefetch_sugerencias(redes, tipos=("tecnologia", "protocolo"), max_workers: Optional[int] = None) -> int:
+    """
+    Precarga en paralelo las sugerencias de todas las redes visibles.
+    Cada perfil distinto se consulta una sola vez; devuelve cuántos se pidieron.
+    Por defecto deja libre un hueco del cliente para los clics del usuario.
+    """
+    if max_workers is None:
+        max_workers = max(1, get_client().max_concurrency - 1)
+    funciones = {"tecnologia": sugerencia_tecnologia, "protocolo": sugerencia_protocolo}
+    pendientes = {}
+    for red in redes:
+        perfil = network_profile(red)
+        for tipo in tipos:
+            clave = _clave_cache(tipo, perfil)
+            if clave not in pendientes and _response_cache.get(clave) is None:
+                pendientes[clave] = (funciones[tipo], red)
+    if pendientes:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda item: item[0](item[1]), pendientes.values()))
+    return len(pendientes)
 
 # ---------------- Prueba mejorada ----------------
 '''if __name__ == "__main__":
@@ -161,6 +258,6 @@ def sugerencia_protocolo(red_meta: dict) -> str:
     seg = sugerencia_protocolo(red_ejemplo)
     print(seg)
     
-    print(f"\n💾 Cache: {len(_cache)} entradas")'''
+    print(f"\n💾 Cache: {len(_response_cache)} entradas")'''
 
 #Fin
\ No newline at end of file
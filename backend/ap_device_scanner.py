@@ -228,6 +228,23 @@ def _get_vendor_from_mac(mac: str) -> str:
             return vendor.title()
     return "Fabricante Desconocido"
 
+def _resolve_vendors(devices: List[Dict]):
+    """Completa con una sola consulta por lote los fabricantes que VENDOR_DB no conoce."""
+    pending = [d['mac'] for d in devices
+               if d.get('vendor') in ("Fabricante Desconocido", "Desconocido")]
+    if not pending:
+        return
+    try:
+        from vendor_lookup import get_vendors
+        vendors = get_vendors(pending)
+    except Exception as e:
+        print(f"[DEBUG] Error resolviendo fabricantes: {e}")
+        return
+    for d in devices:
+        vendor = vendors.get(d['mac'])
+        if vendor and vendor != "Desconocido":
+            d['vendor'] = vendor
+
 # ----------------------------------------------------------------------
 # ESCANEO PARA LINUX - Versión mejorada
 # ----------------------------------------------------------------------
@@ -734,6 +751,7 @@ def get_connected_devices(red_info: Dict = None) -> Dict:
 
         active = _filter_active_devices(raw, red_info)
         _update_device_cache(active)
+        _resolve_vendors(active)
 
         max_d = red_info.get("router_max_devices", 50) if red_info else 50
         total = len(active)
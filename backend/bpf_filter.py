@@ -0,0 +1,164 @@
+"""
+bpf_filter.py – Compilación y enganche de filtros BPF clásicos en el kernel.
+
+``compile_bpf()`` traduce una expresión tipo tcpdump a instrucciones cBPF
+usando libpcap (ctypes) o, si no está, ``tcpdump -ddd``. Para las primitivas
+más comunes ("ip", "tcp", "udp"...) hay programas integrados, así el filtro
+funciona aunque no haya ninguna de las dos herramientas.
+
+El valor de ``ret`` de un programa cBPF es el número de bytes que el kernel
+copia, así que el snaplen se aplica reescribiendo esas instrucciones: la
+trama se trunca antes de llegar al anillo.
+"""
+
+import ctypes
+import ctypes.util
+import shutil
+import socket
+import struct
+import subprocess
+from typing import List, Optional, Tuple
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+LINKTYPE_ETHERNET = 1
+MAX_SNAPLEN = 262144
+
+# (code, jt, jf, k) de struct sock_filter
+Instruction = Tuple[int, int, int, int]
+
+_BPF_RET_K = 0x06
+_BPF_LDH_ABS = 0x28
+_BPF_LDB_ABS = 0x30
+_BPF_JEQ_K = 0x15
+
+_SOCK_FILTER = struct.Struct("HBBI")
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_ARP = 0x0806
+
+
+class _BpfInsn(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte),
+                ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint32)]
+
+
+class _BpfProgram(ctypes.Structure):
+    _fields_ = [("bf_len", ctypes.c_uint), ("bf_insns", ctypes.POINTER(_BpfInsn))]
+
+
+def _compile_libpcap(expr: str, snaplen: int, linktype: int) -> Optional[List[Instruction]]:
+    name = ctypes.util.find_library("pcap") or ctypes.util.find_library("wpcap")
+    if not name:
+        return None
+    try:
+        lib = ctypes.CDLL(name)
+    except OSError:
+        return None
+    prog = _BpfProgram()
+    rc = lib.pcap_compile_nopcap(ctypes.c_int(snaplen), ctypes.c_int(linktype), ctypes.byref(prog),
+                                 expr.encode("utf-8"), ctypes.c_int(1), ctypes.c_uint32(0xFFFFFFFF))
+    if rc != 0:
+        raise ValueError(f"Invalid BPF expression: {expr!r}")
+    try:
+        return [(i.code, i.jt, i.jf, i.k) for i in prog.bf_insns[:prog.bf_len]]
+    finally:
+        lib.pcap_freecode(ctypes.byref(prog))
+
+
+def _compile_tcpdump(expr: str, snaplen: int) -> Optional[List[Instruction]]:
+    tcpdump = shutil.which("tcpdump")
+    if not tcpdump:
+        return None
+    result = subprocess.run([tcpdump, "-ddd", "-s", str(snaplen), "-y", "EN10MB", expr],
+                            capture_output=True, text=True, timeout=10)
+    if result.returncode != 0:
+        raise ValueError(f"Invalid BPF expression: {expr!r}: {result.stderr.strip()}")
+    lines = result.stdout.split()
+    count = int(lines[0])
+    values = [int(v) for v in lines[1:]]
+    return [tuple(values[i * 4:i * 4 + 4]) for i in range(count)]
+
+
+def _program(steps, snaplen: int) -> List[Instruction]:
+    """Ensambla pasos con destinos absolutos ("ACCEPT"/"DROP" o índice) a cBPF."""
+    accept = len(steps)
+    drop = accept + 1
+    labels = {"ACCEPT": accept, "DROP": drop}
+    out = []
+    for i, (code, k, jt, jf) in enumerate(steps):
+        jt = labels.get(jt, jt) if jt is not None else i + 1
+        jf = labels.get(jf, jf) if jf is not None else i + 1
+        out.append((code, jt - i - 1, jf - i - 1, k))
+    out.append((_BPF_RET_K, 0, 0, snaplen))
+    out.append((_BPF_RET_K, 0, 0, 0))
+    return out
+
+
+def _builtin(expr: str, snaplen: int) -> Optional[List[Instruction]]:
+    expr = " ".join(expr.lower().split())
+    ethertypes = {"ip": ETH_P_IP, "ip6": ETH_P_IPV6, "arp": ETH_P_ARP}
+    if expr in ethertypes:
+        return _program([
+            (_BPF_LDH_ABS, 12, None, None),
+            (_BPF_JEQ_K, ethertypes[expr], "ACCEPT", "DROP"),
+        ], snaplen)
+
+    protos = {"tcp": 6, "udp": 17, "icmp": 1}
+    if expr in protos:
+        proto = protos[expr]
+        if expr == "icmp":
+            return _program([
+                (_BPF_LDH_ABS, 12, None, None),
+                (_BPF_JEQ_K, ETH_P_IP, None, "DROP"),
+                (_BPF_LDB_ABS, 23, None, None),
+                (_BPF_JEQ_K, proto, "ACCEPT", "DROP"),
+            ], snaplen)
+        return _program([
+            (_BPF_LDH_ABS, 12, None, None),
+            (_BPF_JEQ_K, ETH_P_IPV6, None, 4),
+            (_BPF_LDB_ABS, 20, None, None),
+            (_BPF_JEQ_K, proto, "ACCEPT", "DROP"),
+            (_BPF_JEQ_K, ETH_P_IP, None, "DROP"),
+            (_BPF_LDB_ABS, 23, None, None),
+            (_BPF_JEQ_K, proto, "ACCEPT", "DROP"),
+        ], snaplen)
+    return None
+
+
+def compile_bpf(expr: str, snaplen: int = MAX_SNAPLEN,
+                linktype: int = LINKTYPE_ETHERNET) -> List[Instruction]:
+    """Compila ``expr`` a cBPF; lanza ValueError si no es posible."""
+    snaplen = snaplen or MAX_SNAPLEN
+    program = _compile_libpcap(expr, snaplen, linktype)
+    if program is None:
+        program = _compile_tcpdump(expr, snaplen)
+    if program is None and linktype == LINKTYPE_ETHERNET:
+        program = _builtin(expr, snaplen)
+    if program is None:
+        raise ValueError(f"Cannot compile BPF {expr!r}: libpcap/tcpdump not found "
+                         "and the expression is not a built-in primitive")
+    return program
+
+
+def accept_all(snaplen: int = MAX_SNAPLEN) -> List[Instruction]:
+    return [(_BPF_RET_K, 0, 0, snaplen or MAX_SNAPLEN)]
+
+
+def apply_snaplen(program: List[Instruction], snaplen: int) -> List[Instruction]:
+    """Limita a ``snaplen`` los ``ret #k`` que aceptan paquetes."""
+    if not snaplen:
+        return program
+    return [(code, jt, jf, min(k, snaplen)) if code == _BPF_RET_K and k else (code, jt, jf, k)
+            for code, jt, jf, k in program]
+
+
+def attach_filter(sock: socket.socket, program: List[Instruction]):
+    """Engancha el programa al socket (SO_ATTACH_FILTER)."""
+    raw = b"".join(_SOCK_FILTER.pack(*insn) for insn in program)
+    buf = ctypes.create_string_buffer(raw, len(raw))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack("HL", len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
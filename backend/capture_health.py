@@ -0,0 +1,166 @@
+"""
+capture_health.py – Estado de salud del colector: tasas, pérdidas y latencias.
+
+``HealthMonitor`` muestrea ``collector.stats()`` cada ``interval`` segundos,
+calcula paquetes/bytes por segundo y pérdidas (kernel y colas de usuario)
+desde la muestra anterior, y publica el resultado:
+
+* en un fichero JSON (reemplazado de forma atómica, se puede leer en cualquier momento);
+* opcionalmente en ``http://127.0.0.1:<puerto>/stats`` para la monitorización
+  (más las rutas extra que se registren, p. ej. ``/top`` de la contabilidad).
+
+``LatencySampler`` guarda las últimas latencias de escritura de una etapa y
+devuelve sus percentiles.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_STATS_PORT = 47471      # puerto que espera NetGuard para el top de tráfico
+
+
+class LatencySampler:
+    """Ventana de las últimas ``maxlen`` latencias (segundos) de una etapa."""
+
+    def __init__(self, maxlen: int = 4096):
+        self._samples = deque(maxlen=maxlen)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentiles(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {}
+        last = len(samples) - 1
+        out = {f"p{p}": round(samples[min(last, int(last * p / 100 + 0.5))] * 1e3, 3) for p in PERCENTILES}
+        out["max"] = round(samples[-1] * 1e3, 3)
+        return out
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class HealthMonitor:
+    """Hilo que muestrea el colector y publica su estado en JSON (fichero y/o HTTP local)."""
+
+    def __init__(self, collector, path: Optional[str] = None, interval: float = 5.0,
+                 http_port: Optional[int] = None, http_host: str = "127.0.0.1",
+                 routes: Optional[Dict[str, Callable[[], dict]]] = None):
+        self.collector = collector
+        self.path = path
+        self.interval = float(interval)
+        self.http_port = http_port
+        self.http_host = http_host
+        self.routes = dict(routes or {})
+        self.latest: dict = {}
+        self._prev = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+        self._lock = threading.Lock()
+
+    def sample(self) -> dict:
+        stats = self.collector.stats()
+        now = time.monotonic()
+        dropped = sum(st.get("dropped_packets", 0) for st in stats.get("stages", {}).values())
+        kernel_drops = stats.get("kernel_drops") or 0
+        health = {
+            "time": time.time(),
+            "packets_per_s": 0.0,
+            "bytes_per_s": 0.0,
+            "kernel_drops_per_s": 0.0,
+            "queue_drops_per_s": 0.0,
+            "queue_depth": {name: st.get("depth", 0) for name, st in stats.get("stages", {}).items()},
+        }
+        if self._prev is not None:
+            prev_t, prev = self._prev
+            elapsed = max(now - prev_t, 1e-6)
+            health["packets_per_s"] = round((stats["packets_captured"] - prev["packets"]) / elapsed, 1)
+            health["bytes_per_s"] = round((stats["bytes_captured"] - prev["bytes"]) / elapsed, 1)
+            health["kernel_drops_per_s"] = round((kernel_drops - prev["kernel_drops"]) / elapsed, 1)
+            health["queue_drops_per_s"] = round((dropped - prev["queue_drops"]) / elapsed, 1)
+            if kernel_drops > prev["kernel_drops"] or dropped > prev["queue_drops"]:
+                logging.warning("Packet loss: %d kernel drops, %d queue drops in the last %.1fs",
+                                kernel_drops - prev["kernel_drops"], dropped - prev["queue_drops"], elapsed)
+        self._prev = (now, {"packets": stats["packets_captured"], "bytes": stats["bytes_captured"],
+                            "kernel_drops": kernel_drops, "queue_drops": dropped})
+        snapshot = dict(stats, health=health)
+        with self._lock:
+            self.latest = snapshot
+        if self.path:
+            try:
+                _write_json_atomic(self.path, snapshot)
+            except OSError as e:
+                logging.error("Cannot write stats file %s: %s", self.path, e)
+        return snapshot
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return self.latest
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                logging.exception("Stats sampling failed")
+
+    def _serve(self):
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path in ("/", "/stats"):
+                    data = monitor.snapshot()
+                elif path in monitor.routes:
+                    data = monitor.routes[path]()
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.http_host, self.http_port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info("Stats endpoint on http://%s:%d/stats", self.http_host, self._server.server_port)
+
+    def start(self):
+        self.sample()
+        if self.http_port is not None:
+            self._serve()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # Última muestra con los contadores finales
+        self.sample()
@@ -0,0 +1,183 @@
+"""
+capture_merge.py – Índice de fusión de segmentos pcap por worker.
+
+Cada colector (o cada worker del modo PACKET_FANOUT) anota al cerrar un pcap
+una línea en ``index_wNN.jsonl`` (o ``index.jsonl``) con el rango de tiempo y
+el número de paquetes del segmento; ``prune_index()`` quita las de los
+segmentos que borra la retención. Con esas líneas ``iter_merged()`` abre
+solo los segmentos que solapan la ventana pedida y mezcla los flujos de todos
+los workers en un único stream ordenado por tiempo.
+
+Uso:
+    python capture_merge.py captures/ --out merged.pcap [--start TS] [--end TS]
+"""
+
+import glob
+import heapq
+import json
+import os
+import struct
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from packet_decoder import iter_pcap, pcap_linktype, LINKTYPE_ETHERNET
+
+INDEX_PATTERN = "index*.jsonl"
+
+
+def index_path(out_dir: str, worker: Optional[int] = None) -> str:
+    name = "index.jsonl" if worker is None else f"index_w{worker:02d}.jsonl"
+    return os.path.join(out_dir, name)
+
+
+def append_index_entry(out_dir: str, worker: Optional[int], segment: str,
+                       first: Optional[float], last: Optional[float], packets: int):
+    """Añade la entrada de un segmento cerrado (un fichero por worker; el colector lo serializa con ``prune_index``)."""
+    if not packets:
+        return
+    entry = {"segment": segment, "worker": worker, "first": first, "last": last, "packets": packets}
+    with open(index_path(out_dir, worker), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def prune_index(out_dir: str, worker: Optional[int], keep: Callable[[str], bool]) -> int:
+    """
+    Reescribe el índice del worker sin las entradas cuyo segmento no pasa ``keep``
+    (segmentos ya borrados por la retención). Devuelve cuántas quitó.
+    """
+    path = index_path(out_dir, worker)
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return 0
+    kept = []
+    for line in lines:
+        try:
+            segment = json.loads(line)["segment"]
+        except (ValueError, KeyError, TypeError):
+            continue        # línea vacía o a medio escribir
+        if keep(segment):
+            kept.append(line if line.endswith("\n") else line + "\n")
+    removed = len(lines) - len(kept)
+    if removed:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+    return removed
+
+
+def load_merge_index(out_dir: str) -> List[dict]:
+    entries = []
+    for path in glob.glob(os.path.join(out_dir, INDEX_PATTERN)):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue   # última línea a medio escribir
+    entries.sort(key=lambda e: (e["first"], e["worker"] if e["worker"] is not None else -1))
+    return entries
+
+
+def _segment_pcap(out_dir: str, segment: str) -> Optional[str]:
+    # El pcap puede estar comprimido (.pcap.gz / .pcap.zst) o ya borrado por la retención
+    for path in glob.glob(os.path.join(out_dir, segment + ".pcap*")):
+        if not path.endswith(".tmp"):
+            return path
+    return None
+
+
+def _worker_stream(out_dir: str, entries: List[dict], start: Optional[float],
+                   end: Optional[float]) -> Iterator[Tuple[float, int, bytes, int]]:
+    for entry in entries:
+        path = _segment_pcap(out_dir, entry["segment"])
+        if path is None:
+            continue
+        _, frames = iter_pcap(path)
+        worker = entry["worker"]
+        for ts, wirelen, data in frames:
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts >= end:
+                break
+            yield ts, wirelen, data, worker
+
+
+def _select(out_dir: str, start: Optional[float],
+            end: Optional[float]) -> Dict[Optional[int], List[dict]]:
+    """Entradas del índice que solapan la ventana, agrupadas por worker."""
+    per_worker: Dict[Optional[int], List[dict]] = {}
+    for entry in load_merge_index(out_dir):
+        if start is not None and entry["last"] < start:
+            continue
+        if end is not None and entry["first"] >= end:
+            continue
+        per_worker.setdefault(entry["worker"], []).append(entry)
+    return per_worker
+
+
+def merged_linktype(out_dir: str, start: Optional[float] = None,
+                    end: Optional[float] = None) -> Optional[int]:
+    """Linktype común de los segmentos de la ventana (None si no hay ninguno)."""
+    linktypes = {}
+    for entries in _select(out_dir, start, end).values():
+        for entry in entries:
+            path = _segment_pcap(out_dir, entry["segment"])
+            if path is not None:
+                linktypes.setdefault(pcap_linktype(path), entry["segment"])
+    if len(linktypes) > 1:
+        detail = ", ".join(f"{lt} ({seg})" for lt, seg in sorted(linktypes.items()))
+        raise ValueError(f"Segments have different linktypes: {detail}")
+    return next(iter(linktypes), None)
+
+
+def iter_merged(out_dir: str, start: Optional[float] = None,
+                end: Optional[float] = None) -> Iterator[Tuple[float, int, bytes, int]]:
+    """Tramas ``(ts, wirelen, data, worker)`` de todos los workers en orden temporal."""
+    per_worker = _select(out_dir, start, end)
+    streams = [_worker_stream(out_dir, entries, start, end) for entries in per_worker.values()]
+    return heapq.merge(*streams, key=lambda frame: frame[0])
+
+
+def write_merged_pcap(out_dir: str, out_path: str, start: Optional[float] = None,
+                      end: Optional[float] = None, linktype: Optional[int] = None) -> int:
+    """
+    Escribe las tramas fusionadas en un pcap con el linktype de los segmentos.
+    Lanza ``ValueError`` si los segmentos no comparten linktype (o no coincide con ``linktype``).
+    """
+    found = merged_linktype(out_dir, start, end)
+    if linktype is None:
+        linktype = LINKTYPE_ETHERNET if found is None else found
+    elif found is not None and found != linktype:
+        raise ValueError(f"Segments use linktype {found}, not {linktype}")
+    count = 0
+    record = struct.Struct("<IIII")
+    with open(out_path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, linktype))
+        for ts, wirelen, data, _ in iter_merged(out_dir, start, end):
+            sec = int(ts)
+            usec = min(int(round((ts - sec) * 1e6)), 999999)
+            f.write(record.pack(sec, usec, len(data), max(wirelen, len(data))))
+            f.write(data)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fusiona los segmentos de todos los workers por tiempo")
+    parser.add_argument("out_dir", help="directorio de capturas")
+    parser.add_argument("--out", required=True, help="pcap de salida")
+    parser.add_argument("--start", type=float, help="epoch inicial (incluido)")
+    parser.add_argument("--end", type=float, help="epoch final (excluido)")
+    args = parser.parse_args()
+    try:
+        n = write_merged_pcap(args.out_dir, args.out, args.start, args.end)
+    except ValueError as e:
+        parser.exit(1, f"❌ {e}\n")
+    print(f"✅ {n} tramas fusionadas en {args.out}")
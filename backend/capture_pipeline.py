@@ -0,0 +1,142 @@
+"""
+capture_pipeline.py – Piezas del pipeline por etapas del colector.
+
+La captura entrega lotes de tramas (``FrameBatch``) a colas acotadas
+(``StageQueue``), una por etapa consumidora (pcap, metadatos...). Cada cola
+aplica una política explícita cuando se llena y lleva contadores de
+profundidad y descartes.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Optional, Tuple
+
+DROP_POLICIES = ("drop-newest", "drop-oldest", "block")
+
+
+class FrameBatch:
+    """Lote de tramas ``(ts, wirelen, data)`` compartido entre etapas.
+
+    Cada etapa llama a ``release()`` al terminar; si el lote viene del anillo
+    TPACKET el bloque vuelve al kernel cuando lo han liberado todas.
+    ``segment`` es el segmento al que pertenece (lo fija el colector al publicarlo).
+    """
+
+    __slots__ = ("frames", "linktype", "segment", "_block")
+
+    def __init__(self, frames: List[Tuple[float, int, Any]], linktype: int, block=None, segment=None):
+        self.frames = frames
+        self.linktype = linktype
+        self.segment = segment
+        self._block = block
+
+    def share(self, consumers: int):
+        if self._block is not None and consumers > 1:
+            self._block.retain(consumers - 1)
+
+    def release(self):
+        if self._block is not None:
+            self._block.release()
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class StageQueue:
+    """Cola acotada entre etapas con política de descarte y contadores."""
+
+    def __init__(self, name: str, maxsize: int = 32, policy: str = "drop-newest",
+                 on_drop: Optional[Callable[[Any], None]] = None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.on_drop = on_drop
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.dropped_packets = 0
+        self.high_water = 0
+
+    def put(self, item, timeout: Optional[float] = None) -> bool:
+        """Encola ``item``; devuelve False si la política lo descartó."""
+        evicted = None
+        with self._cond:
+            if self._closed:
+                self._count_drop(item)
+                evicted = item
+            elif len(self._items) >= self.maxsize:
+                if self.policy == "block":
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    if len(self._items) >= self.maxsize or self._closed:
+                        self._count_drop(item)
+                        evicted = item
+                elif self.policy == "drop-oldest":
+                    evicted = self._items.popleft()
+                    self._count_drop(evicted)
+                else:
+                    self._count_drop(item)
+                    evicted = item
+
+            if evicted is not item:
+                self._items.append(item)
+                self.enqueued += 1
+                self.high_water = max(self.high_water, len(self._items))
+                self._cond.notify_all()
+
+        if evicted is not None and self.on_drop:
+            self.on_drop(evicted)
+        return evicted is not item
+
+    def _count_drop(self, item):
+        self.dropped += 1
+        try:
+            self.dropped_packets += len(item)
+        except TypeError:
+            self.dropped_packets += 1
+
+    def get(self, timeout: Optional[float] = None):
+        """Siguiente elemento o None si vence el timeout o la cola está cerrada y vacía."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def drained(self) -> bool:
+        with self._cond:
+            return self._closed and not self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "dropped_batches": self.dropped,
+            "dropped_packets": self.dropped_packets,
+            "policy": self.policy,
+        }
@@ -5,79 +5,643 @@ import json
 import signal
 import argparse
 import logging
+import multiprocessing
+import struct
+import platform
+import queue
+import socket
+from collections import OrderedDict
 from datetime import datetime
 from threading import Thread, Event, Lock
-from scapy.all import sniff, PcapWriter, get_if_list
+from scapy.all import sniff, get_if_list
 from scapy.layers.inet import IP, TCP, UDP, ICMP
 from scapy.layers.l2 import Ether
 import psutil   # pip install psutil
+from capture_pipeline import FrameBatch, StageQueue, DROP_POLICIES
+from bpf_filter import compile_bpf, apply_snaplen, accept_all, MAX_SNAPLEN
+from capture_merge import append_index_entry, prune_index
+from capture_health import HealthMonitor, LatencySampler, DEFAULT_STATS_PORT
+from pretrigger import PacketRing, TriggerListener, DEFAULT_TRIGGER_PORT
+from service_attribution import AttributionSink, get_attribution_cache
+from traffic_accounting import AccountingSink, TrafficAccounting
+from segment_store import SegmentIndex, SegmentCompressor, CODECS, resolve_codec, segment_base
+from packet_decoder import decode_batch, parse_headers, format_ts, iter_pcap, flow_partition, LINKTYPE_ETHERNET, LINKTYPE_RAW
+
+# Motor de captura Linux por anillo mmap (opcional)
+try:
+    from tpacket_ring import TPacketV3Ring
+    TPACKET_AVAILABLE = platform.system() == "Linux"
+except ImportError:
+    TPacketV3Ring = None
+    TPACKET_AVAILABLE = False
+
+# Metadatos columnar (requiere numpy)
+try:
+    from meta_columnar import ColumnarMetaSink
+    COLUMNAR_AVAILABLE = True
+except ImportError:
+    ColumnarMetaSink = None
+    COLUMNAR_AVAILABLE = False
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 
+ENGINES = ("scapy", "tpacket", "replay")
+DEFAULT_PRETRIGGER_BYTES = 64 << 20
+META_FORMATS = ("jsonl", "columnar")
+
+
+class PcapRecordWriter:
+    """Escritor pcap mínimo: acepta bytes o memoryview sin convertirlos a objetos scapy."""
+
+    _GLOBAL_HDR = struct.Struct("<IHHiIII")
+    _RECORD_HDR = struct.Struct("<IIII")
+
+    def __init__(self, path, snaplen=262144, sync=False, buffering=1 << 20):
+        self.path = path
+        self.snaplen = snaplen
+        self.sync = sync
+        self._f = open(path, "wb", buffering=buffering)
+        self._header_written = False
+
+    def write(self, ts, wirelen, data, linktype=LINKTYPE_ETHERNET):
+        if not self._header_written:
+            self._f.write(self._GLOBAL_HDR.pack(0xA1B2C3D4, 2, 4, 0, 0, self.snaplen, linktype))
+            self._header_written = True
+        sec = int(ts)
+        usec = int(round((ts - sec) * 1e6))
+        if usec >= 1000000:
+            sec, usec = sec + 1, usec - 1000000
+        caplen = len(data)
+        self._f.write(self._RECORD_HDR.pack(sec, usec, caplen, max(wirelen, caplen)))
+        self._f.write(data)
+        if self.sync:
+            self._f.flush()
+
+    def flush(self):
+        self._f.flush()
+
+    def fsync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+class PcapSink:
+    """Etapa de escritura pcap: dueña de su fichero, escritura con buffer."""
+
+    name = "pcap"
+    compressible = True
+
+    def __init__(self, snaplen=0):
+        self.snaplen = snaplen or MAX_SNAPLEN
+        self._writer = None
+        self.path = None
+        self.records = 0
+        self._first = self._last = None
+        self._segment_packets = 0
+
+    def open(self, base):
+        self.path = base + ".pcap"
+        self._writer = PcapRecordWriter(self.path, snaplen=self.snaplen)
+        self._first = self._last = None
+        self._segment_packets = 0
+
+    def write(self, batch):
+        frames = batch.frames
+        if not frames:
+            return
+        write = self._writer.write
+        linktype = batch.linktype
+        for ts, wirelen, data in frames:
+            write(ts, wirelen, data, linktype)
+        if self._first is None:
+            self._first = frames[0][0]
+        self._last = frames[-1][0]
+        self.records += len(frames)
+        self._segment_packets += len(frames)
+
+    def segment_summary(self):
+        """(primer ts, último ts, paquetes) del segmento abierto, para el índice de fusión."""
+        return self._first, self._last, self._segment_packets
+
+    def sync(self):
+        if self._writer:
+            self._writer.fsync()
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+
+class JsonlMetaSink:
+    """Etapa de metadatos: decodifica el lote y escribe una línea JSON por paquete."""
+
+    name = "meta"
+    compressible = True
+
+    def __init__(self, iface):
+        self.iface = iface
+        self._f = None
+        self.path = None
+        self.records = 0
+
+    def open(self, base):
+        self.path = base + ".jsonl"
+        self._f = open(self.path, "a", encoding="utf-8", buffering=1 << 20)
+
+    def write(self, batch):
+        metas = decode_batch(batch.frames, self.iface, batch.linktype)
+        if metas:
+            self._f.write("\n".join(json.dumps(m, default=str) for m in metas) + "\n")
+            self.records += len(metas)
+
+    def sync(self):
+        if self._f:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+
+class _Flow:
+    __slots__ = ("key", "first", "last", "packets", "bytes", "rpackets", "rbytes",
+                 "tcp_flags", "fin_fwd", "fin_rev")
+
+    def __init__(self, key, ts):
+        self.key = key
+        self.first = self.last = ts
+        self.packets = self.bytes = self.rpackets = self.rbytes = 0
+        self.tcp_flags = 0
+        self.fin_fwd = self.fin_rev = False
+
+
+class FlowTable:
+    """Tabla de flujos por 5-tupla con timeouts y tope duro de entradas (expulsión LRU).
+
+    La clave se orienta según el primer paquete visto; el tráfico de vuelta se
+    acumula en los contadores ``r*`` del mismo flujo.
+    """
+
+    def __init__(self, max_flows=100000, idle_timeout=60.0, active_timeout=1800.0):
+        self.max_flows = int(max_flows)
+        self.idle_timeout = float(idle_timeout)
+        self.active_timeout = float(active_timeout)
+        self._flows = OrderedDict()
+
+        self.exported = 0
+        self.evicted = 0
+        self.non_ip = 0
+
+    def __len__(self):
+        return len(self._flows)
+
+    def update(self, ts, wirelen, headers, export):
+        _, _, version, src_ip, dst_ip, proto, _, sport, dport, tcp_flags = headers
+        if not version:
+            self.non_ip += 1
+            return
+        flows = self._flows
+        sport = sport or 0
+        dport = dport or 0
+        key = (proto, src_ip, sport, dst_ip, dport)
+        flow = flows.get(key)
+        forward = True
+        if flow is None:
+            flow = flows.get((proto, dst_ip, dport, src_ip, sport))
+            forward = False
+        if flow is None:
+            flow = _Flow(key, ts)
+            flows[key] = flow
+            forward = True
+            if len(flows) > self.max_flows:
+                _, oldest = flows.popitem(last=False)
+                self.evicted += 1
+                self._export(oldest, "evicted", export)
+        else:
+            flows.move_to_end(flow.key)
+            if ts - flow.first >= self.active_timeout:
+                # Flujo largo: se exporta el tramo y se reinician los contadores
+                self._export(flow, "active", export)
+                flow = _Flow(flow.key, ts)
+                flows[flow.key] = flow
+
+        if forward:
+            flow.packets += 1
+            flow.bytes += wirelen
+        else:
+            flow.rpackets += 1
+            flow.rbytes += wirelen
+        flow.last = max(flow.last, ts)
+
+        if tcp_flags:
+            flow.tcp_flags |= tcp_flags
+            if tcp_flags & TCP_FIN:
+                if forward:
+                    flow.fin_fwd = True
+                else:
+                    flow.fin_rev = True
+            if tcp_flags & TCP_RST or (flow.fin_fwd and flow.fin_rev):
+                del flows[flow.key]
+                self._export(flow, "tcp-end", export)
+
+    def expire(self, now, export):
+        """Exporta los flujos inactivos; el orden LRU permite parar en el primero vivo."""
+        flows = self._flows
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now - flow.last < self.idle_timeout:
+                break
+            del flows[key]
+            self._export(flow, "idle", export)
+
+    def flush(self, export):
+        while self._flows:
+            _, flow = self._flows.popitem(last=False)
+            self._export(flow, "shutdown", export)
+
+    def _export(self, flow, reason, export):
+        self.exported += 1
+        export(flow, reason)
+
+    def stats(self):
+        return {
+            "active": len(self._flows),
+            "max_flows": self.max_flows,
+            "exported": self.exported,
+            "evicted": self.evicted,
+            "non_ip": self.non_ip,
+        }
+
+
+class FlowSink:
+    """Etapa de flujos: agrega paquetes en FlowTable y escribe un registro por flujo cerrado."""
+
+    name = "flows"
+    compressible = True
+
+    def __init__(self, table):
+        self.table = table
+        self._f = None
+        self.path = None
+        self._backlog = []
+        self.records = 0
+
+    def open(self, base):
+        self.path = base + ".flows.jsonl"
+        self._f = open(self.path, "a", encoding="utf-8", buffering=1 << 16)
+        self._drain_backlog()
+
+    def _export(self, flow, reason):
+        proto, src_ip, sport, dst_ip, dport = flow.key
+        family = socket.AF_INET if len(src_ip) == 4 else socket.AF_INET6
+        record = {
+            "first": format_ts(flow.first),
+            "last": format_ts(flow.last),
+            "proto": proto,
+            "src_ip": socket.inet_ntop(family, src_ip),
+            "src_port": sport,
+            "dst_ip": socket.inet_ntop(family, dst_ip),
+            "dst_port": dport,
+            "pkts": flow.packets,
+            "bytes": flow.bytes,
+            "rpkts": flow.rpackets,
+            "rbytes": flow.rbytes,
+            "tcp_flags": flow.tcp_flags,
+            "end": reason,
+        }
+        line = json.dumps(record, separators=(",", ":"))
+        if self._f:
+            self._f.write(line + "\n")
+        else:
+            self._backlog.append(line)
+        self.records += 1
+
+    def _drain_backlog(self):
+        if self._backlog and self._f:
+            self._f.write("\n".join(self._backlog) + "\n")
+            self._backlog = []
+
+    def write(self, batch):
+        update = self.table.update
+        linktype = batch.linktype
+        last_ts = None
+        for ts, wirelen, data in batch.frames:
+            update(ts, wirelen, parse_headers(data, linktype), self._export)
+            last_ts = ts
+        if last_ts is not None:
+            self.table.expire(last_ts, self._export)
+
+    def tick(self, now):
+        self.table.expire(now, self._export)
+
+    def finish(self):
+        self.table.flush(self._export)
+
+    def sync(self):
+        if self._f:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+
+class PreTriggerSink:
+    """Etapa pre-disparo: mantiene los últimos paquetes en memoria y solo escribe al dispararse.
+
+    Tras un disparo sigue acumulando ``post_seconds`` de cola y después vuelca
+    la ventana completa a ``trigger_<ts>.pcap``. Los disparos que llegan
+    mientras se espera la cola se agrupan en el mismo volcado.
+    """
+
+    name = "ring"
+    compressible = False
+
+    def __init__(self, ring, out_dir, post_seconds=5.0, snaplen=0, prefix="trigger_", pre_seconds=0.0):
+        self.ring = ring
+        self.out_dir = out_dir
+        self.pre_seconds = float(pre_seconds or 0.0)
+        self.post_seconds = float(post_seconds)
+        self.snaplen = snaplen or MAX_SNAPLEN
+        self.prefix = prefix
+        self.path = None
+        self.records = 0
+        self.dumps = 0
+        self._linktype = LINKTYPE_ETHERNET
+        self._last_ts = None
+        self._dumped_until = None
+        self._pending = None
+        self._lock = Lock()
+        self._dump_threads = []
+
+    def open(self, base):
+        pass    # sin fichero por segmento
+
+    def trigger(self, reason=""):
+        with self._lock:
+            if self._pending is not None:
+                self._pending[1].append(reason)
+                return
+            now = time.time()
+            if self._last_ts is not None and abs(now - self._last_ts) > 60:
+                now = self._last_ts     # replay: reloj de los paquetes grabados
+            self._pending = (now, [reason])
+        logging.info("Capture trigger (%s): dumping in %.1fs", reason or "api", self.post_seconds)
+
+    def write(self, batch):
+        append = self.ring.append
+        for ts, wirelen, data in batch.frames:
+            append(ts, wirelen, data)
+        if batch.frames:
+            self._linktype = batch.linktype
+            self._last_ts = batch.frames[-1][0]
+            self.records += len(batch.frames)
+            self._check(self._last_ts)
+
+    def tick(self, now):
+        self._check(now)
+
+    def _check(self, now, force=False):
+        with self._lock:
+            if self._pending is None or (not force and now < self._pending[0] + self.post_seconds):
+                return
+            triggered_at, reasons = self._pending
+            self._pending = None
+        since = self._dumped_until
+        if self.pre_seconds:
+            since = max(since or 0.0, triggered_at - self.pre_seconds)
+        frames = self.ring.snapshot(since=since)
+        if not frames:
+            return
+        self._dumped_until = frames[-1][0]
+        t = Thread(target=self._dump, args=(frames, self._linktype, triggered_at, reasons), daemon=True)
+        self._dump_threads.append(t)
+        t.start()
+
+    def _dump(self, frames, linktype, triggered_at, reasons):
+        stamp = datetime.utcfromtimestamp(triggered_at).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.out_dir, f"{self.prefix}{stamp}_{self.dumps:04d}.pcap")
+        self.dumps += 1
+        writer = PcapRecordWriter(path, snaplen=self.snaplen)
+        try:
+            for ts, wirelen, data in frames:
+                writer.write(ts, wirelen, data, linktype)
+        finally:
+            writer.close()
+        logging.info("Trigger dump %s: %d packets, %.1fs before / %.1fs after (%s)",
+                     path, len(frames), triggered_at - frames[0][0], frames[-1][0] - triggered_at,
+                     ", ".join(r for r in reasons if r) or "api")
+
+    def finish(self):
+        # Parada con un disparo pendiente: se vuelca lo que haya de cola
+        self._check(0.0, force=True)
+        for t in self._dump_threads:
+            t.join(timeout=30)
+
+    def stats(self):
+        return {"packets": len(self.ring), "bytes": self.ring.bytes_used, "capacity": self.ring.capacity,
+                "overwritten": self.ring.overwritten, "dumps": self.dumps}
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
 
 class WindowsPacketCollector:
-    def __init__(self, iface, out_dir="captures", rotate_seconds=300, max_files=48, metadata=True):
+    def __init__(self, iface, out_dir="captures", rotate_seconds=300, max_files=48, metadata=True,
+                 engine="scapy", queue_size=32, drop_policy="drop-newest", fsync_seconds=5.0,
+                 batch_size=128, meta_format="jsonl", pcap=True, flows=False, flow_max=100000,
+                 flow_idle_timeout=60.0, flow_active_timeout=1800.0, rotate_bytes=0, compress="none",
+                 compress_level=None, bpf="ip", snaplen=0, worker_id=None, fanout_group=None,
+                 replay_files=None, replay_speed=0.0, replay_partition=None, pretrigger_bytes=0,
+                 pretrigger_seconds=0.0, post_trigger_seconds=5.0, trigger_port=None, trigger_file=None,
+                 attribution=False, accounting=False):
         self.iface = iface
         self.out_dir = out_dir
         self.rotate_seconds = int(rotate_seconds)
+        self.rotate_bytes = int(rotate_bytes)
         self.max_files = int(max_files)
         self.metadata_enabled = metadata
+        self.worker_id = worker_id
+        self.fanout_group = fanout_group
+        self.bpf = bpf or None
+        self.snaplen = int(snaplen or 0)
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        if engine == "tpacket" and not TPACKET_AVAILABLE:
+            raise RuntimeError("tpacket engine requires Linux (AF_PACKET + PACKET_RX_RING)")
+        self.engine = engine
+        if engine == "replay" and not replay_files:
+            raise ValueError("replay engine needs at least one pcap file")
+        self.replay_files = list(replay_files or [])
+        self.replay_speed = float(replay_speed or 0.0)
+        # (índice, total): este worker solo procesa los flujos cuyo hash cae en su partición
+        self.replay_partition = replay_partition
+        if drop_policy is None:
+            # En replay no se pierde nada: la lectura espera a las etapas
+            drop_policy = "block" if engine == "replay" else "drop-newest"
+        if meta_format not in META_FORMATS:
+            raise ValueError(f"Unknown metadata format: {meta_format}")
+        if meta_format == "columnar" and not COLUMNAR_AVAILABLE:
+            raise RuntimeError("columnar metadata requires numpy")
+        self.meta_format = meta_format
+        self.queue_size = int(queue_size)
+        self.drop_policy = drop_policy
+        self.fsync_seconds = float(fsync_seconds)
+        self.batch_size = int(batch_size)
+        self.batch_max_delay = 0.05
 
         os.makedirs(self.out_dir, exist_ok=True)
 
+        # Índice de segmentos en memoria y compresión fuera del proceso de captura
+        self.segment_prefix = "capture_" if worker_id is None else f"capture_w{worker_id:02d}_"
+        self.segment_index = SegmentIndex(self.out_dir, self.segment_prefix)
+        self.segment_index.rebuild()
+        # Índice de fusión: sin las entradas de segmentos que ya no están en disco
+        self._index_lock = Lock()
+        existing = set(self.segment_index.segments())
+        prune_index(self.out_dir, self.worker_id, lambda segment: segment in existing)
+        codec = resolve_codec(compress)
+        self._compressor = SegmentCompressor(codec, compress_level, self._on_compressed) if codec else None
+
         self._stop_event = Event()
-        self._pcap_writer = None
-        self._meta_f = None
+        self._rotate_now = Event()
         self._file_start = 0
+        self._segment_bytes = 0
+        self._segment = None
+        self._publish_lock = Lock()     # orden común de lotes y cambios de segmento en todas las colas
+        self._stage_segments = {}       # etapa → segmento que tiene abierto (None al terminar)
+        self._retention_lock = Lock()
         self._rotation_thread = None
         self._sniff_thread = None
-        self._lock = Lock()
+        self._stage_threads = []
+        self._ring = None
+
+        # Etapas: cada una con su cola acotada y su propio fichero
+        self._sinks = []
+        if pcap:
+            self._sinks.append(PcapSink(self.snaplen))
+        if self.metadata_enabled:
+            meta_sink = ColumnarMetaSink if self.meta_format == "columnar" else JsonlMetaSink
+            self._sinks.append(meta_sink(self.iface))
+        self.flow_table = None
+        if flows:
+            self.flow_table = FlowTable(flow_max, flow_idle_timeout, flow_active_timeout)
+            self._sinks.append(FlowSink(self.flow_table))
+        self.attribution = None
+        if attribution:
+            self.attribution = AttributionSink(get_attribution_cache())
+            if not accounting:
+                self._sinks.append(self.attribution)
+        self.accounting = None
+        if accounting:
+            # Atribución y contabilidad encadenadas en una sola etapa (ver AccountingSink)
+            self.accounting = TrafficAccounting()
+            self._sinks.append(AccountingSink(self.accounting, self.attribution))
+        self.pretrigger = None
+        self._trigger_listener = None
+        if pretrigger_bytes or pretrigger_seconds:
+            # El anillo cubre también la cola posterior al disparo
+            window = pretrigger_seconds + post_trigger_seconds if pretrigger_seconds else 0.0
+            ring = PacketRing(pretrigger_bytes or DEFAULT_PRETRIGGER_BYTES, window)
+            prefix = "trigger_" if worker_id is None else f"trigger_w{worker_id:02d}_"
+            self.pretrigger = PreTriggerSink(ring, self.out_dir, post_trigger_seconds, self.snaplen, prefix,
+                                             pretrigger_seconds)
+            self._sinks.append(self.pretrigger)
+            if trigger_port is not None or trigger_file:
+                self._trigger_listener = TriggerListener(self.trigger, trigger_port, trigger_file)
+        if not self._sinks:
+            raise ValueError("Nothing to write: enable pcap, metadata, flows or the pre-trigger ring")
+        self._queues = [
+            StageQueue(sink.name, self.queue_size, self.drop_policy, on_drop=FrameBatch.release)
+            for sink in self._sinks
+        ]
+
+        # Lote en construcción del motor scapy
+        self._pending = []
+        self._pending_linktype = LINKTYPE_ETHERNET
+        self._pending_bytes = 0
+        self._pending_since = 0.0
+        self._pending_lock = Lock()
+
+        # Contadores de captura
+        self.packets_captured = 0
+        self.bytes_captured = 0
+        self.fsyncs = 0
+        self.capture_busy = 0.0
+        self.stage_busy = {sink.name: 0.0 for sink in self._sinks}
+        self.stage_latency = {sink.name: LatencySampler() for sink in self._sinks}
 
     def _timestamp_str(self):
         return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 
-    def _open_new_files(self):
-        with self._lock:
-            self._close_files()
-            ts = self._timestamp_str()
-            base = f"capture_{ts}"
-            pcap_path = os.path.join(self.out_dir, f"{base}.pcap")
-            meta_path = os.path.join(self.out_dir, f"{base}.jsonl")
-
-            logging.info("Creating pcap: %s", pcap_path)
-            self._pcap_writer = PcapWriter(pcap_path, append=False, sync=True)
-            if self.metadata_enabled:
-                self._meta_f = open(meta_path, "a", encoding="utf-8")
-            self._file_start = time.time()
-            self._enforce_max_files()
+    def _rotate(self):
+        """Anuncia un segmento nuevo; cada etapa cambia su propio fichero sin bloquear la captura."""
+        with self._publish_lock:
+            self._rotate_locked()
 
-    def _close_files(self):
-        try:
-            if self._pcap_writer:
-                self._pcap_writer.close()
-                self._pcap_writer = None
-        except Exception:
-            logging.exception("Error closing pcap writer")
-        try:
-            if self._meta_f:
-                self._meta_f.close()
-                self._meta_f = None
-        except Exception:
-            logging.exception("Error closing metadata file")
+    def _rotate_locked(self):
+        seq = self._segment[0] + 1 if self._segment else 0
+        name = f"{self.segment_prefix}{self._timestamp_str()}_{seq:04d}"
+        base = os.path.join(self.out_dir, name)
+        logging.info("Creating segment: %s", base)
+        self.segment_index.add_segment(name)
+        self._segment = (seq, base)
+        self._file_start = time.time()
+        self._segment_bytes = 0
+        self._rotate_now.clear()
 
     def _enforce_max_files(self):
-        files = sorted([f for f in os.listdir(self.out_dir) if f.startswith("capture_")])
-        if len(files) > self.max_files * 2:
-            to_remove = len(files) - (self.max_files * 2)
-            logging.info("Pruning %d old files", to_remove)
-            for i in range(to_remove):
-                fpath = os.path.join(self.out_dir, files[i])
-                try:
-                    os.remove(fpath)
-                except Exception:
-                    logging.exception("Removing old file failed: %s", fpath)
+        # Solo se borran segmentos que ya cerraron todas las etapas: la retención se
+        # detiene en el más antiguo que alguna etapa aún tiene abierto
+        with self._retention_lock:
+            open_segments = [seg for seg in self._stage_segments.values() if seg is not None]
+            stop_at = os.path.basename(min(open_segments)[1]) if open_segments else None
+            removed = self.segment_index.enforce(self.max_files, stop_at)
+        if removed:
+            gone = set(removed)
+            with self._index_lock:
+                prune_index(self.out_dir, self.worker_id, lambda segment: segment not in gone)
+            logging.info("Pruned %d old segments", len(removed))
+
+    def _open_segment_file(self, sink, segment):
+        sink.open(segment[1])
+        if sink.path:
+            name = os.path.basename(sink.path)
+            self.segment_index.add_file(segment_base(name), name)
+
+    def _close_segment_file(self, sink):
+        path = getattr(sink, "path", None)
+        if path and hasattr(sink, "segment_summary"):
+            first, last, packets = sink.segment_summary()
+            with self._index_lock:
+                append_index_entry(self.out_dir, self.worker_id, segment_base(os.path.basename(path)),
+                                   first, last, packets)
+        sink.close()
+        sink.path = None
+        if path and self._compressor and sink.compressible and os.path.exists(path):
+            self._compressor.submit(path)
+
+    def _on_compressed(self, path, target):
+        name = os.path.basename(path)
+        self.segment_index.replace_file(segment_base(name), name, os.path.basename(target))
 
     def _extract_meta_ip(self, pkt):
+        # Referencia basada en scapy; el colector usa packet_decoder (ver su benchmark)
         meta = {}
         try:
             meta["ts"] = datetime.utcfromtimestamp(pkt.time).isoformat() + "Z"
@@ -116,27 +680,112 @@ class WindowsPacketCollector:
             logging.exception("Failed to extract meta")
             return meta
 
+    def _publish(self, batch, nbytes):
+        # El lote lleva su segmento: todas las etapas cortan sus ficheros en el mismo lote
+        with self._publish_lock:
+            batch.segment = self._segment
+            batch.share(len(self._queues))
+            for q in self._queues:
+                q.put(batch)
+            # Los bytes cuentan para el segmento del lote; al pasar el límite se rota ya
+            self.bytes_captured += nbytes
+            self._segment_bytes += nbytes
+            if self.rotate_bytes and self._segment_bytes >= self.rotate_bytes:
+                self._rotate_locked()
+
     def _handle_pkt(self, pkt):
-        with self._lock:
-            try:
-                if self._pcap_writer:
-                    self._pcap_writer.write(pkt)
-            except Exception:
-                logging.exception("Error writing packet to pcap")
-
-            if self.metadata_enabled:
-                try:
-                    meta = self._extract_meta_ip(pkt)
-                    self._meta_f.write(json.dumps(meta, default=str) + "\n")
-                except Exception:
-                    logging.exception("Error writing metadata")
+        raw = getattr(pkt, "original", None) or bytes(pkt)
+        linktype = LINKTYPE_ETHERNET if isinstance(pkt, Ether) else LINKTYPE_RAW
+        wirelen = getattr(pkt, "wirelen", None) or len(raw)
+        if self.snaplen and len(raw) > self.snaplen:
+            # scapy no trunca en el kernel: se recorta aquí antes de las etapas
+            raw = raw[:self.snaplen]
+        frame = (float(pkt.time), wirelen, raw)
+        self.packets_captured += 1
+
+        with self._pending_lock:
+            if self._pending and linktype != self._pending_linktype:
+                self._flush_pending_locked()
+            if not self._pending:
+                self._pending_since = time.monotonic()
+                self._pending_linktype = linktype
+            self._pending.append(frame)
+            self._pending_bytes += len(raw)
+            if len(self._pending) >= self.batch_size:
+                self._flush_pending_locked()
+
+    def _flush_pending_locked(self):
+        if self._pending:
+            batch = FrameBatch(self._pending, self._pending_linktype)
+            nbytes = self._pending_bytes
+            self._pending = []
+            self._pending_bytes = 0
+            self._publish(batch, nbytes)
+
+    def _flush_pending(self, max_age=0.0):
+        with self._pending_lock:
+            if self._pending and time.monotonic() - self._pending_since >= max_age:
+                self._flush_pending_locked()
+
+    def _handle_block(self, block):
+        # Vistas del anillo: se pasan a las etapas sin copiar
+        self.packets_captured += len(block.frames)
+        self._publish(FrameBatch(block.frames, LINKTYPE_ETHERNET, block),
+                      sum(len(frame) for _, _, frame in block.frames))
+
+    def _stage_worker(self, sink, queue):
+        segment = None
+        last_sync = time.monotonic()
+        try:
+            while True:
+                # Leído antes de la cola: si vuelve vacía, ningún lote de un segmento
+                # anterior queda por llegar (_rotate y _publish comparten el lock)
+                current = self._segment
+                batch = queue.get(timeout=0.5)
+                target = batch.segment if batch is not None else current
+                if target is not None and (segment is None or target[0] > segment[0]):
+                    self._close_segment_file(sink)
+                    self._open_segment_file(sink, target)
+                    segment = target
+                    self._stage_segments[sink.name] = segment
+                    self._enforce_max_files()
+                if batch is None:
+                    if queue.drained:
+                        break
+                    if hasattr(sink, "tick"):
+                        sink.tick(time.time())
+                else:
+                    t0 = time.perf_counter()
+                    try:
+                        sink.write(batch)
+                    except Exception:
+                        logging.exception("Error in %s stage", sink.name)
+                    finally:
+                        batch.release()
+                    spent = time.perf_counter() - t0
+                    self.stage_busy[sink.name] += spent
+                    self.stage_latency[sink.name].add(spent)
+
+                if self.fsync_seconds and time.monotonic() - last_sync >= self.fsync_seconds:
+                    sink.sync()
+                    self.fsyncs += 1
+                    last_sync = time.monotonic()
+            if hasattr(sink, "finish"):
+                sink.finish()
+        finally:
+            self._close_segment_file(sink)
+            self._stage_segments[sink.name] = None
+            self._enforce_max_files()
 
     def _rotation_worker(self):
+        # Rota por tiempo o por tamaño (lo que llegue antes)
         while not self._stop_event.is_set():
             elapsed = time.time() - self._file_start if self._file_start else None
-            if (elapsed is None) or (elapsed >= self.rotate_seconds):
-                self._open_new_files()
-            time.sleep(1)
+            if (elapsed is None) or (elapsed >= self.rotate_seconds) or self._rotate_now.is_set():
+                self._rotate()
+            # Vacía los lotes scapy aunque no llegue tráfico
+            self._flush_pending(self.batch_max_delay)
+            self._rotate_now.wait(self.batch_max_delay)
 
     def _sniff_worker(self):
         logging.info("Sniffing on iface %s ...", self.iface)
@@ -146,32 +795,312 @@ class WindowsPacketCollector:
                 iface=self.iface,
                 prn=self._handle_pkt,
                 store=False,
-                filter="ip",  # asegura solo tráfico IP
+                filter=self.bpf,  # por defecto "ip": solo tráfico IP
                 stop_filter=lambda x: self._stop_event.is_set()
             )
         except Exception as e:
             logging.exception("Sniffer error: %s", e)
             self.stop()
 
+    def _kernel_filter(self):
+        """Programa cBPF para el anillo: filtro + truncado a snaplen en el kernel."""
+        if self.bpf:
+            return apply_snaplen(compile_bpf(self.bpf, self.snaplen or MAX_SNAPLEN), self.snaplen)
+        if self.snaplen:
+            return accept_all(self.snaplen)
+        return None
+
+    def _ring_worker(self):
+        logging.info("Capturing on iface %s with TPACKET_V3 ring ...", self.iface)
+        try:
+            with TPacketV3Ring(self.iface, bpf_program=self._kernel_filter(),
+                               fanout_group=self.fanout_group) as ring:
+                self._ring = ring
+                while not self._stop_event.is_set():
+                    block = ring.next_block(timeout=0.5)
+                    if block is None:
+                        continue
+                    self._handle_block(block)
+        except Exception as e:
+            logging.exception("Ring capture error: %s", e)
+            self._stop_event.set()
+
+    def _replay_worker(self):
+        logging.info("Replaying %d pcap file(s) ...", len(self.replay_files))
+        try:
+            for path in self.replay_files:
+                if self._stop_event.is_set():
+                    break
+                self._replay_file(path)
+        except Exception as e:
+            logging.exception("Replay error: %s", e)
+        finally:
+            self._stop_event.set()
+
+    def _replay_file(self, path):
+        linktype, frames = iter_pcap(path)
+        partition = self.replay_partition
+        snaplen = self.snaplen
+        batch = []
+        batch_bytes = 0
+        read_t0 = time.perf_counter()
+        pace_start = first_ts = None
+        for ts, wirelen, data in frames:
+            if partition is not None and flow_partition(data, linktype, partition[1]) != partition[0]:
+                continue
+            if snaplen and len(data) > snaplen:
+                data = data[:snaplen]
+            if self.replay_speed:
+                # Ritmo grabado (o acelerado): espera hasta el instante relativo del paquete
+                if first_ts is None:
+                    first_ts, pace_start = ts, time.monotonic()
+                delay = (ts - first_ts) / self.replay_speed - (time.monotonic() - pace_start)
+                if delay > 0:
+                    time.sleep(delay)
+            batch.append((ts, wirelen, data))
+            batch_bytes += len(data)
+            if len(batch) >= self.batch_size:
+                self.packets_captured += len(batch)
+                self.capture_busy += time.perf_counter() - read_t0
+                self._publish(FrameBatch(batch, linktype), batch_bytes)
+                batch = []
+                batch_bytes = 0
+                read_t0 = time.perf_counter()
+                if self._stop_event.is_set():
+                    return
+        if batch:
+            self.packets_captured += len(batch)
+            self.capture_busy += time.perf_counter() - read_t0
+            self._publish(FrameBatch(batch, linktype), batch_bytes)
+
+    def trigger(self, reason=""):
+        """Vuelca la ventana pre-disparo (más la cola posterior) a un pcap."""
+        if self.pretrigger is None:
+            raise RuntimeError("pre-trigger ring is not enabled")
+        self.pretrigger.trigger(reason)
+
+    def kernel_drops(self):
+        if self._ring is not None and self._ring._sock is not None:
+            try:
+                self._ring.read_stats()
+            except OSError:
+                pass
+        return self._ring.kernel_drops if self._ring is not None else None
+
+    def stats(self):
+        stats = {
+            "engine": self.engine,
+            "worker": self.worker_id,
+            "packets_captured": self.packets_captured,
+            "bytes_captured": self.bytes_captured,
+            "kernel_drops": self.kernel_drops(),
+            "fsyncs": self.fsyncs,
+            "segments": len(self.segment_index),
+            "segments_removed": self.segment_index.removed,
+            "compressed": self._compressor.compressed if self._compressor else 0,
+            "compress_pending": self._compressor.pending if self._compressor else 0,
+            "capture_busy_s": round(self.capture_busy, 6),
+            "stages": {
+                sink.name: dict(q.stats(), records=sink.records, busy_s=round(self.stage_busy[sink.name], 6),
+                                write_latency_ms=self.stage_latency[sink.name].percentiles())
+                for sink, q in zip(self._sinks, self._queues)
+            },
+        }
+        if self.flow_table is not None:
+            stats["flows"] = self.flow_table.stats()
+        if self.pretrigger is not None:
+            stats["pretrigger"] = self.pretrigger.stats()
+        if self.attribution is not None:
+            stats["attribution"] = self.attribution.stats()
+        if self.accounting is not None:
+            stats["accounting"] = self.accounting.snapshot()
+        return stats
+
+    def cpu_time(self):
+        return time.process_time()
+
+    def is_running(self):
+        return not self._stop_event.is_set()
+
     def start(self):
-        self._open_new_files()
+        self._rotate()
+        self._stage_segments = {sink.name: self._segment for sink in self._sinks}
+        self._enforce_max_files()
         self._stop_event.clear()
+        self._stage_threads = [
+            Thread(target=self._stage_worker, args=(sink, q), daemon=True)
+            for sink, q in zip(self._sinks, self._queues)
+        ]
+        for t in self._stage_threads:
+            t.start()
         self._rotation_thread = Thread(target=self._rotation_worker, daemon=True)
         self._rotation_thread.start()
-        self._sniff_thread = Thread(target=self._sniff_worker, daemon=True)
+        targets = {"tpacket": self._ring_worker, "replay": self._replay_worker, "scapy": self._sniff_worker}
+        self._sniff_thread = Thread(target=targets[self.engine], daemon=True)
         self._sniff_thread.start()
+        if self._trigger_listener:
+            self._trigger_listener.start()
 
     def stop(self):
         logging.info("Stopping collector...")
+        self.kernel_drops()
         self._stop_event.set()
+        if self._trigger_listener:
+            self._trigger_listener.stop()
         if self._sniff_thread:
             self._sniff_thread.join(timeout=5)
         if self._rotation_thread:
             self._rotation_thread.join(timeout=2)
-        self._close_files()
+        self._flush_pending()
+        # Las etapas vacían sus colas antes de cerrar ficheros
+        for q in self._queues:
+            q.close()
+        for t in self._stage_threads:
+            t.join(timeout=10)
+        if self._compressor:
+            self._compressor.shutdown(wait=True)
         logging.info("Collector stopped.")
 
 
+def _fanout_worker_main(worker_id, kwargs, stop_event, stats_queue):
+    """Proceso worker: su propia partición de tráfico y su propio pipeline."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    collector = WindowsPacketCollector(worker_id=worker_id, **kwargs)
+    cpu0 = time.process_time()
+    collector.start()
+    try:
+        while not stop_event.wait(1.0) and not collector._stop_event.is_set():
+            stats_queue.put((worker_id, dict(collector.stats(), cpu_s=time.process_time() - cpu0)))
+    finally:
+        collector.stop()
+        stats_queue.put((worker_id, dict(collector.stats(), cpu_s=time.process_time() - cpu0, final=True)))
+
+
+class FanoutCollector:
+    """Reparte la captura entre N procesos unidos a un grupo PACKET_FANOUT (hash por flujo).
+
+    Con el motor replay cada worker lee los pcap y se queda con su partición
+    del hash de flujo, emulando el reparto del kernel.
+
+    Cada worker escribe segmentos ``capture_wNN_*`` y su ``index_wNN.jsonl``;
+    ``capture_merge.iter_merged()`` los lee como un único stream ordenado.
+    """
+
+    def __init__(self, workers, **kwargs):
+        if kwargs.get("engine") not in ("tpacket", "replay"):
+            raise ValueError("--workers requires the tpacket (PACKET_FANOUT) or replay engine")
+        if kwargs.get("engine") == "tpacket" and not TPACKET_AVAILABLE:
+            raise RuntimeError("tpacket engine requires Linux (AF_PACKET + PACKET_RX_RING)")
+        if kwargs.get("pretrigger_bytes") or kwargs.get("pretrigger_seconds"):
+            raise ValueError("the pre-trigger ring runs in a single process; drop --workers")
+        if kwargs.get("accounting"):
+            raise ValueError("traffic accounting runs in a single process; drop --workers")
+        self.workers = int(workers)
+        self.kwargs = kwargs
+        self.engine = kwargs.get("engine")
+        self.bpf = kwargs.get("bpf", "ip") or None
+        self.snaplen = int(kwargs.get("snaplen") or 0)
+        self.fanout_group = os.getpid() & 0xFFFF
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop_event = self._ctx.Event()
+        self._stats_queue = self._ctx.Queue()
+        self._procs = []
+        self._worker_stats = {}
+
+    def start(self):
+        self._stop_event.clear()
+        self._procs = [
+            self._ctx.Process(target=_fanout_worker_main,
+                              args=(i, self._worker_kwargs(i), self._stop_event, self._stats_queue),
+                              daemon=True)
+            for i in range(self.workers)
+        ]
+        for p in self._procs:
+            p.start()
+
+    def _worker_kwargs(self, worker_id):
+        kwargs = dict(self.kwargs)
+        if self.engine == "replay":
+            kwargs["replay_partition"] = (worker_id, self.workers)
+        else:
+            kwargs["fanout_group"] = self.fanout_group
+        return kwargs
+
+    def is_running(self):
+        return not self._stop_event.is_set() and any(p.is_alive() for p in self._procs)
+
+    def _drain_stats(self):
+        while True:
+            try:
+                worker_id, stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._worker_stats[worker_id] = stats
+
+    def stop(self):
+        logging.info("Stopping %d fanout workers...", len(self._procs))
+        self._stop_event.set()
+        deadline = time.monotonic() + 30
+        finals = set()
+        while len(finals) < len(self._procs) and time.monotonic() < deadline:
+            try:
+                worker_id, stats = self._stats_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._procs):
+                    break
+                continue
+            self._worker_stats[worker_id] = stats
+            if stats.get("final"):
+                finals.add(worker_id)
+        for p in self._procs:
+            p.join(timeout=5)
+
+    def _sum(self, key):
+        self._drain_stats()
+        return sum(st.get(key) or 0 for st in self._worker_stats.values())
+
+    @property
+    def packets_captured(self):
+        return self._sum("packets_captured")
+
+    @property
+    def bytes_captured(self):
+        return self._sum("bytes_captured")
+
+    def kernel_drops(self):
+        return self._sum("kernel_drops")
+
+    def cpu_time(self):
+        return self._sum("cpu_s")
+
+    def stats(self):
+        self._drain_stats()
+        stages = {}
+        for st in self._worker_stats.values():
+            for name, stage in st.get("stages", {}).items():
+                agg = stages.setdefault(name, {"records": 0, "depth": 0, "high_water": 0, "dropped_packets": 0,
+                                               "busy_s": 0.0, "write_latency_ms": {}})
+                agg["records"] += stage["records"]
+                agg["depth"] += stage.get("depth", 0)
+                agg["busy_s"] += stage.get("busy_s", 0.0)
+                # Los percentiles no se suman: se informa el peor worker
+                for key, value in stage.get("write_latency_ms", {}).items():
+                    agg["write_latency_ms"][key] = max(agg["write_latency_ms"].get(key, 0.0), value)
+                agg["high_water"] = max(agg["high_water"], stage["high_water"])
+                agg["dropped_packets"] += stage["dropped_packets"]
+        return {
+            "engine": self.engine,
+            "workers": self.workers,
+            "packets_captured": self.packets_captured,
+            "bytes_captured": self.bytes_captured,
+            "kernel_drops": self.kernel_drops(),
+            "cpu_s": self.cpu_time(),
+            "capture_busy_s": self._sum("capture_busy_s"),
+            "stages": stages,
+            "per_worker": {w: st.get("packets_captured", 0) for w, st in sorted(self._worker_stats.items())},
+        }
+
+
 def auto_select_iface():
     candidates = get_if_list()
     logging.info("Interfaces detectadas: %s", candidates)
@@ -189,14 +1118,155 @@ def auto_select_iface():
     return candidates[0]
 
 
+def _udp_blaster(pps, seconds, size, port=9):
+    """Generador de carga a ritmo fijo para el benchmark (proceso aparte)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = b"\x00" * size
+    interval = 1.0 / pps
+    start = time.monotonic()
+    sent = 0
+    while True:
+        now = time.monotonic()
+        if now - start >= seconds:
+            break
+        due = int((now - start) / interval)
+        while sent < due:
+            sock.sendto(payload, ("127.0.0.1", port))
+            sent += 1
+        time.sleep(min(0.001, interval))
+
+
+def run_benchmark(collector, seconds, pps=None, size=1000, monitor=None):
+    collector.start()
+    if monitor:
+        monitor.start()
+    blaster = None
+    if pps:
+        blaster = multiprocessing.Process(target=_udp_blaster, args=(pps, seconds, size), daemon=True)
+        blaster.start()
+    t0 = time.monotonic()
+    cpu0 = collector.cpu_time()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - t0
+    if blaster:
+        blaster.join(timeout=2)
+    collector.stop()
+    if monitor:
+        monitor.stop()
+    cpu = collector.cpu_time() - cpu0
+    pps = collector.packets_captured / elapsed if elapsed else 0.0
+    drops = collector.kernel_drops()
+    print(f"engine={collector.engine} packets={collector.packets_captured} "
+          f"bytes={collector.bytes_captured} seconds={elapsed:.2f} pps={pps:.0f} "
+          f"cpu_s={cpu:.2f} kernel_drops={drops if drops is not None else 'n/a'}")
+    if collector.packets_captured:
+        print(f"  bytes_copied_per_packet={collector.bytes_captured / collector.packets_captured:.0f} "
+              f"cpu_us_per_packet={cpu / collector.packets_captured * 1e6:.2f} "
+              f"bpf={collector.bpf!r} snaplen={collector.snaplen or 'full'}")
+    stats = collector.stats()
+    if "per_worker" in stats:
+        print(f"  per_worker_packets={stats['per_worker']}")
+    for name, st in stats["stages"].items():
+        print(f"  stage={name} records={st['records']} high_water={st['high_water']} "
+              f"dropped_packets={st['dropped_packets']} write_latency_ms={st['write_latency_ms']}")
+
+
+def run_replay(collector, monitor=None):
+    """Reproduce los pcap por el pipeline y muestra el rendimiento por etapa."""
+    t0 = time.monotonic()
+    cpu0 = collector.cpu_time()
+    collector.start()
+    if monitor:
+        monitor.start()
+    try:
+        while collector.is_running():
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    collector.stop()
+    if monitor:
+        monitor.stop()
+    elapsed = time.monotonic() - t0
+    cpu = collector.cpu_time() - cpu0
+    stats = collector.stats()
+    packets = stats["packets_captured"]
+    pps = packets / elapsed if elapsed else 0.0
+    print(f"replay packets={packets} bytes={stats['bytes_captured']} seconds={elapsed:.2f} "
+          f"pps={pps:.0f} MBps={stats['bytes_captured'] / elapsed / 1e6 if elapsed else 0:.1f} cpu_s={cpu:.2f}")
+    if "per_worker" in stats:
+        print(f"  workers={stats['workers']} per_worker_packets={stats['per_worker']}")
+    if packets:
+        print(f"  stage=read busy_s={stats['capture_busy_s']:.2f} "
+              f"us_per_packet={stats['capture_busy_s'] / packets * 1e6:.2f}")
+    for name, st in stats["stages"].items():
+        # Todas las etapas ven todos los paquetes: el coste se reparte por paquete, no por registro
+        per_pkt = st["busy_s"] / packets * 1e6 if packets else 0.0
+        print(f"  stage={name} records={st['records']} busy_s={st['busy_s']:.2f} "
+              f"us_per_packet={per_pkt:.2f} dropped_packets={st['dropped_packets']} "
+              f"write_latency_ms={st['write_latency_ms']}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Windows packet collector (pcap + metadata jsonl)")
     parser.add_argument("--iface", help="interface device")
     parser.add_argument("--out-dir", default="captures", help="output directory")
     parser.add_argument("--rotate-seconds", default=300, type=int, help="rotate files every N seconds")
-    parser.add_argument("--max-files", default=48, type=int, help="keep last N pcap/jsonl pairs")
-    parser.add_argument("--no-meta", dest="meta", action="store_false", help="disable metadata jsonl output")
+    parser.add_argument("--rotate-bytes", default=0, type=int,
+                        help="also rotate once a segment holds N captured bytes (0 = time only)")
+    parser.add_argument("--max-files", default=48, type=int, help="keep last N segments")
+    parser.add_argument("--compress", choices=CODECS, default="none",
+                        help="compress closed segments in a background process (auto = zstd if installed, else gzip)")
+    parser.add_argument("--compress-level", type=int, help="compression level for the chosen codec")
+    parser.add_argument("--no-meta", dest="meta", action="store_false", help="disable metadata output")
+    parser.add_argument("--bpf", default="ip",
+                        help="BPF filter expression (kernel-attached on the tpacket engine); '' captures everything")
+    parser.add_argument("--snaplen", default=0, type=int,
+                        help="truncate frames to N bytes before copy (metadata keeps the original length)")
+    parser.add_argument("--bench-pps", type=int,
+                        help="with --benchmark: send UDP to 127.0.0.1 at N packets/s from a helper process (capture on lo)")
+    parser.add_argument("--bench-size", default=1000, type=int, help="UDP payload size for --bench-pps")
+    parser.add_argument("--workers", default=1, type=int,
+                        help="capture with N processes in a PACKET_FANOUT group (tpacket engine)")
+    parser.add_argument("--no-pcap", dest="pcap", action="store_false", help="disable pcap output")
+    parser.add_argument("--flows", action="store_true", help="aggregate packets into flow records (*.flows.jsonl)")
+    parser.add_argument("--flow-max", default=100000, type=int, help="hard cap on tracked flows (LRU eviction)")
+    parser.add_argument("--flow-idle-timeout", default=60.0, type=float, help="export flows idle for N seconds")
+    parser.add_argument("--flow-active-timeout", default=1800.0, type=float,
+                        help="export long-lived flows every N seconds")
+    parser.add_argument("--attribution", action="store_true",
+                        help="learn IP -> domain/service from DNS answers and TLS SNI "
+                             "(exported at /attribution with --stats-port for traffic_classifier)")
+    parser.add_argument("--accounting", action="store_true",
+                        help="keep rolling per-service/host/ASN counters (top talkers at /top with --stats-port)")
+    parser.add_argument("--meta-format", choices=META_FORMATS, default="jsonl",
+                        help="metadata as jsonl lines or columnar NumPy records (.npmeta)")
     parser.add_argument("--list-ifaces", action="store_true", help="list available interfaces and exit")
+    parser.add_argument("--engine", choices=ENGINES, default="scapy",
+                        help="capture engine: scapy sniff or Linux TPACKET_V3 mmap ring")
+    parser.add_argument("--benchmark", type=float, metavar="SECONDS",
+                        help="capture for N seconds and report packets per second")
+    parser.add_argument("--queue-size", default=32, type=int, help="batches buffered per stage queue")
+    parser.add_argument("--drop-policy", choices=DROP_POLICIES, default=None,
+                        help="what a full stage queue does with new batches (default drop-newest, block on replay)")
+    parser.add_argument("--replay", metavar="FILE[,FILE...]",
+                        help="feed recorded pcap files through the pipeline instead of capturing")
+    parser.add_argument("--replay-speed", default=0.0, type=float,
+                        help="0 = as fast as possible, 1 = recorded pacing, 2 = twice as fast...")
+    parser.add_argument("--fsync-seconds", default=5.0, type=float, help="fsync output files every N seconds")
+    parser.add_argument("--pretrigger-seconds", default=0.0, type=float,
+                        help="keep the last N seconds of packets in memory and write nothing until a trigger")
+    parser.add_argument("--pretrigger-mb", default=0, type=int,
+                        help="memory for the pre-trigger ring in MB (default 64 when only seconds are given)")
+    parser.add_argument("--post-trigger-seconds", default=5.0, type=float,
+                        help="keep capturing N seconds after a trigger before dumping trigger_*.pcap")
+    parser.add_argument("--trigger-port", type=int, default=DEFAULT_TRIGGER_PORT,
+                        help="local UDP port that accepts trigger datagrams (-1 disables)")
+    parser.add_argument("--trigger-file", help="dump the pre-trigger ring whenever this file is touched")
+    parser.add_argument("--stats-file", help="health stats JSON path (default <out-dir>/stats.json, '' disables)")
+    parser.add_argument("--stats-interval", default=5.0, type=float, help="sample health stats every N seconds")
+    parser.add_argument("--stats-port", type=int,
+                        help=f"serve health stats as JSON on http://127.0.0.1:PORT/stats "
+                             f"(NetGuard reads top talkers from port {DEFAULT_STATS_PORT})")
     args = parser.parse_args()
 
     if args.list_ifaces:
@@ -205,16 +1275,79 @@ def main():
             print(repr(i))
         return
 
+    replay_files = [f for f in (args.replay or "").split(",") if f]
+    if replay_files:
+        args.engine = "replay"
+
     # ✅ Por defecto siempre intenta auto
-    iface = args.iface if args.iface else auto_select_iface()
+    if args.iface:
+        iface = args.iface
+    else:
+        iface = "replay" if replay_files else auto_select_iface()
+
+    pretrigger = bool(args.pretrigger_seconds or args.pretrigger_mb)
+    if pretrigger:
+        # Modo pre-disparo: nada de pcap/metadatos continuos en disco
+        args.pcap = False
+        args.meta = False
 
-    collector = WindowsPacketCollector(
+    options = dict(
         iface=iface,
         out_dir=args.out_dir,
         rotate_seconds=args.rotate_seconds,
         max_files=args.max_files,
-        metadata=args.meta
+        metadata=args.meta,
+        engine=args.engine,
+        queue_size=args.queue_size,
+        drop_policy=args.drop_policy,
+        fsync_seconds=args.fsync_seconds,
+        meta_format=args.meta_format,
+        pcap=args.pcap,
+        flows=args.flows,
+        flow_max=args.flow_max,
+        flow_idle_timeout=args.flow_idle_timeout,
+        flow_active_timeout=args.flow_active_timeout,
+        rotate_bytes=args.rotate_bytes,
+        compress=args.compress,
+        compress_level=args.compress_level,
+        bpf=args.bpf,
+        snaplen=args.snaplen,
+        replay_files=replay_files,
+        replay_speed=args.replay_speed,
+        pretrigger_bytes=args.pretrigger_mb << 20,
+        pretrigger_seconds=args.pretrigger_seconds,
+        post_trigger_seconds=args.post_trigger_seconds,
+        trigger_port=args.trigger_port if pretrigger and args.trigger_port >= 0 else None,
+        trigger_file=args.trigger_file,
+        attribution=args.attribution,
+        accounting=args.accounting
     )
+    if args.workers > 1:
+        collector = FanoutCollector(args.workers, **options)
+    else:
+        collector = WindowsPacketCollector(**options)
+
+    stats_file = args.stats_file
+    if stats_file is None:
+        stats_file = "" if pretrigger else os.path.join(args.out_dir, "stats.json")
+    monitor = None
+    if stats_file or args.stats_port is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+        # Con --workers cada proceso tiene su propia contabilidad y caché: no se publican
+        routes = {}
+        if args.workers <= 1 and args.accounting:
+            routes["/top"] = collector.accounting.snapshot
+        if args.workers <= 1 and args.attribution:
+            routes["/attribution"] = collector.attribution.cache.export
+        monitor = HealthMonitor(collector, stats_file or None, args.stats_interval, args.stats_port, routes=routes)
+
+    if args.benchmark:
+        run_benchmark(collector, args.benchmark, args.bench_pps, args.bench_size, monitor)
+        return
+
+    if replay_files:
+        run_replay(collector, monitor)
+        return
 
     def handle_sigint(sig, frame):
         logging.info("SIGINT received")
@@ -225,10 +1358,15 @@ def main():
 
     try:
         collector.start()
-        while not collector._stop_event.is_set():
+        if monitor:
+            monitor.start()
+        while collector.is_running():
             time.sleep(0.5)
     except KeyboardInterrupt:
         collector.stop()
+    finally:
+        if monitor:
+            monitor.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+latency_test.py – Latencia en reposo y bajo carga (bufferbloat) con asyncio.
+
+La RTT se mide como el tiempo de establecimiento de una conexión TCP
+(SYN → SYN/ACK), que no necesita privilegios como ICMP. Las sondas se
+lanzan a intervalo fijo y en paralelo (no en serie), así que una sonda lenta
+no retrasa a las demás; las que no conectan antes del timeout cuentan como
+pérdida. Cada conexión se cierra nada más abrirse.
+
+* ``probe_rtt``: ráfaga de sondas en reposo;
+* ``measure_under_load``: sondas mientras ``ThroughputTest`` satura el enlace
+  (solo durante la ventana estable, tras el calentamiento).
+
+``summarize`` devuelve p50/p90/p99, jitter (media de la diferencia absoluta
+entre RTT consecutivas, como RFC 3550) y porcentaje de pérdida.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence
+
+from throughput_test import ThroughputTest
+
+PERCENTILES = (50, 90, 99)
+
+
+async def _probe_once(host: str, port: int, timeout: float) -> Optional[float]:
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    rtt = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return rtt
+
+
+async def _probe_series(host: str, port: int, interval: float, timeout: float,
+                        count: Optional[int] = None, stop: Optional[asyncio.Event] = None,
+                        delay: float = 0.0, concurrency: int = 16) -> List[Optional[float]]:
+    """Lanza una sonda cada ``interval`` s hasta ``count`` sondas o hasta ``stop``; RTT por orden de envío."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe():
+        async with limit:
+            return await _probe_once(host, port, timeout)
+
+    if delay and stop is not None:
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+            return []
+        except asyncio.TimeoutError:
+            pass
+    tasks = []
+    while (count is None or len(tasks) < count) and not (stop is not None and stop.is_set()):
+        tasks.append(asyncio.ensure_future(probe()))
+        if stop is not None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        elif count is None or len(tasks) < count:
+            await asyncio.sleep(interval)
+    return list(await asyncio.gather(*tasks))
+
+
+def summarize(samples: Sequence[Optional[float]]) -> Dict:
+    """Percentiles, jitter y pérdida (ms y %) de una serie de RTT (None = perdida)."""
+    sent = len(samples)
+    rtts = [s for s in samples if s is not None]
+    out = {"sent": sent, "received": len(rtts),
+           "loss_pct": round(100.0 * (sent - len(rtts)) / sent, 1) if sent else 0.0}
+    if not rtts:
+        return out
+    ordered = sorted(rtts)
+    last = len(ordered) - 1
+    for p in PERCENTILES:
+        out[f"p{p}_ms"] = round(ordered[min(last, int(last * p / 100 + 0.5))], 2)
+    out["min_ms"] = round(ordered[0], 2)
+    out["avg_ms"] = round(sum(rtts) / len(rtts), 2)
+    out["jitter_ms"] = round(sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1), 2) \
+        if len(rtts) > 1 else 0.0
+    return out
+
+
+async def probe_rtt(host: str, port: int, count: int = 30, interval: float = 0.02,
+                    timeout: float = 2.0, concurrency: int = 16) -> Dict:
+    """RTT en reposo: ``count`` sondas, una cada ``interval`` s, hasta ``concurrency`` a la vez."""
+    return summarize(await _probe_series(host, port, interval, timeout, count=count,
+                                         concurrency=concurrency))
+
+
+async def probe_many(targets: Sequence[tuple], count: int = 10, interval: float = 0.02,
+                     timeout: float = 2.0) -> Dict:
+    """Sondas en paralelo a varios ``(host, puerto)``; resume todas juntas."""
+    series = await asyncio.gather(*(_probe_series(h, p, interval, timeout, count=count)
+                                    for h, p in targets))
+    per_target = {f"{h}:{p}": summarize(s) for (h, p), s in zip(targets, series)}
+    merged = [rtt for s in series for rtt in s]
+    return dict(summarize(merged), targets=per_target)
+
+
+async def measure_under_load(test: ThroughputTest, direction: str, interval: float = 0.05,
+                             timeout: float = 2.0) -> Dict:
+    """``test.measure(direction)`` con sondas al mismo servidor durante la ventana estable."""
+    stop = asyncio.Event()
+    probes = asyncio.ensure_future(_probe_series(test.host, test.port, interval, timeout,
+                                                 stop=stop, delay=test.warmup))
+    try:
+        result = await test.measure(direction)
+    finally:
+        stop.set()
+        samples = await probes
+    result["latency"] = summarize(samples)
+    return result
+
+
+async def link_quality(test: ThroughputTest, directions=("download", "upload"),
+                       idle_probes: int = 30) -> Dict:
+    """RTT en reposo y bajo carga contra el servidor de throughput, más las tasas."""
+    result = {"host": test.host, "port": test.port, "streams": test.streams,
+              "idle": await probe_rtt(test.host, test.port, count=idle_probes)}
+    for direction in directions:
+        if test.cancelled:
+            break
+        result[direction] = await measure_under_load(test, direction)
+    result["cancelled"] = test.cancelled
+    return result
+
+
+def bufferbloat_ms(idle: Dict, loaded: Dict) -> Optional[float]:
+    """Latencia añadida por la carga (p50 bajo carga − p50 en reposo)."""
+    if "p50_ms" not in idle or "p50_ms" not in loaded:
+        return None
+    return round(max(loaded["p50_ms"] - idle["p50_ms"], 0.0), 2)
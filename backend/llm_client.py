@@ -0,0 +1,302 @@
+"""
+llm_client.py – Cliente de chat completions (OpenRouter / compatible OpenAI).
+
+* Una ``requests.Session`` con pool de conexiones (keep-alive) para todas
+  las consultas, en lugar de un ``requests.post`` suelto por clic.
+* Semáforo acotado: como mucho ``max_concurrency`` peticiones a la vez; la
+  espera por un hueco cuenta dentro del presupuesto de la consulta.
+* Cortocircuito por modelo: tras ``failure_threshold`` fallos seguidos (o
+  respuestas más lentas que ``slow_after``) el modelo se salta durante
+  ``cooldown`` segundos y después se prueba con una sola petición.
+* Fallback: se prueba el modelo preferido y luego el resto de ``models`` en
+  orden, repartiendo un presupuesto total de ``budget`` segundos.
+* ``stream``: la respuesta por fragmentos (SSE) según la genera el modelo.
+
+``ai_suggestions.prefetch_sugerencias`` lo usa en paralelo para precargar
+las sugerencias de todas las redes visibles.
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class LLMError(Exception):
+    """Ningún modelo respondió (el mensaje resume el último error)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _SlotTimeout(LLMError):
+    """No quedó hueco en el semáforo dentro del tiempo de la consulta (no es culpa del modelo)."""
+
+
+def _iter_lines(response) -> Iterator[bytes]:
+    """Líneas del cuerpo según llegan (``iter_lines()`` espera a juntar 512 bytes)."""
+    raw = response.raw
+    if hasattr(raw, "read1") and not getattr(raw, "chunked", True):
+        # Cuerpo sin chunked (hasta cerrar la conexión): read1 devuelve lo que haya llegado
+        chunks = iter(lambda: raw.read1(8192, decode_content=True), b"")
+    else:
+        chunks = response.iter_content(chunk_size=None)
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _iter_sse(response) -> Iterator[str]:
+    """
+    Texto de cada evento ``data:`` de un stream de chat completions hasta ``[DONE]``.
+    Si la conexión se cierra sin ``[DONE]`` ni ``finish_reason`` la respuesta está
+    cortada: ``LLMError``.
+    """
+    finished = False
+    for raw in _iter_lines(response):
+        line = raw.decode("utf-8", "replace").strip()
+        if not line.startswith("data:"):
+            continue            # líneas vacías, comentarios (": OPENROUTER PROCESSING")...
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        if event.get("error"):
+            raise LLMError(f"Error en el stream: {event['error']}")
+        for choice in event.get("choices") or []:
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                yield delta
+            if choice.get("finish_reason"):
+                finished = True
+    if not finished:
+        raise LLMError("Error: el stream se cortó antes de terminar la respuesta")
+
+
+class CircuitBreaker:
+    """Cerrado → abierto tras N fallos seguidos → medio abierto tras el enfriamiento."""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True        # una sola petición de prueba
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """Libera la petición de prueba sin contarla como éxito ni como fallo."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    """Cliente con pool, concurrencia acotada y fallback entre modelos."""
+
+    def __init__(self, url: str, headers: Dict[str, str], models: Iterable[str],
+                 max_concurrency: int = 4, timeout: float = 15.0, budget: float = 30.0,
+                 slow_after: float = 10.0, failure_threshold: int = 3, cooldown: float = 60.0):
+        self.url = url
+        self.models: List[str] = list(models)
+        self.timeout = timeout
+        self.budget = budget
+        self.slow_after = slow_after
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max(max_concurrency, 1))
+        self.max_concurrency = max_concurrency
+        self._breakers = {m: CircuitBreaker(failure_threshold, cooldown) for m in self.models}
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self.stats_counters = {"requests": 0, "fallbacks": 0, "skipped": 0, "errors": 0, "busy": 0}
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(self._failure_threshold, self._cooldown)
+        return self._breakers[model]
+
+    def _order(self, preferred: Optional[str]) -> List[str]:
+        if preferred:
+            return [preferred] + [m for m in self.models if m != preferred]
+        return list(self.models)
+
+    def _acquire(self, timeout: float) -> float:
+        """Ocupa un hueco del semáforo esperando como mucho ``timeout``; devuelve lo esperado."""
+        start = time.monotonic()
+        if not self._semaphore.acquire(timeout=timeout):
+            self.stats_counters["busy"] += 1
+            raise _SlotTimeout(f"Error: sin hueco libre tras {timeout:.1f}s (demasiadas consultas a la vez)")
+        return time.monotonic() - start
+
+    def _post(self, model: str, messages: List[Dict], timeout: float, **params) -> str:
+        payload = dict(params, model=model, messages=messages)
+        waited = self._acquire(timeout)
+        try:
+            self.stats_counters["requests"] += 1
+            response = self.session.post(self.url, json=payload, timeout=max(timeout - waited, 0.5))
+        finally:
+            self._semaphore.release()
+        if response.status_code != 200:
+            raise LLMError(f"Error {response.status_code}: {response.text[:200]}", response.status_code)
+        try:
+            text = response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Respuesta inválida de {model}: {e}")
+        if not text or not text.strip():
+            raise LLMError(f"Respuesta vacía de {model}")
+        return text.strip()
+
+    def _candidates(self, preferred: Optional[str]) -> Iterator[Tuple[str, CircuitBreaker, float]]:
+        """Modelos a probar en orden, saltando los cortocircuitados: (modelo, breaker, segundos restantes)."""
+        deadline = time.monotonic() + self.budget
+        attempted = 0
+        for model in self._order(preferred):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.5:
+                return
+            breaker = self._breaker(model)
+            if not breaker.allow():
+                self.stats_counters["skipped"] += 1
+                continue
+            if attempted:
+                self.stats_counters["fallbacks"] += 1
+            attempted += 1
+            yield model, breaker, min(self.timeout, remaining)
+
+    def _failed(self, breaker: CircuitBreaker, error: Exception) -> LLMError:
+        breaker.failure()
+        self.stats_counters["errors"] += 1
+        return error if isinstance(error, LLMError) else LLMError(f"Error de conexión: {error}")
+
+    def _finished(self, breaker: CircuitBreaker, latency: float):
+        # Una respuesta lenta vale, pero cuenta para que la próxima vaya a otro modelo
+        if latency > self.slow_after:
+            breaker.failure()
+        else:
+            breaker.success()
+
+    def complete(self, prompt: str, preferred: Optional[str] = None,
+                 temperature: float = 0.4) -> str:
+        """Texto del primer modelo que responda; ``LLMError`` si fallan todos."""
+        messages = [{"role": "user", "content": prompt}]
+        last_error = LLMError("Ningún modelo disponible")
+        for model, breaker, timeout in self._candidates(preferred):
+            start = time.monotonic()
+            try:
+                text = self._post(model, messages, timeout, temperature=temperature)
+            except _SlotTimeout as e:
+                breaker.release()
+                last_error = e
+                break                   # el presupuesto se fue esperando: otro modelo no cambia nada
+            except (requests.RequestException, LLMError) as e:
+                last_error = self._failed(breaker, e)
+                if last_error.status in (401, 403):
+                    break               # credenciales: el resto de modelos fallará igual
+                continue
+            self._finished(breaker, time.monotonic() - start)
+            return text
+        raise last_error
+
+    def stream(self, prompt: str, preferred: Optional[str] = None,
+               temperature: float = 0.4) -> Iterator[str]:
+        """
+        Fragmentos de texto según llegan (SSE, ``stream: true``).
+        Se cambia de modelo solo si falla antes del primer fragmento; un corte
+        a mitad de respuesta lanza ``LLMError``.
+        """
+        messages = [{"role": "user", "content": prompt}]
+        last_error = LLMError("Ningún modelo disponible")
+        for model, breaker, timeout in self._candidates(preferred):
+            payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+            start = time.monotonic()
+            first = None
+            try:
+                waited = self._acquire(timeout)
+            except _SlotTimeout as e:
+                breaker.release()
+                last_error = e
+                break
+            try:
+                try:
+                    self.stats_counters["requests"] += 1
+                    with self.session.post(self.url, json=payload, timeout=max(timeout - waited, 0.5),
+                                           stream=True) as response:
+                        if response.status_code != 200:
+                            raise LLMError(f"Error {response.status_code}: {response.text[:200]}",
+                                           response.status_code)
+                        for delta in _iter_sse(response):
+                            if first is None:
+                                first = time.monotonic() - start
+                            yield delta
+                finally:
+                    self._semaphore.release()
+            except (requests.RequestException, LLMError) as e:
+                last_error = self._failed(breaker, e)
+                if first is not None or last_error.status in (401, 403):
+                    raise last_error
+                continue
+            except GeneratorExit:
+                # El consumidor cerró el stream (p. ej. ventana cerrada): no es un fallo del
+                # modelo, pero una petición de prueba medio abierta debe quedar libre
+                if first is None:
+                    breaker.release()
+                else:
+                    self._finished(breaker, first)
+                raise
+            if first is None:
+                last_error = self._failed(breaker, LLMError(f"Respuesta vacía de {model}"))
+                continue
+            self._finished(breaker, first)
+            return
+        raise last_error
+
+    def stats(self) -> Dict:
+        return dict(self.stats_counters,
+                    breakers={m: b.state for m, b in self._breakers.items()})
+
+    def close(self):
+        self.session.close()
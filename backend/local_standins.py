@@ -0,0 +1,445 @@
+"""
+local_standins.py – Servidores locales que imitan los servicios externos.
+
+Cada comprobación levanta en 127.0.0.1 (puerto libre) un ``http.server`` de la
+librería estándar con el comportamiento justo para ejercitar un cliente sin
+salir a la red, y verifica el resultado:
+
+* ``router``: API de fabricantes de ``mac_capacidad`` (acierto, 404, timeout
+  que no se memoriza y consultas simultáneas deduplicadas).
+* ``throughput``: servidor de ``throughput_test`` en 127.0.0.1 (flujos
+  paralelos en las dos direcciones, cancelación y test nativo completo).
+* ``llm``: API de chat completions compatible con OpenAI para ``llm_client``
+  y ``ai_suggestions`` (fallback entre modelos, cortocircuito abierto y medio
+  abierto, espera por hueco acotada y precarga deduplicada).
+* ``sse``: la misma API con ``stream: true`` (fragmentos según llegan, corte a
+  mitad de respuesta que no se cachea y cierre anticipado del consumidor).
+
+Uso::
+
+    python local_standins.py            # todas las comprobaciones
+    python local_standins.py router     # solo las indicadas
+
+Sale con código 1 si falla alguna.
+"""
+
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StandinServer:
+    """
+    ``ThreadingHTTPServer`` en un hilo; ``respond(handler, body)`` escribe la respuesta.
+    Guarda cada petición como (método, ruta, cuerpo JSON) en ``requests``.
+    """
+
+    def __init__(self, respond: Callable):
+        self.respond = respond
+        self.requests: List[Tuple[str, str, Optional[object]]] = []
+        self._lock = threading.Lock()
+        outer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                outer._handle(self, None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                outer._handle(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_port
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread: Optional[threading.Thread] = None
+
+    def _handle(self, handler, body):
+        with self._lock:
+            self.requests.append((handler.command, handler.path, body))
+        try:
+            self.respond(handler, body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass                # el cliente cortó (timeout): no es un error del servidor
+
+    def count(self, prefix: str = "") -> int:
+        with self._lock:
+            return sum(1 for _, path, _ in self.requests if path.startswith(prefix))
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True,
+                                        name="standin-http")
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def send_body(handler, status: int, body: bytes, content_type: str = "text/plain; charset=utf-8"):
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def send_json(handler, status: int, data):
+    send_body(handler, status, json.dumps(data).encode("utf-8"), "application/json")
+
+
+class _Checks:
+    """Acumula los resultados de una comprobación (✅/❌ por línea)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+
+    def expect(self, condition: bool, message: str):
+        print(f"   {'✅' if condition else '❌'} {message}")
+        if not condition:
+            self.failures += 1
+
+
+# ---------------- mac_capacidad: API de fabricantes ----------------
+_ROUTER_REPLIES = {
+    "A0B1C2": (200, "Archer Standin Networks"),     # se infiere un modelo del texto
+    "D3E4F5": (404, "Not Found"),                   # OUI desconocido: negativo cacheado
+}
+_ROUTER_SLOW_OUI = "0A1B2C"                          # más lento que online_timeout
+
+
+def check_router(checks: _Checks):
+    from mac_capacidad import RouterModelDetector
+
+    slow = {"delay": 1.5}
+
+    def respond(handler, _body):
+        oui = handler.path.strip("/").upper()
+        if oui == _ROUTER_SLOW_OUI:
+            time.sleep(slow["delay"])
+            send_body(handler, 200, b"Archer Slow Networks")
+            return
+        if oui == "111111":
+            time.sleep(0.3)         # ventana para que las consultas simultáneas coincidan
+        status, text = _ROUTER_REPLIES.get(oui, (200, "Archer Standin Networks"))
+        send_body(handler, status, text.encode("utf-8"))
+
+    tmp_dir = tempfile.mkdtemp(prefix="standin_router_")
+    try:
+        with StandinServer(respond) as server:
+            cache_file = os.path.join(tmp_dir, "router_online_cache.json")
+            detector = RouterModelDetector(online_api_url=server.url + "/{oui}",
+                                           online_cache_file=cache_file)
+            detector.online_min_interval = 0.0
+            detector.online_timeout = 0.5
+            vendor = "Standin Labs"     # fabricante fuera del índice: fuerza la búsqueda online
+
+            hit = detector.detect_router_model_and_capacity("A0:B1:C2:00:00:01", "", vendor)
+            checks.expect("online_search" in hit["sources"] and hit["model"] == "Archer Series",
+                          f"acierto online → {hit['model']}")
+            with open(cache_file, encoding="utf-8") as f:
+                saved = json.load(f)
+            checks.expect(saved.get("standin labs|A0B1C2", {}).get("result") is not None,
+                          "el acierto se guarda en el cache en disco")
+
+            miss = detector.detect_router_model_and_capacity("D3:E4:F5:00:00:01", "", vendor)
+            before = server.count()
+            detector.detect_router_model_and_capacity("D3:E4:F5:00:00:02", "", vendor)
+            checks.expect(miss["model"] == "No detectado" and server.count() == before,
+                          "un 404 se cachea como negativo (sin segunda consulta)")
+
+            # El timeout no se memoriza: el siguiente análisis vuelve a consultar
+            slow_mac = "0A:1B:2C:00:00:01"
+            detector.detect_router_model_and_capacity(slow_mac, "", vendor)
+            slow["delay"] = 0.0
+            retried = detector.detect_router_model_and_capacity(slow_mac, "", vendor)
+            checks.expect(server.count("/" + _ROUTER_SLOW_OUI) >= 2 and "online_search" in retried["sources"],
+                          "tras un timeout se reintenta en el siguiente análisis")
+
+            # Varias tarjetas con el mismo (fabricante, OUI) a la vez: una sola consulta
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                list(pool.map(lambda i: detector.detect_router_model_and_capacity(
+                    f"11:11:11:00:00:{i:02X}", "", vendor), range(6)))
+            checks.expect(server.count("/111111") == 1,
+                          f"consultas simultáneas deduplicadas ({server.count('/111111')} petición)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ---------------- throughput_test: servidor de throughput local ----------------
+def check_throughput(checks: _Checks):
+    from network_speed import native_speed_test, test_network_speed
+    from throughput_test import ThroughputTest, start_server_thread
+
+    port, stop = start_server_thread()
+    try:
+        res = ThroughputTest("127.0.0.1", port, streams=4, duration=1.0, warmup=0.3).run()
+        for direction in ("download", "upload"):
+            r = res[direction]
+            checks.expect(r["mbps"] > 0 and len(r["streams"]) == 4 and all(s["bytes"] > 0 for s in r["streams"]),
+                          f"{direction}: {r['mbps']} Mbps en 4 flujos")
+
+        # Cancelar desde otro hilo corta el test y devuelve lo medido
+        test = ThroughputTest("127.0.0.1", port, streams=2, duration=30.0, warmup=0.2)
+        threading.Timer(0.8, test.cancel).start()
+        start = time.monotonic()
+        res = test.run()
+        elapsed = time.monotonic() - start
+        checks.expect(res["cancelled"] and elapsed < 5, f"cancelado en {elapsed:.1f}s")
+
+        full = native_speed_test(f"127.0.0.1:{port}", streams=2, duration=0.8, warmup=0.2)
+        checks.expect(full["success"] and full["method"] == "native_tcp" and full["loss_pct"] == 0.0,
+                      f"test nativo: ping {full['ping_ms']} ms, bajada {full['download_mbps']} Mbps")
+    finally:
+        stop()
+
+    # Sin servidor y con native_only no se cae a speedtest-cli
+    down = test_network_speed(f"127.0.0.1:{port}", native_only=True, duration=0.5, warmup=0.1)
+    checks.expect(not down["success"] and down["method"] == "native_tcp",
+                  "servidor caído con native_only: fallo sin speedtest-cli")
+
+
+# ---------------- llm_client / ai_suggestions: chat completions ----------------
+class LLMStandin:
+    """
+    Respuesta según el modelo pedido (``behaviour[modelo]``): ``ok`` (por defecto),
+    ``error`` (HTTP 500) o ``slow`` (responde tras ``delay`` segundos).
+    Con ``stream: true`` responde por SSE, una palabra por evento cada ``interval``
+    segundos; ``cut`` cierra la conexión a mitad de respuesta, sin ``[DONE]``.
+    """
+
+    interval = 0.05
+
+    def __init__(self, delay: float = 1.0):
+        self.behaviour: Dict[str, str] = {}
+        self.delay = delay
+
+    def __call__(self, handler, body):
+        body = body or {}
+        model = body.get("model", "")
+        mode = self.behaviour.get(model, "ok")
+        if mode == "error":
+            send_json(handler, 500, {"error": {"message": f"fallo simulado de {model}"}})
+            return
+        if mode == "slow":
+            time.sleep(self.delay)
+        if body.get("stream"):
+            self._stream(handler, f"Respuesta larga de {model} en varios fragmentos", mode == "cut")
+            return
+        send_json(handler, 200, {"model": model, "choices": [
+            {"index": 0, "finish_reason": "stop",
+             "message": {"role": "assistant", "content": f"Respuesta de {model}"}}]})
+
+
+    def _stream(self, handler, text: str, cut: bool):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")      # sin longitud: el cuerpo acaba al cerrar
+        handler.end_headers()
+        handler.close_connection = True
+
+        def event(data: str):
+            handler.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+        handler.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if cut and i == len(words) // 2:
+                return
+            event(json.dumps({"choices": [{"index": 0, "delta": {"content": word + " "},
+                                           "finish_reason": None}]}))
+            time.sleep(self.interval)
+        event(json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        event("[DONE]")
+
+
+def _models_asked(server: StandinServer) -> List[str]:
+    with server._lock:
+        return [body.get("model") for _, _, body in server.requests if isinstance(body, dict)]
+
+
+def check_llm(checks: _Checks):
+    import ai_suggestions
+    from ai_cache import ResponseCache
+    from llm_client import LLMClient, LLMError
+
+    standin = LLMStandin()
+    with StandinServer(standin) as server:
+        url = server.url + "/v1/chat/completions"
+
+        # Fallback: el modelo preferido falla y responde el siguiente
+        standin.behaviour = {"m-bad": "error"}
+        client = LLMClient(url, {}, ["m-bad", "m-good"], budget=5.0, timeout=2.0,
+                           failure_threshold=2, cooldown=0.5)
+        text = client.complete("hola")
+        checks.expect(text == "Respuesta de m-good" and client.stats()["fallbacks"] == 1,
+                      f"fallback al segundo modelo → {text!r}")
+
+        # Cortocircuito: tras 2 fallos seguidos m-bad se salta sin pedirlo
+        client.complete("hola")
+        asked = len(_models_asked(server))
+        client.complete("hola")
+        models = _models_asked(server)[asked:]
+        checks.expect(client.stats()["breakers"]["m-bad"] == "open" and models == ["m-good"],
+                      f"cortocircuito abierto: solo se pide {models}")
+
+        # Medio abierto tras el enfriamiento: una sola petición de prueba, y si va bien se cierra
+        time.sleep(0.6)
+        standin.behaviour = {"m-bad": "slow"}   # la prueba sigue en curso mientras llegan las demás
+        standin.delay = 0.5
+        asked = len(_models_asked(server))
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(lambda _: client.complete("hola"), range(3)))
+        probes = _models_asked(server)[asked:].count("m-bad")
+        checks.expect(probes == 1 and client.stats()["breakers"]["m-bad"] == "closed",
+                      f"medio abierto: {probes} petición de prueba y vuelve a cerrado")
+
+        # Sin hueco libre: la espera cuenta en el presupuesto y no abre el cortocircuito
+        standin.behaviour = {"m-slow": "slow"}
+        standin.delay = 1.5
+        busy = LLMClient(url, {}, ["m-slow"], max_concurrency=1, budget=5.0, timeout=3.0)
+        holder = threading.Thread(target=busy.complete, args=("lento",))
+        holder.start()
+        time.sleep(0.2)
+        busy.budget = 0.8
+        start = time.monotonic()
+        try:
+            busy.complete("rápido")
+            error = None
+        except LLMError as e:
+            error = e
+        elapsed = time.monotonic() - start
+        holder.join()
+        checks.expect(error is not None and elapsed < 1.2 and busy.stats()["busy"] == 1 and
+                      busy.stats()["breakers"]["m-slow"] == "closed",
+                      f"sin hueco: error en {elapsed:.1f}s, cortocircuito cerrado")
+
+        # Precarga: cada perfil distinto se pide una sola vez aunque haya muchas redes
+        standin.behaviour = {}
+        saved = (ai_suggestions.OPENROUTER_URL, ai_suggestions._client, ai_suggestions._response_cache)
+        ai_suggestions.OPENROUTER_URL = url
+        ai_suggestions._client = LLMClient(url, {}, ai_suggestions.MODELOS, budget=5.0, timeout=2.0)
+        ai_suggestions._response_cache = ResponseCache(path=None)
+        try:
+            redes = [{"SSID": f"red{i}", "Seguridad": "WPA2-Personal", "Banda": "5 GHz",
+                      "Tecnologia": "WiFi 5 (802.11ac)", "Señal": -60 - (i % 2) * 10} for i in range(20)]
+            asked = len(_models_asked(server))
+            pedidos = ai_suggestions.prefetch_sugerencias(redes)
+            sent = len(_models_asked(server)) - asked
+            again = ai_suggestions.prefetch_sugerencias(redes)
+            checks.expect(pedidos == 3 and sent == 3 and again == 0,
+                          f"precarga de 20 redes: {pedidos} perfiles, {sent} peticiones, {again} al repetir")
+        finally:
+            ai_suggestions.OPENROUTER_URL, ai_suggestions._client, ai_suggestions._response_cache = saved
+
+
+def check_sse(checks: _Checks):
+    import ai_suggestions
+    from ai_cache import ResponseCache
+    from llm_client import LLMClient, LLMError
+
+    standin = LLMStandin()
+    with StandinServer(standin) as server:
+        url = server.url + "/v1/chat/completions"
+        client = LLMClient(url, {}, ["m-a", "m-b"], budget=5.0, timeout=3.0,
+                           failure_threshold=1, cooldown=0.3)
+
+        # Los fragmentos llegan según se generan, no todos al final
+        start = time.monotonic()
+        arrivals = []
+        parts = []
+        for part in client.stream("hola"):
+            arrivals.append(time.monotonic() - start)
+            parts.append(part)
+        checks.expect("".join(parts).strip() == "Respuesta larga de m-a en varios fragmentos" and
+                      arrivals[0] < arrivals[-1] - 3 * standin.interval,
+                      f"{len(parts)} fragmentos, el primero a {arrivals[0] * 1000:.0f} ms")
+
+        # Corte a mitad de respuesta: LLMError, aunque la conexión se cierre limpia
+        standin.behaviour = {"m-a": "cut"}
+        parts = []
+        try:
+            for part in client.stream("hola"):
+                parts.append(part)
+            error = None
+        except LLMError as e:
+            error = e
+        checks.expect(error is not None and parts, f"corte tras {len(parts)} fragmentos → {error}")
+
+        # Consumidor que deja de leer con el cortocircuito medio abierto: la prueba queda libre
+        time.sleep(0.35)
+        standin.behaviour = {}
+        gen = client.stream("hola")
+        next(gen)
+        gen.close()
+        checks.expect(client._breaker("m-a").allow(), "cerrar el stream no bloquea el cortocircuito")
+
+        # stream_sugerencia: una respuesta cortada no se cachea; una completa sí
+        saved = (ai_suggestions.OPENROUTER_URL, ai_suggestions._client, ai_suggestions._response_cache)
+        ai_suggestions.OPENROUTER_URL = url
+        ai_suggestions._client = LLMClient(url, {}, [ai_suggestions.MODELO_PROTOCOLO], budget=5.0, timeout=3.0)
+        ai_suggestions._response_cache = cache = ResponseCache(path=None)
+        try:
+            red = {"Seguridad": "WPA2-Personal"}
+            standin.behaviour = {ai_suggestions.MODELO_PROTOCOLO: "cut"}
+            try:
+                list(ai_suggestions.stream_sugerencia(red, "protocolo"))
+                cut_raised = False
+            except LLMError:
+                cut_raised = True
+            checks.expect(cut_raised and len(cache) == 0, "respuesta cortada: error y nada en caché")
+            standin.behaviour = {}
+            text = "".join(ai_suggestions.stream_sugerencia(red, "protocolo"))
+            checks.expect(len(cache) == 1 and "Respuesta larga" in text, "respuesta completa: en caché")
+        finally:
+            ai_suggestions.OPENROUTER_URL, ai_suggestions._client, ai_suggestions._response_cache = saved
+
+
+CHECKS: Dict[str, Callable[[_Checks], None]] = {
+    "router": check_router,
+    "throughput": check_throughput,
+    "llm": check_llm,
+    "sse": check_sse,
+}
+
+
+def main(argv: List[str]) -> int:
+    names = argv or list(CHECKS)
+    failures = 0
+    for name in names:
+        if name not in CHECKS:
+            print(f"❌ Comprobación desconocida: {name} (disponibles: {', '.join(CHECKS)})")
+            return 2
+        print(f"🔍 {name}")
+        checks = _Checks(name)
+        try:
+            CHECKS[name](checks)
+        except Exception as e:
+            checks.expect(False, f"excepción: {e!r}")
+        failures += checks.failures
+    print("✅ Todo correcto" if not failures else f"❌ {failures} comprobaciones fallidas")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
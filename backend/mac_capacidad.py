@@ -4,16 +4,93 @@ import re
 import requests
 import json
 import os
-from typing import Optional, Dict, Any, List
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse
+from typing import Optional, Dict, Any, List, Tuple
+
+# API de fabricantes para la búsqueda online; la variable de entorno permite
+# apuntarla a un servidor local (ver local_standins.py)
+DEFAULT_ONLINE_API_URL = "https://api.macvendors.com/{oui}"
+ROUTER_API_ENV = "ESCANER_ROUTER_API"
 
 class RouterModelDetector:
-    def __init__(self):
-        self.database_file = "router_models_database.json"
-        self.models_db = self._load_models_database()
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+    def __init__(self, online_api_url: Optional[str] = None,
+                 online_cache_file: Optional[str] = None):
+        # Ruta relativa al módulo, no al directorio de trabajo
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.database_file = os.path.join(base_dir, "router_models_database.json")
+        self._models_db: Optional[Dict] = None
+        self._oui_index: Dict[Tuple[str, str], Dict] = {}
+        self._vendor_index: Dict[str, Dict] = {}
+        self._index_lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        # Resultados memorizados por BSSID: {mac: (vendor, wifi_tech, resultado)}
+        self._results: Dict[str, Tuple[str, str, Dict]] = {}
+        self._results_lock = threading.Lock()
+
+        # Búsqueda online: cache en disco por (fabricante, OUI), pool acotado y
+        # límite de frecuencia por host. La URL es configurable para pruebas locales.
+        self.online_api_url = online_api_url or os.environ.get(ROUTER_API_ENV) or DEFAULT_ONLINE_API_URL
+        self.online_cache_file = online_cache_file or os.path.join(base_dir, "router_online_cache.json")
+        self.online_hit_ttl = 30 * 24 * 3600     # 30 días
+        self.online_miss_ttl = 24 * 3600         # 1 día para respuestas sin modelo
+        self.online_min_interval = 1.0           # segundos entre consultas al mismo host
+        self.online_max_workers = 4
+        self.online_timeout = 3
+        self._online_cache: Optional[Dict[str, Dict]] = None
+        self._online_lock = threading.Lock()
+        self._online_save_lock = threading.Lock()   # una escritura del fichero a la vez
+        self._online_inflight: Dict[str, Future] = {}
+        self._online_pool: Optional[ThreadPoolExecutor] = None
+        self._host_next_at: Dict[str, float] = {}
+        self._host_lock = threading.Lock()
+
+    @property
+    def models_db(self) -> Dict:
+        """Base de datos de modelos (se carga e indexa en el primer uso)."""
+        self._ensure_index()
+        return self._models_db
+
+    @property
+    def session(self) -> requests.Session:
+        """Sesión HTTP creada solo si hace falta una búsqueda online."""
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            })
+        return self._session
+
+    def _ensure_index(self):
+        """Cargar la base y compilar los índices OUI→modelo y fabricante→modelo una sola vez."""
+        if self._models_db is not None:
+            return
+        with self._index_lock:
+            if self._models_db is not None:
+                return
+            models_db = self._load_models_database()
+            oui_index: Dict[Tuple[str, str], Dict] = {}
+            vendor_index: Dict[str, Dict] = {}
+
+            for vendor, vendor_info in models_db.get("router_models", {}).items():
+                vendor_key = self._vendor_key(vendor)
+                models = vendor_info.get("common_models", [])
+                if models and vendor_key not in vendor_index:
+                    vendor_index[vendor_key] = models[0]
+                for model_info in models:
+                    for prefix in model_info.get("mac_prefixes", []):
+                        # El primer modelo listado para un OUI tiene prioridad
+                        oui_index.setdefault((vendor_key, self.get_oui_prefix(prefix)), model_info)
+
+            self._oui_index = oui_index
+            self._vendor_index = vendor_index
+            self._models_db = models_db
+            print(f"✅ Índice de modelos: {len(vendor_index)} fabricantes, {len(oui_index)} OUIs")
+
+    def _vendor_key(self, vendor: str) -> str:
+        return (vendor or "").strip().lower()
     
     def _load_models_database(self) -> Dict:
         """Cargar base de datos de modelos desde archivo JSON"""
@@ -44,38 +121,32 @@ class RouterModelDetector:
     
     def find_model_by_mac(self, mac: str, vendor: str) -> Optional[Dict]:
         """Buscar modelo específico por MAC y fabricante"""
-        oui_prefix = self.get_oui_prefix(mac)
-        
-        # Buscar en la base de datos por fabricante
-        if vendor in self.models_db.get("router_models", {}):
-            vendor_models = self.models_db["router_models"][vendor]["common_models"]
-            
-            for model_info in vendor_models:
-                if "mac_prefixes" in model_info and oui_prefix in model_info["mac_prefixes"]:
-                    return {
-                        "model": model_info["model"],
-                        "max_devices": model_info["max_devices"],
-                        "wifi_standard": model_info.get("wifi_standard", "Unknown"),
-                        "confidence": "high",
-                        "source": "exact_mac_match"
-                    }
+        self._ensure_index()
+        model_info = self._oui_index.get((self._vendor_key(vendor), self.get_oui_prefix(mac)))
+        if model_info:
+            return {
+                "model": model_info["model"],
+                "max_devices": model_info["max_devices"],
+                "wifi_standard": model_info.get("wifi_standard", "Unknown"),
+                "confidence": "high",
+                "source": "exact_mac_match"
+            }
         
         return None
     
     def find_model_by_vendor(self, vendor: str) -> Optional[Dict]:
         """Buscar modelo más común por fabricante"""
-        if vendor in self.models_db.get("router_models", {}):
-            vendor_models = self.models_db["router_models"][vendor]["common_models"]
-            if vendor_models:
-                # Devolver el primer modelo (más común)
-                model_info = vendor_models[0]
-                return {
-                    "model": model_info["model"],
-                    "max_devices": model_info["max_devices"],
-                    "wifi_standard": model_info.get("wifi_standard", "Unknown"),
-                    "confidence": "medium",
-                    "source": "vendor_common_model"
-                }
+        self._ensure_index()
+        # Primer modelo listado del fabricante (más común)
+        model_info = self._vendor_index.get(self._vendor_key(vendor))
+        if model_info:
+            return {
+                "model": model_info["model"],
+                "max_devices": model_info["max_devices"],
+                "wifi_standard": model_info.get("wifi_standard", "Unknown"),
+                "confidence": "medium",
+                "source": "vendor_common_model"
+            }
         return None
     
     def estimate_by_technology(self, wifi_tech: str) -> Dict:
@@ -97,28 +168,131 @@ class RouterModelDetector:
         }
     
     def search_online_info(self, mac: str, vendor: str) -> Optional[Dict]:
-        """Buscar información online como respaldo"""
+        """
+        Buscar información online como respaldo.
+        Usa el cache en disco; si varias tarjetas piden el mismo (fabricante, OUI)
+        a la vez, todas esperan la misma consulta.
+        """
         try:
-            # MAC Vendors API para información adicional
-            url = f"https://api.macvendors.com/{mac.replace(':', '')}"
-            response = self.session.get(url, timeout=3)
-            
+            future = self._submit_online(mac, vendor)
+            if future is None:
+                return self._get_cached_online(self._online_key(mac, vendor))
+            result = future.result(timeout=self.online_timeout * 4)
+            return dict(result) if result else None
+        except Exception as e:
+            print(f"⚠️ Búsqueda online fallida para {vendor}: {e}")
+            return None
+
+    def _online_key(self, mac: str, vendor: str) -> str:
+        return f"{self._vendor_key(vendor)}|{self.get_oui_prefix(mac)}"
+
+    def _load_online_cache(self) -> Dict[str, Dict]:
+        """Cargar cache de búsquedas online ({clave: {"result", "ts"}})"""
+        if self._online_cache is None:
+            cache = {}
+            try:
+                if os.path.exists(self.online_cache_file):
+                    with open(self.online_cache_file, 'r', encoding='utf-8') as f:
+                        cache = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Error cargando cache online: {e}")
+            self._online_cache = cache
+        return self._online_cache
+
+    def _save_online_cache(self):
+        """Guardar cache de búsquedas online (escritura atómica)"""
+        try:
+            with self._online_save_lock:
+                with self._online_lock:
+                    data = dict(self._load_online_cache())
+                tmp_file = self.online_cache_file + ".tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, self.online_cache_file)
+        except Exception as e:
+            print(f"⚠️ Error guardando cache online: {e}")
+
+    def _cached_online_entry(self, key: str) -> Optional[Dict]:
+        """Entrada vigente del cache (incluye negativas con result=None) o None."""
+        with self._online_lock:
+            entry = self._load_online_cache().get(key)
+        if not entry:
+            return None
+        ttl = self.online_hit_ttl if entry.get("result") else self.online_miss_ttl
+        if time.time() - entry.get("ts", 0) > ttl:
+            return None
+        return entry
+
+    def _get_cached_online(self, key: str) -> Optional[Dict]:
+        entry = self._cached_online_entry(key)
+        return dict(entry["result"]) if entry and entry.get("result") else None
+
+    def _submit_online(self, mac: str, vendor: str) -> Optional[Future]:
+        """
+        Programar (o reutilizar) la consulta online de (fabricante, OUI).
+        Devuelve None si la respuesta ya está en cache.
+        """
+        key = self._online_key(mac, vendor)
+        if self._cached_online_entry(key) is not None:
+            return None
+
+        with self._online_lock:
+            future = self._online_inflight.get(key)
+            if future is None:
+                if self._online_pool is None:
+                    self._online_pool = ThreadPoolExecutor(max_workers=self.online_max_workers,
+                                                           thread_name_prefix="router-online")
+                future = self._online_pool.submit(self._fetch_online, key, self.get_oui_prefix(mac))
+                self._online_inflight[key] = future
+        return future
+
+    def _wait_host_slot(self, url: str):
+        """Respetar el intervalo mínimo entre consultas al mismo host."""
+        host = urlparse(url).netloc
+        with self._host_lock:
+            now = time.monotonic()
+            slot = max(now, self._host_next_at.get(host, 0.0))
+            self._host_next_at[host] = slot + self.online_min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _fetch_online(self, key: str, oui: str) -> Optional[Dict]:
+        """Consulta real (en el pool). Solo cachea respuestas definitivas."""
+        result = None
+        cacheable = False
+        try:
+            url = self.online_api_url.format(oui=oui)
+            self._wait_host_slot(url)
+            response = self.session.get(url, timeout=self.online_timeout)
+
             if response.status_code == 200:
                 vendor_details = response.text
                 # Intentar inferir modelo del nombre del fabricante
                 inferred_model = self._infer_model_from_vendor_name(vendor_details)
                 if inferred_model:
-                    return {
+                    result = {
                         "model": inferred_model["model"],
                         "max_devices": inferred_model["max_devices"],
                         "wifi_standard": inferred_model.get("wifi_standard", "Unknown"),
                         "confidence": "low",
                         "source": "online_api"
                     }
-        except:
-            pass
-        
-        return None
+                cacheable = True
+            elif response.status_code == 404:
+                # OUI desconocido para la API: resultado negativo
+                cacheable = True
+        except Exception as e:
+            print(f"⚠️ Error consultando {oui} online: {e}")
+        finally:
+            with self._online_lock:
+                if cacheable:
+                    self._load_online_cache()[key] = {"result": result, "ts": time.time()}
+                self._online_inflight.pop(key, None)
+
+        if cacheable:
+            self._save_online_cache()
+        return result
     
     def _infer_model_from_vendor_name(self, vendor_name: str) -> Optional[Dict]:
         """Inferir modelo basado en nombre del fabricante"""
@@ -153,6 +327,12 @@ class RouterModelDetector:
         Returns:
             Dict con información del router
         """
+        cache_key = (mac or "").upper()
+        with self._results_lock:
+            cached = self._results.get(cache_key)
+        if cached and cached[0] == vendor and cached[1] == wifi_technology:
+            return dict(cached[2], sources=list(cached[2]["sources"]))
+
         print(f"🔍 Analizando router: {vendor} - {mac}")
         
         result = {
@@ -192,11 +372,14 @@ class RouterModelDetector:
             result["wifi_standard"] = wifi_technology
         
         # Método 4: Búsqueda online como último recurso
+        online_settled = True
         if result["model"] == "No detectado" and vendor and vendor != "Desconocido":
             online_info = self.search_online_info(mac, vendor)
             if online_info:
                 result.update(online_info)
                 result["sources"].append("online_search")
+            # Sin entrada en cache la consulta no terminó (timeout, error de red)
+            online_settled = self._cached_online_entry(self._online_key(mac, vendor)) is not None
         
         # Ajustar capacidad para uso real
         result["max_devices"] = self._adjust_real_capacity(result["max_devices"])
@@ -206,7 +389,43 @@ class RouterModelDetector:
         
         print(f"✅ Resultado: {result['model']} - {result['max_devices']} dispositivos")
         
+        # Un resultado sin la respuesta online se vuelve a calcular en el próximo escaneo
+        if online_settled:
+            with self._results_lock:
+                self._results[cache_key] = (vendor, wifi_technology, dict(result, sources=list(result["sources"])))
+        
         return result
+
+    def detect_many(self, redes: List[Dict]) -> Dict[str, Dict]:
+        """
+        Resolver en una sola pasada los routers de varias redes escaneadas.
+        
+        Args:
+            redes: Registros del escaneo (usa "BSSID", "Fabricante" y "Tecnologia")
+            
+        Returns:
+            Dict {BSSID: información del router}
+        """
+        self._ensure_index()
+
+        # Lanzar en paralelo las búsquedas online que harán falta (método 4)
+        for red in redes:
+            mac, vendor = red.get("BSSID"), red.get("Fabricante") or ""
+            if (mac and vendor and vendor != "Desconocido" and
+                    self._vendor_key(vendor) not in self._vendor_index):
+                self._submit_online(mac, vendor)
+
+        results = {}
+        for red in redes:
+            mac = red.get("BSSID")
+            if not mac or mac in results:
+                continue
+            try:
+                results[mac] = self.detect_router_model_and_capacity(
+                    mac, red.get("Tecnologia", "") or "", red.get("Fabricante", "") or "")
+            except Exception as e:
+                print(f"⚠️ Error analizando router {mac}: {e}")
+        return results
     
     def _adjust_real_capacity(self, theoretical_capacity: int) -> int:
         """Ajustar capacidad teórica a escenario real"""
@@ -222,6 +441,19 @@ class RouterModelDetector:
             "vendors": list(router_models.keys())
         }
 
+# Instancia global
+_router_detector = None
+_router_detector_lock = threading.Lock()
+
+def get_router_detector() -> RouterModelDetector:
+    """Obtener instancia singleton de RouterModelDetector (el índice se carga en el primer uso)"""
+    global _router_detector
+    if _router_detector is None:
+        with _router_detector_lock:
+            if _router_detector is None:
+                _router_detector = RouterModelDetector()
+    return _router_detector
+
 # Función de conveniencia
 def get_router_info(mac: str, wifi_tech: str = "", vendor: str = "") -> Dict:
     """
@@ -235,14 +467,26 @@ def get_router_info(mac: str, wifi_tech: str = "", vendor: str = "") -> Dict:
     Returns:
         Dict con modelo y capacidad
     """
-    detector = RouterModelDetector()
+    detector = get_router_detector()
     return detector.detect_router_model_and_capacity(mac, wifi_tech, vendor)
 
+def get_routers_info(redes: List[Dict]) -> Dict[str, Dict]:
+    """
+    Obtener información de los routers de todas las redes escaneadas
+    
+    Args:
+        redes: Registros del escaneo con "BSSID", "Fabricante" y "Tecnologia"
+        
+    Returns:
+        Dict {BSSID: modelo y capacidad}
+    """
+    return get_router_detector().detect_many(redes)
+
 # Ejemplo de uso
 if __name__ == "__main__":
     print("🚀 Probando detector de modelos de routers...")
     
-    detector = RouterModelDetector()
+    detector = get_router_detector()
     stats = detector.get_database_stats()
     print(f"📊 Base de datos: {stats['total_vendors']} fabricantes, {stats['total_models']} modelos")
     
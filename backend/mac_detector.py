@@ -8,10 +8,41 @@ import subprocess
 import platform
 import re
 import socket
-from typing import Dict, Optional, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, List, Tuple
 from network_status import get_connected_wifi_info, is_connected_to_network
 
+
+class _NetworkSnapshot:
+    """
+    Foto de la red (vecinos, ARP, gateway, redes WiFi) para una sola detección.
+    Cada fuente se consulta como mucho una vez aunque varios métodos la pidan.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key: str, loader: Callable):
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._values:
+                try:
+                    self._values[key] = loader()
+                except Exception as e:
+                    print(f"⚠️ [MACDetector] Error leyendo {key}: {e}")
+                    self._values[key] = None
+            return self._values[key]
+
+
 class MACDetector:
+    # Segundos durante los que un resultado memorizado se da por bueno sin volver a leer el enlace
+    MEMO_TTL = 60.0
+
     def __init__(self):
         self.original_mac_cache = {}
         self.system = platform.system().lower()
@@ -28,6 +59,21 @@ class MACDetector:
             print(f"🔍 [MACDetector] Iniciando detección para SSID: {target_ssid}")
             print(f"🔍 [MACDetector] Sistema: {self.system}")
             
+            # Resultado memorizado: sin consultar el enlace mientras esté fresco, y
+            # tras caducar solo se reutiliza si el enlace (SSID/BSSID conectado) no cambió
+            cache_key = ((target_ssid or '').strip().lower(), (target_bssid or '').upper())
+            cached = self.original_mac_cache.get(cache_key)
+            if cached and time.monotonic() - cached[2] < self.MEMO_TTL:
+                print(f"🔍 [MACDetector] Usando resultado memorizado para {target_ssid}")
+                return dict(cached[1])
+
+            current_wifi = get_connected_wifi_info()
+            link = (current_wifi.get('ssid'), current_wifi.get('bssid')) if current_wifi.get('bssid') else None
+            if cached and link and cached[0] == link:
+                print(f"🔍 [MACDetector] Enlace sin cambios, renovando resultado memorizado para {target_ssid}")
+                self.original_mac_cache[cache_key] = (link, cached[1], time.monotonic())
+                return dict(cached[1])
+            
             # Verificar que estamos conectados a la red específica
             if not is_connected_to_network(target_ssid, target_bssid):
                 return {
@@ -38,8 +84,7 @@ class MACDetector:
                     'error': 'No conectado a la red objetivo'
                 }
             
-            # Obtener información actual de la conexión
-            current_wifi = get_connected_wifi_info()
+            # Información actual de la conexión (ya obtenida arriba)
             current_mac = current_wifi.get('bssid')
             current_ssid = current_wifi.get('ssid')
             
@@ -60,13 +105,13 @@ class MACDetector:
             
             if not is_random_mac:
                 # Si no es aleatoria, retornar la misma MAC
-                return {
+                return self._remember(cache_key, link, {
                     'original_mac': current_mac,
                     'current_mac': current_mac,
                     'is_random': False,
                     'confidence': 'alto',
                     'note': 'MAC no parece ser aleatoria'
-                }
+                })
             
             # Si es MAC aleatoria, intentar detectar la MAC original
             print(f"🔍 [MACDetector] Buscando MAC original para MAC aleatoria: {current_mac}")
@@ -74,25 +119,25 @@ class MACDetector:
             
             if original_mac and original_mac != current_mac:
                 print(f"🔍 [MACDetector] MAC original encontrada: {original_mac}")
-                return {
+                return self._remember(cache_key, link, {
                     'original_mac': original_mac,
                     'current_mac': current_mac,
                     'is_random': True,
                     'confidence': 'alto',
                     'note': 'MAC original detectada exitosamente'
-                }
+                })
             else:
                 # Si no se puede detectar, hacer una estimación basada en patrones comunes
                 estimated_mac = self._estimate_original_mac(target_ssid)
                 print(f"🔍 [MACDetector] MAC estimada: {estimated_mac}")
                 
-                return {
+                return self._remember(cache_key, link, {
                     'original_mac': estimated_mac,
                     'current_mac': current_mac,
                     'is_random': True,
                     'confidence': 'medio' if estimated_mac else 'bajo',
                     'note': 'MAC estimada basada en patrones comunes' if estimated_mac else 'No se pudo detectar MAC original'
-                }
+                })
                 
         except Exception as e:
             print(f"❌ [MACDetector] Error: {e}")
@@ -104,6 +149,12 @@ class MACDetector:
                 'error': f'Error en detección: {str(e)}'
             }
     
+    def _remember(self, cache_key: Tuple[str, str], link: Optional[Tuple[str, str]], result: Dict) -> Dict:
+        """Memoriza el resultado para (SSID, BSSID) ligado al enlace actual."""
+        if link:
+            self.original_mac_cache[cache_key] = (link, dict(result), time.monotonic())
+        return result
+    
     def _is_random_mac_by_pattern(self, mac: str) -> bool:
         """Verifica si una MAC es aleatoria solo por patrones (sin vendor lookup)."""
         try:
@@ -142,6 +193,8 @@ class MACDetector:
     def _find_original_mac(self, ssid: str, current_mac: str) -> Optional[str]:
         """
         Busca la MAC original usando múltiples métodos.
+        Todos los métodos trabajan sobre una misma foto de la red y se ejecutan
+        en paralelo; se retorna en cuanto un método de confianza alta responde.
         """
         methods = [
             self._scan_arp_table,
@@ -149,85 +202,98 @@ class MACDetector:
             self._check_gateway_mac,
             self._scan_wifi_networks,
         ]
-        
-        for method in methods:
-            try:
-                result = method(ssid, current_mac)
+        high_confidence = {self._scan_arp_table.__name__, self._check_gateway_mac.__name__}
+
+        snapshot = _NetworkSnapshot()
+        results: Dict[str, str] = {}
+
+        executor = ThreadPoolExecutor(max_workers=len(methods))
+        try:
+            futures = {executor.submit(method, ssid, current_mac, snapshot): method.__name__
+                       for method in methods}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️ [MACDetector] Error en método {name}: {e}")
+                    continue
+
                 if result and self._validate_mac_candidate(result, current_mac):
-                    return result
-            except Exception as e:
-                print(f"⚠️ [MACDetector] Error en método {method.__name__}: {e}")
-                continue
-        
+                    if name in high_confidence:
+                        return result
+                    results[name] = result
+        finally:
+            # No esperar a los métodos lentos (p. ej. iwlist) si ya hay respuesta
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Sin respuesta de alta confianza: respetar el orden de prioridad original
+        for method in methods:
+            if method.__name__ in results:
+                return results[method.__name__]
+
         return None
-    
-    def _scan_arp_table(self, ssid: str, current_mac: str) -> Optional[str]:
-        """Escanea la tabla ARP para encontrar dispositivos en la red."""
+
+    def _read_ip_neighbors(self) -> List[Tuple[str, str, str]]:
+        """Lee `ip neighbor show` una vez: [(ip, mac, estado)]."""
+        entries = []
+        result = subprocess.run(['ip', 'neighbor', 'show'], capture_output=True, text=True, timeout=5)
+        if result.returncode == 0:
+            for line in result.stdout.split('\n'):
+                parts = line.split()
+                if len(parts) >= 5 and 'lladdr' in parts:
+                    idx = parts.index('lladdr')
+                    if idx + 1 < len(parts):
+                        state = parts[-1] if parts[-1].isupper() else ''
+                        entries.append((parts[0], parts[idx + 1].upper(), state))
+        return entries
+
+    def _read_arp_table(self) -> List[Tuple[str, str]]:
+        """Lee `arp -a` una vez: [(ip, mac)]."""
+        entries = []
+        if self.is_windows:
+            result = subprocess.run(['arp', '-a'], capture_output=True, text=True,
+                                   encoding='cp850', errors='replace', timeout=5)
+            if result.returncode == 0:
+                for line in result.stdout.split('\n'):
+                    match = re.search(r'(\d+\.\d+\.\d+\.\d+)\s+([0-9A-Fa-f-]{17})', line)
+                    if match:
+                        entries.append((match.group(1), match.group(2).replace('-', ':').upper()))
+        else:
+            result = subprocess.run(['arp', '-a'], capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                for line in result.stdout.split('\n'):
+                    # Formato Linux/macOS: ? (192.168.1.1) at 00:11:22:33:44:55 [ether] on wlan0
+                    ip_match = re.search(r'\((\d+\.\d+\.\d+\.\d+)\)', line)
+                    mac_match = re.search(r'at\s+([0-9a-fA-F:]{17})', line)
+                    if ip_match and mac_match:
+                        entries.append((ip_match.group(1), mac_match.group(1).upper()))
+        return entries
+
+    def _scan_arp_table(self, ssid: str, current_mac: str, snapshot: "_NetworkSnapshot") -> Optional[str]:
+        """Busca el gateway (.1/.254) en la tabla ARP de la foto de red."""
         try:
             print(f"🔍 [MACDetector] Escaneando tabla ARP ({self.system})...")
             
-            if self.is_windows:
-                result = subprocess.run(['arp', '-a'], capture_output=True, text=True, 
-                                       encoding='cp850', errors='replace')
-                if result.returncode == 0:
-                    lines = result.stdout.split('\n')
-                    for line in lines:
-                        match = re.search(r'(\d+\.\d+\.\d+\.\d+)\s+([0-9A-Fa-f-]{17})', line)
-                        if match:
-                            ip = match.group(1)
-                            mac = match.group(2).replace('-', ':').upper()
-                            
-                            # Excluir la MAC actual y verificar que no sea aleatoria por patrón
-                            if mac != current_mac and not self._is_random_mac_by_pattern(mac):
-                                # Verificar si es el gateway común
-                                if ip.endswith('.1') or ip.endswith('.254'):
-                                    print(f"🔍 [MACDetector] Encontrado gateway en ARP: {mac} (IP: {ip})")
-                                    return mac
-            
-            else:  # Linux o macOS
+            if not self.is_windows:
                 # Método 1: ip neighbor (más moderno en Linux)
-                try:
-                    result = subprocess.run(['ip', 'neighbor', 'show'], 
-                                           capture_output=True, text=True)
-                    if result.returncode == 0:
-                        lines = result.stdout.split('\n')
-                        for line in lines:
-                            if not line.strip():
-                                continue
-                            parts = line.split()
-                            if len(parts) >= 5:
-                                ip = parts[0]
-                                mac = parts[4].upper()
-                                state = parts[5] if len(parts) > 5 else ''
-                                
-                                # Preferir dispositivos con estado REACHABLE
-                                if (mac != current_mac and 
-                                    not self._is_random_mac_by_pattern(mac) and
-                                    state in ['REACHABLE', 'STALE']):
-                                    # Verificar si es gateway común
-                                    if ip.endswith('.1') or ip.endswith('.254'):
-                                        print(f"🔍 [MACDetector] Gateway en ip neighbor: {mac}")
-                                        return mac
-                except:
-                    pass
-                
-                # Método 2: arp -a (tradicional)
-                result = subprocess.run(['arp', '-a'], capture_output=True, text=True)
-                if result.returncode == 0:
-                    lines = result.stdout.split('\n')
-                    for line in lines:
-                        # Formato Linux/macOS: ? (192.168.1.1) at 00:11:22:33:44:55 [ether] on wlan0
-                        ip_match = re.search(r'\((\d+\.\d+\.\d+\.\d+)\)', line)
-                        mac_match = re.search(r'at\s+([0-9a-fA-F:]{17})', line)
-                        
-                        if ip_match and mac_match:
-                            ip = ip_match.group(1)
-                            mac = mac_match.group(1).upper()
-                            
-                            if mac != current_mac and not self._is_random_mac_by_pattern(mac):
-                                if ip.endswith('.1') or ip.endswith('.254'):
-                                    print(f"🔍 [MACDetector] Gateway en arp -a: {mac}")
-                                    return mac
+                for ip, mac, state in snapshot.get('neighbors', self._read_ip_neighbors) or []:
+                    # Preferir dispositivos con estado REACHABLE
+                    if (mac != current_mac and 
+                        not self._is_random_mac_by_pattern(mac) and
+                        state in ['REACHABLE', 'STALE']):
+                        # Verificar si es gateway común
+                        if ip.endswith('.1') or ip.endswith('.254'):
+                            print(f"🔍 [MACDetector] Gateway en ip neighbor: {mac}")
+                            return mac
+            
+            # Método 2: arp -a (tradicional / Windows)
+            for ip, mac in snapshot.get('arp', self._read_arp_table) or []:
+                # Excluir la MAC actual y verificar que no sea aleatoria por patrón
+                if mac != current_mac and not self._is_random_mac_by_pattern(mac):
+                    if ip.endswith('.1') or ip.endswith('.254'):
+                        print(f"🔍 [MACDetector] Gateway en arp -a: {mac} (IP: {ip})")
+                        return mac
             
             return None
             
@@ -235,33 +301,20 @@ class MACDetector:
             print(f"❌ [MACDetector] Error en _scan_arp_table: {e}")
             return None
     
-    def _scan_network_neighbors(self, ssid: str, current_mac: str) -> Optional[str]:
-        """Escanea vecinos de red usando diferentes herramientas."""
+    def _scan_network_neighbors(self, ssid: str, current_mac: str, snapshot: "_NetworkSnapshot") -> Optional[str]:
+        """Busca cualquier vecino universal alcanzable en la foto de red."""
         try:
             if not self.is_linux:
                 return None  # Este método es principalmente para Linux
             
             print("🔍 [MACDetector] Escaneando vecinos de red (Linux)...")
             
-            # Usar ip neighbor con más opciones
-            result = subprocess.run(['ip', '-br', 'neigh', 'show'], capture_output=True, text=True)
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if not line.strip():
-                        continue
-                    
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        ip = parts[0]
-                        mac = parts[2].upper() if len(parts) > 2 else ""
-                        state = parts[3] if len(parts) > 3 else ""
-                        
-                        if (mac and mac != current_mac and 
-                            not self._is_random_mac_by_pattern(mac) and
-                            state in ['REACHABLE', 'STALE']):
-                            print(f"🔍 [MACDetector] Vecino encontrado: {mac} ({state})")
-                            return mac
+            for ip, mac, state in snapshot.get('neighbors', self._read_ip_neighbors) or []:
+                if (mac and mac != current_mac and 
+                    not self._is_random_mac_by_pattern(mac) and
+                    state in ['REACHABLE', 'STALE']):
+                    print(f"🔍 [MACDetector] Vecino encontrado: {mac} ({state})")
+                    return mac
             
             return None
             
@@ -269,19 +322,25 @@ class MACDetector:
             print(f"❌ [MACDetector] Error en _scan_network_neighbors: {e}")
             return None
     
-    def _check_gateway_mac(self, ssid: str, current_mac: str) -> Optional[str]:
+    def _check_gateway_mac(self, ssid: str, current_mac: str, snapshot: "_NetworkSnapshot") -> Optional[str]:
         """Obtiene la MAC del gateway por defecto."""
         try:
             # Obtener gateway
-            gateway_ip = self._get_default_gateway_ip()
+            gateway_ip = snapshot.get('gateway_ip', self._get_default_gateway_ip)
             if not gateway_ip:
                 print("❌ [MACDetector] No se pudo obtener gateway IP")
                 return None
             
             print(f"🔍 [MACDetector] Gateway IP: {gateway_ip}")
             
-            # Intentar obtener MAC del gateway
-            mac = self._get_mac_from_ip(gateway_ip)
+            # Primero en la foto de vecinos; solo si falta, ping + arp
+            known = {}
+            if not self.is_windows:
+                known.update({ip: mac for ip, mac, _ in snapshot.get('neighbors', self._read_ip_neighbors) or []})
+            if gateway_ip not in known:
+                known.update(dict(snapshot.get('arp', self._read_arp_table) or []))
+
+            mac = known.get(gateway_ip) or self._get_mac_from_ip(gateway_ip)
             if mac and mac != current_mac and not self._is_random_mac_by_pattern(mac):
                 print(f"🔍 [MACDetector] Gateway MAC encontrada: {mac}")
                 return mac
@@ -383,98 +442,82 @@ class MACDetector:
         except:
             return None
     
-    def _scan_wifi_networks(self, ssid: str, current_mac: str) -> Optional[str]:
-        """Escanea redes WiFi cercanas para encontrar el mismo SSID con diferente BSSID."""
-        try:
-            target_ssid_clean = ssid.strip().lower()
-            
-            if self.is_windows:
-                result = subprocess.run(['netsh', 'wlan', 'show', 'networks', 'mode=bssid'], 
-                                      capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    def _read_wifi_networks(self) -> List[Tuple[str, str]]:
+        """Escanea las redes WiFi visibles una sola vez: [(ssid, bssid)]."""
+        networks = []
+        
+        if self.is_windows:
+            result = subprocess.run(['netsh', 'wlan', 'show', 'networks', 'mode=bssid'], 
+                                  capture_output=True, text=True, encoding='utf-8', errors='ignore')
+            if result.returncode == 0:
+                line_ssid = None
+                for line in result.stdout.split('\n'):
+                    ssid_match = re.match(r'\s*SSID \d+ : (.*)$', line)
+                    bssid_match = re.match(r'\s*BSSID \d+ : ([0-9A-Fa-f:]+)', line)
+                    if ssid_match:
+                        line_ssid = ssid_match.group(1).strip()
+                    elif bssid_match and line_ssid is not None:
+                        networks.append((line_ssid, bssid_match.group(1).upper()))
+        
+        elif self.is_linux:
+            # Método 1: nmcli (moderno)
+            try:
+                result = subprocess.run(['nmcli', '-t', '-f', 'SSID,BSSID,SIGNAL', 'dev', 'wifi', 'list'], 
+                                      capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
-                    output = result.stdout
-                    
-                    pattern = rf'SSID \d+ : {re.escape(target_ssid_clean)}.*?BSSID \d+ : ([0-9A-Fa-f:]+)'
-                    matches = re.findall(pattern, output, re.IGNORECASE | re.DOTALL)
-                    
-                    for mac in matches:
-                        mac_clean = mac.upper()
-                        if (mac_clean != current_mac and 
-                            not self._is_random_mac_by_pattern(mac_clean) and
-                            self._is_likely_router_mac(mac_clean)):
-                            print(f"🔍 [MACDetector] Encontrada en WiFi scan: {mac_clean}")
-                            return mac_clean
-            
-            elif self.is_linux:
-                # Método 1: nmcli (moderno)
-                try:
-                    result = subprocess.run(['nmcli', '-t', '-f', 'SSID,BSSID,SIGNAL', 'dev', 'wifi', 'list'], 
-                                          capture_output=True, text=True)
-                    if result.returncode == 0:
-                        lines = result.stdout.strip().split('\n')
-                        for line in lines:
-                            parts = line.split(':')
-                            if len(parts) >= 3:
-                                line_ssid = parts[0]
-                                bssid_raw = parts[1]
-                                # Manejar formato con \: en nmcli
-                                bssid = bssid_raw.replace('\\:', ':').upper()
-                                
-                                if (line_ssid.lower() == target_ssid_clean and 
-                                    bssid != current_mac and 
-                                    not self._is_random_mac_by_pattern(bssid)):
-                                    print(f"🔍 [MACDetector] Encontrada con nmcli: {bssid}")
-                                    return bssid
-                except:
-                    pass
-                
-                # Método 2: iwlist (requiere root)
+                    for line in result.stdout.strip().split('\n'):
+                        # Manejar formato con \: en nmcli
+                        parts = line.replace('\\:', '%%COLON%%').split(':')
+                        if len(parts) >= 3:
+                            networks.append((parts[0], parts[1].replace('%%COLON%%', ':').upper()))
+            except:
+                pass
+            
+            # Método 2: iwlist (requiere root), solo si nmcli no devolvió nada
+            if not networks:
                 try:
-                    # Obtener interfaz WiFi
-                    interfaces = subprocess.run(['iw', 'dev'], capture_output=True, text=True)
+                    interfaces = subprocess.run(['iw', 'dev'], capture_output=True, text=True, timeout=5)
                     if interfaces.returncode == 0:
                         for line in interfaces.stdout.splitlines():
                             if 'Interface' in line:
                                 iface = line.split()[-1]
                                 result = subprocess.run(['sudo', 'iwlist', iface, 'scan'], 
-                                                      capture_output=True, text=True)
+                                                      capture_output=True, text=True, timeout=10)
                                 if result.returncode == 0:
-                                    output = result.stdout
-                                    
-                                    # Buscar SSID y BSSID
-                                    lines = output.split('\n')
                                     current_bssid = None
-                                    
-                                    for line in lines:
-                                        if 'Address:' in line:
-                                            current_bssid = line.split(':')[1].strip().upper()
-                                        elif 'ESSID:' in line and current_bssid:
-                                            line_ssid = line.split(':')[1].strip().strip('"')
-                                            if (line_ssid.lower() == target_ssid_clean and 
-                                                current_bssid != current_mac and 
-                                                not self._is_random_mac_by_pattern(current_bssid)):
-                                                print(f"🔍 [MACDetector] Encontrada con iwlist: {current_bssid}")
-                                                return current_bssid
+                                    for scan_line in result.stdout.split('\n'):
+                                        if 'Address:' in scan_line:
+                                            current_bssid = scan_line.split('Address:')[1].strip().upper()
+                                        elif 'ESSID:' in scan_line and current_bssid:
+                                            line_ssid = scan_line.split(':', 1)[1].strip().strip('"')
+                                            networks.append((line_ssid, current_bssid))
                 except:
                     pass
+        
+        elif self.is_macos:
+            result = subprocess.run(['/System/Library/PrivateFrameworks/Apple80211.framework/Versions/Current/Resources/airport', '-s'], 
+                                  capture_output=True, text=True, timeout=10)
+            if result.returncode == 0:
+                for line in result.stdout.split('\n'):
+                    parts = re.split(r'\s+', line.strip())
+                    if len(parts) >= 3:
+                        networks.append((parts[0], parts[1].upper()))
+        
+        return networks
+
+    def _scan_wifi_networks(self, ssid: str, current_mac: str, snapshot: "_NetworkSnapshot") -> Optional[str]:
+        """Busca en la foto de redes WiFi el mismo SSID con diferente BSSID."""
+        try:
+            target_ssid_clean = ssid.strip().lower()
             
-            elif self.is_macos:
-                # macOS
-                result = subprocess.run(['/System/Library/PrivateFrameworks/Apple80211.framework/Versions/Current/Resources/airport', '-s'], 
-                                      capture_output=True, text=True)
-                if result.returncode == 0:
-                    lines = result.stdout.split('\n')
-                    for line in lines:
-                        parts = re.split(r'\s+', line.strip())
-                        if len(parts) >= 3:
-                            line_ssid = parts[0]
-                            bssid = parts[1].upper()
-                            
-                            if (line_ssid.lower() == target_ssid_clean and 
-                                bssid != current_mac and 
-                                not self._is_random_mac_by_pattern(bssid)):
-                                print(f"🔍 [MACDetector] Encontrada en macOS: {bssid}")
-                                return bssid
+            for line_ssid, bssid in snapshot.get('wifi', self._read_wifi_networks) or []:
+                if (line_ssid.strip().lower() == target_ssid_clean and 
+                    bssid != current_mac and 
+                    not self._is_random_mac_by_pattern(bssid)):
+                    if self.is_windows and not self._is_likely_router_mac(bssid):
+                        continue
+                    print(f"🔍 [MACDetector] Encontrada en WiFi scan: {bssid}")
+                    return bssid
             
             return None
             
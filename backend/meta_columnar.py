@@ -0,0 +1,266 @@
+"""
+meta_columnar.py – Metadatos de captura en formato columnar binario.
+
+Alternativa a ``capture_*.jsonl``: cada segmento se guarda como un fichero
+``capture_*.npmeta`` con una cabecera JSON corta seguida de registros NumPy
+de ancho fijo (timestamp entero en ns, MACs empaquetadas en uint64, IPs en 16
+bytes, códigos de protocolo pequeños). Los lotes se añaden al final, así que
+un fichero cortado a mitad sigue siendo legible hasta el último registro
+completo.
+
+``load_meta_dir()`` mapea en memoria todos los segmentos de un directorio de
+rotación para consultas vectorizadas.
+"""
+
+import glob
+import json
+import os
+import socket
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from packet_decoder import parse_headers, format_mac, format_ts
+
+MAGIC = b"ESCMETA1"
+FILE_SUFFIX = ".npmeta"
+_HEADER_ALIGN = 64
+_HEADER_LEN = struct.Struct("<I")
+
+META_DTYPE = np.dtype([
+    ("ts_ns", "<i8"),
+    ("len", "<u4"),
+    ("ip_version", "u1"),
+    ("ip_proto", "u1"),
+    ("l4", "u1"),
+    ("flags", "u1"),
+    ("src_port", "<u2"),
+    ("dst_port", "<u2"),
+    ("src_mac", "<u8"),
+    ("dst_mac", "<u8"),
+    ("src_ip", "S16"),
+    ("dst_ip", "S16"),
+    ("caplen", "<u4"),
+])
+
+# Bits de ``flags``
+FLAG_ETHERNET = 0x01
+
+# Códigos de capa 4 (0 = sin IP)
+L4_CODES = {None: 0, "TCP": 1, "UDP": 2, "ICMP": 3, "OTHER": 4}
+L4_NAMES = {code: name for name, code in L4_CODES.items()}
+
+_V4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+
+def ip_key(ip: str) -> bytes:
+    """IP en texto → clave de 16 bytes (IPv4 como ::ffff:a.b.c.d)."""
+    if ":" in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return _V4_MAPPED + socket.inet_aton(ip)
+
+
+def ip_text(key: bytes, version: int) -> str:
+    key = key.ljust(16, b"\x00")
+    if version == 4:
+        return socket.inet_ntoa(key[12:])
+    return socket.inet_ntop(socket.AF_INET6, key)
+
+
+def mac_key(mac: str) -> int:
+    return int(mac.replace(":", "").replace("-", ""), 16)
+
+
+def encode_batch(frames, linktype: int) -> np.ndarray:
+    """Convierte un lote de tramas ``(ts, wirelen, data)`` en registros ``META_DTYPE``."""
+    rows = []
+    append = rows.append
+    from_bytes = int.from_bytes
+    for ts, wirelen, data in frames:
+        src_mac, dst_mac, version, src_ip, dst_ip, proto, l4, sport, dport, _ = parse_headers(data, linktype)
+        if version == 4:
+            src_ip = _V4_MAPPED + src_ip
+            dst_ip = _V4_MAPPED + dst_ip
+        append((
+            int(round(ts * 1e9)),
+            wirelen,
+            version,
+            proto or 0,
+            L4_CODES[l4],
+            FLAG_ETHERNET if src_mac is not None else 0,
+            sport or 0,
+            dport or 0,
+            from_bytes(src_mac, "big") if src_mac else 0,
+            from_bytes(dst_mac, "big") if dst_mac else 0,
+            src_ip or b"",
+            dst_ip or b"",
+            len(data),
+        ))
+    return np.array(rows, dtype=META_DTYPE)
+
+
+def _write_header(f, iface: Optional[str]):
+    header = json.dumps({
+        "version": 1,
+        "iface": iface,
+        "descr": META_DTYPE.descr,
+    }).encode("utf-8")
+    fixed = len(MAGIC) + _HEADER_LEN.size
+    padded = -(-(fixed + len(header)) // _HEADER_ALIGN) * _HEADER_ALIGN - fixed
+    header = header.ljust(padded, b" ")
+    f.write(MAGIC + _HEADER_LEN.pack(len(header)) + header)
+
+
+def read_header(path: str) -> Tuple[dict, np.dtype, int]:
+    """Devuelve (cabecera, dtype, offset de datos) de un fichero ``.npmeta``."""
+    with open(path, "rb") as f:
+        fixed = f.read(len(MAGIC) + _HEADER_LEN.size)
+        if len(fixed) < len(MAGIC) + _HEADER_LEN.size or not fixed.startswith(MAGIC):
+            raise ValueError(f"Not a columnar metadata file: {path}")
+        (size,) = _HEADER_LEN.unpack(fixed[len(MAGIC):])
+        header = json.loads(f.read(size).decode("utf-8"))
+    dtype = np.dtype([tuple(field) for field in header["descr"]])
+    return header, dtype, len(fixed) + size
+
+
+class ColumnarMetaSink:
+    """Etapa de metadatos columnar para el colector (misma interfaz que JsonlMetaSink)."""
+
+    name = "meta"
+    compressible = False    # se lee con memmap
+
+    def __init__(self, iface):
+        self.iface = iface
+        self._f = None
+        self.path = None
+        self.records = 0
+
+    def open(self, base):
+        self.path = base + FILE_SUFFIX
+        self._f = open(self.path, "wb", buffering=1 << 20)
+        _write_header(self._f, self.iface)
+
+    def write(self, batch):
+        records = encode_batch(batch.frames, batch.linktype)
+        if len(records):
+            self._f.write(records.tobytes())
+            self._f.flush()
+            self.records += len(records)
+
+    def sync(self):
+        if self._f:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+
+def load_segment(path: str) -> Tuple[dict, np.ndarray]:
+    """Mapea en memoria un segmento; ignora un último registro incompleto."""
+    header, dtype, offset = read_header(path)
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count <= 0:
+        return header, np.empty(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+class MetaDirectory:
+    """Vista de todos los segmentos columnar de un directorio de rotación."""
+
+    def __init__(self, segments: List[Tuple[str, dict, np.ndarray]]):
+        self.segments = segments
+
+    def __len__(self):
+        return sum(len(arr) for _, _, arr in self.segments)
+
+    def column(self, name: str) -> np.ndarray:
+        cols = [arr[name] for _, _, arr in self.segments]
+        return np.concatenate(cols) if cols else np.empty(0, dtype=META_DTYPE[name])
+
+    def concat(self) -> np.ndarray:
+        arrays = [arr for _, _, arr in self.segments]
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=META_DTYPE)
+
+    def filter(self, **conditions) -> np.ndarray:
+        """Registros que cumplen igualdades, p. ej. ``filter(l4="TCP", dst_port=443)``.
+
+        Las IPs y MACs pueden darse en texto; el filtrado se hace segmento a
+        segmento sobre el mapa en memoria y solo se copian las coincidencias.
+        """
+        wanted = {name: _query_value(name, value) for name, value in conditions.items()}
+        matches = []
+        for _, _, arr in self.segments:
+            if not len(arr):
+                continue
+            mask = np.ones(len(arr), dtype=bool)
+            for name, value in wanted.items():
+                mask &= arr[name] == value
+            if mask.any():
+                matches.append(np.asarray(arr[mask]))
+        return np.concatenate(matches) if matches else np.empty(0, dtype=META_DTYPE)
+
+    def time_range(self, start_ns: int, end_ns: int) -> np.ndarray:
+        matches = []
+        for _, _, arr in self.segments:
+            if not len(arr):
+                continue
+            ts = arr["ts_ns"]
+            mask = (ts >= start_ns) & (ts < end_ns)
+            if mask.any():
+                matches.append(np.asarray(arr[mask]))
+        return np.concatenate(matches) if matches else np.empty(0, dtype=META_DTYPE)
+
+
+def _query_value(name: str, value):
+    if name in ("src_ip", "dst_ip") and isinstance(value, str):
+        return ip_key(value)
+    if name in ("src_mac", "dst_mac") and isinstance(value, str):
+        return mac_key(value)
+    if name == "l4" and (value is None or isinstance(value, str)):
+        return L4_CODES[value]
+    return value
+
+
+def load_meta_dir(path: str) -> MetaDirectory:
+    segments = []
+    for seg_path in sorted(glob.glob(os.path.join(path, "capture_*" + FILE_SUFFIX))):
+        try:
+            header, arr = load_segment(seg_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Segmento ilegible {seg_path}: {e}")
+            continue
+        segments.append((seg_path, header, arr))
+    return MetaDirectory(segments)
+
+
+def to_meta_dicts(records: np.ndarray, iface: Optional[str] = None) -> List[Dict]:
+    """Convierte registros columnar a los dicts del formato JSONL."""
+    out = []
+    has_caplen = "caplen" in (records.dtype.names or ())
+    for rec in records:
+        meta = {"ts": format_ts(int(rec["ts_ns"]) / 1e9), "len": int(rec["len"]), "iface": iface}
+        if has_caplen and rec["caplen"] < rec["len"]:
+            meta["caplen"] = int(rec["caplen"])
+        if rec["flags"] & FLAG_ETHERNET:
+            meta["src_mac"] = format_mac(int(rec["src_mac"]).to_bytes(6, "big"))
+            meta["dst_mac"] = format_mac(int(rec["dst_mac"]).to_bytes(6, "big"))
+        version = int(rec["ip_version"])
+        if not version:
+            meta["note"] = "non-ip"
+            out.append(meta)
+            continue
+        meta["src_ip"] = ip_text(bytes(rec["src_ip"]), version)
+        meta["dst_ip"] = ip_text(bytes(rec["dst_ip"]), version)
+        meta["ip_proto"] = int(rec["ip_proto"])
+        l4 = L4_NAMES.get(int(rec["l4"]))
+        if l4 in ("TCP", "UDP"):
+            meta["src_port"] = int(rec["src_port"])
+            meta["dst_port"] = int(rec["dst_port"])
+        if l4:
+            meta["l4"] = l4
+        out.append(meta)
+    return out
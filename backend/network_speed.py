@@ -1,13 +1,16 @@
 # network_speed.py
+import asyncio
 import json
 from datetime import datetime
 import socket
 import platform
 import sys
 import os
-import time
 import subprocess
 
+from throughput_test import ThroughputTest, parse_target
+from latency_test import bufferbloat_ms, link_quality, probe_many
+
 # ==============================================
 # DETECCIÓN DE ENTORNO
 # ==============================================
@@ -15,16 +18,98 @@ SYSTEM = platform.system().lower()
 IS_LINUX = SYSTEM == "linux"
 IS_WINDOWS = SYSTEM == "windows"
 
-def test_network_speed():
+# Servidor propio de throughput (throughput_test.py --server), "host[:puerto]"
+SPEED_SERVER_ENV = "ESCANER_SPEED_SERVER"
+
+
+def native_speed_test(target, streams=4, duration=8.0, warmup=2.0, cancel_event=None):
+    """
+    Test con el motor propio (N flujos TCP en paralelo) contra un servidor
+    throughput_test.py, con latencia en reposo y bajo carga.
+    Devuelve el mismo diccionario que test_network_speed.
+    """
+    host, port = parse_target(target)
+    print(f"📡 Test nativo contra {host}:{port} ({streams} flujos)...")
+    test = ThroughputTest(host, port, streams=streams, duration=duration,
+                          warmup=warmup, cancel_event=cancel_event)
+    res = asyncio.run(link_quality(test))
+    idle = res["idle"]
+    if not idle.get("received"):
+        raise OSError(f"sin respuesta de {host}:{port}")
+    download = res.get("download", {})
+    upload = res.get("upload", {})
+    loaded = [r["latency"] for r in (download, upload) if r.get("latency", {}).get("received")]
+    worst = max(loaded, key=lambda l: l["p50_ms"]) if loaded else {}
+    result = {
+        "success": not res["cancelled"],
+        "timestamp": datetime.now().isoformat(),
+        "ping_ms": round(idle["p50_ms"], 1),
+        "download_mbps": download.get("mbps", 0.0),
+        "upload_mbps": upload.get("mbps", 0.0),
+        "method": "native_tcp",
+        "message": "Test cancelado" if res["cancelled"] else f"Test completado contra {host}:{port}",
+        "server": f"{host}:{port}",
+        "streams": {
+            "download": [s["mbps"] for s in download.get("streams", [])],
+            "upload": [s["mbps"] for s in upload.get("streams", [])],
+        },
+        "cancelled": res["cancelled"],
+    }
+    result.update(_latency_fields(idle))
+    result["latency"] = {"idle": idle, "download": download.get("latency", {}),
+                         "upload": upload.get("latency", {})}
+    if worst:
+        result["loaded_ping_ms"] = worst["p50_ms"]
+        result["loaded_p99_ms"] = worst.get("p99_ms")
+        result["loaded_loss_pct"] = max(l["loss_pct"] for l in loaded)
+        result["bufferbloat_ms"] = bufferbloat_ms(idle, worst)
+    return result
+
+
+def _latency_fields(summary):
+    """Campos planos de latencia para el diccionario de resultado."""
+    return {
+        "ping_p50_ms": summary.get("p50_ms"),
+        "ping_p90_ms": summary.get("p90_ms"),
+        "ping_p99_ms": summary.get("p99_ms"),
+        "jitter_ms": summary.get("jitter_ms"),
+        "loss_pct": summary.get("loss_pct", 100.0),
+    }
+
+
+def speed_server(target=None):
+    """Servidor de throughput a usar: ``target`` o la variable ESCANER_SPEED_SERVER (None si no hay)."""
+    return target or os.environ.get(SPEED_SERVER_ENV) or None
+
+
+def test_network_speed(target=None, streams=4, cancel_event=None, duration=8.0, warmup=2.0,
+                       native_only=False):
     """
     Mide la velocidad de internet.
-    Funciona con speedtest-cli (comando) o módulo speedtest.
+    Si hay servidor propio (target o variable ESCANER_SPEED_SERVER) usa el
+    motor nativo multi-flujo; si no, speedtest-cli (comando) o módulo speedtest.
+    Con ``native_only`` no se cae a esos métodos (los tests cortos programados
+    no deben lanzar un speedtest completo).
     """
+    target = speed_server(target)
+    error = "Sin servidor de throughput configurado"
+    if target:
+        try:
+            return native_speed_test(target, streams=streams, duration=duration,
+                                     warmup=warmup, cancel_event=cancel_event)
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            print(f"⚠️  Servidor de throughput no disponible ({target}): {e}")
+            error = f"Servidor de throughput no disponible: {e}"
+    if native_only:
+        return {"success": False, "error": error, "download_mbps": 0.0,
+                "upload_mbps": 0.0, "ping_ms": 999.0, "method": "native_tcp"}
+
     print("🔍 Verificando conexión a internet...")
     
     # Verificar conexión primero
     try:
-        socket.create_connection(("8.8.8.8", 53), timeout=3)
+        with socket.create_connection(("8.8.8.8", 53), timeout=3):
+            pass
         print("✅ Conectado a internet")
     except:
         return {
@@ -121,29 +206,22 @@ def test_network_speed():
     # MÉTODO 3: Test rápido de ping como último recurso
     print("⚡ Usando método rápido (ping)...")
     try:
-        # Test de ping a servidores confiables
+        # Sondas TCP en paralelo a servidores confiables (se cierran al conectar)
         servers = [
-            ("Google DNS", "8.8.8.8"),
-            ("Cloudflare", "1.1.1.1"),
-            ("Google", "google.com")
+            ("Google DNS", "8.8.8.8", 443),
+            ("Cloudflare", "1.1.1.1", 443),
+            ("Google", "google.com", 443)
         ]
-        
-        pings = []
-        for name, server in servers:
-            try:
-                start = time.time()
-                socket.create_connection((server, 80), timeout=3)
-                end = time.time()
-                ping_ms = round((end - start) * 1000, 1)
-                pings.append(ping_ms)
-                print(f"   {name}: {ping_ms} ms")
-            except:
-                continue
-        
-        if not pings:
+        latency = asyncio.run(probe_many([(host, port) for _, host, port in servers], count=10))
+        for name, host, port in servers:
+            target = latency["targets"][f"{host}:{port}"]
+            if target.get("received"):
+                print(f"   {name}: {target['p50_ms']} ms (pérdida {target['loss_pct']}%)")
+
+        if not latency.get("received"):
             raise Exception("No se pudo conectar a ningún servidor")
-        
-        avg_ping = round(sum(pings) / len(pings), 1)
+
+        avg_ping = round(latency["p50_ms"], 1)
         
         # Estimación muy básica basada en ping
         if avg_ping < 30:
@@ -163,7 +241,9 @@ def test_network_speed():
             "download_mbps": round(download_mbps, 2),
             "upload_mbps": round(upload_mbps, 2),
             "method": "ping_estimation",
-            "message": "Estimación basada en ping"
+            "message": "Estimación basada en ping",
+            **_latency_fields(latency),
+            "latency": {"idle": latency},
         }
         
     except Exception as e:
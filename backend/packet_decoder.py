@@ -0,0 +1,340 @@
+"""
+packet_decoder.py – Decodificador de cabeceras a partir de bytes crudos.
+
+Sustituye la disección de scapy (haslayer/getlayer) en el colector: recorre
+Ethernet/VLAN/IPv4/IPv6/TCP/UDP/ICMP con formatos ``struct`` precompilados y
+produce los mismos campos de metadatos que ``_extract_meta_ip``.
+
+Uso como benchmark:
+    python packet_decoder.py captura.pcap [--repeat N]
+"""
+
+import math
+import socket
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_VLAN = (0x8100, 0x88A8, 0x9100)
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_ICMPV6 = 58
+
+# Cabeceras de extensión IPv6 que se saltan para llegar a L4
+_IPV6_EXT = (0, 43, 60)
+_IPV6_FRAG = 44
+
+_ETH = struct.Struct("!6s6sH")
+_VLAN = struct.Struct("!2xH")
+_IPV4 = struct.Struct("!B5xHxB2x4s4s")
+_IPV6 = struct.Struct("!6xBx16s16s")
+_IPV6_EXT_HDR = struct.Struct("!BB")
+_IPV6_FRAG_HDR = struct.Struct("!BxH")
+_PORTS = struct.Struct("!HH")
+
+_L4_NAMES = {PROTO_TCP: "TCP", PROTO_UDP: "UDP", PROTO_ICMP: "ICMP", PROTO_ICMPV6: "ICMP"}
+
+# (timestamp, longitud original, bytes de la trama)
+Frame = Tuple[float, int, bytes]
+
+# (src_mac, dst_mac, versión IP, src_ip, dst_ip, proto, l4, sport, dport, tcp_flags)
+Headers = Tuple[Optional[bytes], Optional[bytes], int, Optional[bytes], Optional[bytes],
+                Optional[int], Optional[str], Optional[int], Optional[int], int]
+_NO_HEADERS = (None, None, 0, None, None, None, None, None, None, 0)
+
+_MAC_CACHE_MAX = 4096
+_mac_cache: Dict[bytes, str] = {}
+_ts_cache = [None, ""]
+
+
+def format_mac(raw: bytes) -> str:
+    mac = _mac_cache.get(raw)
+    if mac is None:
+        mac = raw.hex(":").upper()
+        if len(_mac_cache) >= _MAC_CACHE_MAX:
+            _mac_cache.clear()
+        _mac_cache[raw] = mac
+    return mac
+
+
+def format_ts(ts: float) -> str:
+    """Equivale a ``datetime.utcfromtimestamp(ts).isoformat() + "Z"`` con la parte de segundos cacheada."""
+    frac, sec = math.modf(ts)
+    us = round(frac * 1e6)
+    if us >= 1000000:
+        sec += 1
+        us -= 1000000
+    elif us < 0:
+        sec -= 1
+        us += 1000000
+    sec = int(sec)
+    if _ts_cache[0] != sec:
+        _ts_cache[0] = sec
+        _ts_cache[1] = datetime.utcfromtimestamp(sec).isoformat()
+    if us:
+        return f"{_ts_cache[1]}.{us:06d}Z"
+    return _ts_cache[1] + "Z"
+
+
+def parse_headers(data, linktype: int = LINKTYPE_ETHERNET) -> Headers:
+    """Extrae los campos de cabecera en crudo (bytes/int); None donde no aplica."""
+    src_mac = dst_mac = src_ip = dst_ip = proto = l4 = sport = dport = None
+    version = tcp_flags = 0
+    size = len(data)
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            if size < 14:
+                return _NO_HEADERS
+            dst_mac, src_mac, ethertype = _ETH.unpack_from(data, 0)
+            off = 14
+            while ethertype in ETH_P_VLAN and off + 4 <= size:
+                (ethertype,) = _VLAN.unpack_from(data, off)
+                off += 4
+        elif linktype == LINKTYPE_RAW:
+            off = 0
+            nibble = data[0] >> 4 if size else 0
+            ethertype = ETH_P_IP if nibble == 4 else ETH_P_IPV6 if nibble == 6 else 0
+        else:
+            ethertype = 0
+
+        if ethertype == ETH_P_IP and off + 20 <= size:
+            vihl, frag, proto, src_ip, dst_ip = _IPV4.unpack_from(data, off)
+            version = 4
+            off += (vihl & 0x0F) * 4
+            first_fragment = not frag & 0x1FFF
+        elif ethertype == ETH_P_IPV6 and off + 40 <= size:
+            proto, src_ip, dst_ip = _IPV6.unpack_from(data, off)
+            version = 6
+            off += 40
+            first_fragment = True
+            while off + 8 <= size:
+                if proto in _IPV6_EXT:
+                    proto, ext_len = _IPV6_EXT_HDR.unpack_from(data, off)
+                    off += (ext_len + 1) * 8
+                elif proto == _IPV6_FRAG:
+                    proto, frag = _IPV6_FRAG_HDR.unpack_from(data, off)
+                    first_fragment = not frag & 0xFFF8
+                    off += 8
+                else:
+                    break
+        else:
+            return (src_mac, dst_mac, 0, None, None, None, None, None, None, 0)
+
+        # Igual que scapy: los fragmentos no iniciales no llevan cabecera L4
+        l4 = _L4_NAMES.get(proto, "OTHER") if first_fragment else "OTHER"
+        if l4 in ("TCP", "UDP"):
+            if off + 4 <= size:
+                sport, dport = _PORTS.unpack_from(data, off)
+                if l4 == "TCP" and off + 14 <= size:
+                    tcp_flags = data[off + 13]
+            else:
+                l4 = "OTHER"
+    except (struct.error, ValueError, IndexError):
+        # Trama truncada: se devuelve lo que se haya podido leer
+        pass
+    return (src_mac, dst_mac, version, src_ip, dst_ip, proto, l4, sport, dport, tcp_flags)
+
+
+def decode_frame(ts: float, wirelen: int, data, iface: Optional[str] = None,
+                 linktype: int = LINKTYPE_ETHERNET) -> dict:
+    """Decodifica una trama cruda (bytes o memoryview) a un dict de metadatos."""
+    meta = {"ts": format_ts(ts), "len": wirelen, "iface": iface}
+    if len(data) < wirelen:
+        # Trama truncada por snaplen: "len" sigue siendo la longitud original
+        meta["caplen"] = len(data)
+    src_mac, dst_mac, version, src_ip, dst_ip, proto, l4, sport, dport, _ = parse_headers(data, linktype)
+    if src_mac is not None:
+        meta["src_mac"] = format_mac(src_mac)
+        meta["dst_mac"] = format_mac(dst_mac)
+    if version == 4:
+        meta["src_ip"] = socket.inet_ntoa(src_ip)
+        meta["dst_ip"] = socket.inet_ntoa(dst_ip)
+    elif version == 6:
+        meta["src_ip"] = socket.inet_ntop(socket.AF_INET6, src_ip)
+        meta["dst_ip"] = socket.inet_ntop(socket.AF_INET6, dst_ip)
+    else:
+        meta["note"] = "non-ip"
+        return meta
+    meta["ip_proto"] = proto
+    if sport is not None:
+        meta["src_port"] = sport
+        meta["dst_port"] = dport
+    if l4 is not None:
+        meta["l4"] = l4
+    return meta
+
+
+# (versión IP, src_ip, dst_ip, proto, sport, dport, offset del payload L4)
+L4Payload = Tuple[int, bytes, bytes, int, int, int, int]
+
+
+def parse_l4(data, linktype: int = LINKTYPE_ETHERNET) -> Optional[L4Payload]:
+    """Como ``parse_headers`` pero solo TCP/UDP y con el offset del payload; None si no aplica."""
+    size = len(data)
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            if size < 14:
+                return None
+            (ethertype,) = _VLAN.unpack_from(data, 10)
+            off = 14
+            while ethertype in ETH_P_VLAN and off + 4 <= size:
+                (ethertype,) = _VLAN.unpack_from(data, off)
+                off += 4
+        elif linktype == LINKTYPE_RAW and size:
+            off = 0
+            nibble = data[0] >> 4
+            ethertype = ETH_P_IP if nibble == 4 else ETH_P_IPV6 if nibble == 6 else 0
+        else:
+            return None
+
+        if ethertype == ETH_P_IP and off + 20 <= size:
+            vihl, frag, proto, src_ip, dst_ip = _IPV4.unpack_from(data, off)
+            if frag & 0x1FFF:
+                return None
+            version = 4
+            off += (vihl & 0x0F) * 4
+        elif ethertype == ETH_P_IPV6 and off + 40 <= size:
+            proto, src_ip, dst_ip = _IPV6.unpack_from(data, off)
+            version = 6
+            off += 40
+            while proto in _IPV6_EXT and off + 8 <= size:
+                proto, ext_len = _IPV6_EXT_HDR.unpack_from(data, off)
+                off += (ext_len + 1) * 8
+        else:
+            return None
+
+        if proto == PROTO_UDP and off + 8 <= size:
+            sport, dport = _PORTS.unpack_from(data, off)
+            return version, src_ip, dst_ip, proto, sport, dport, off + 8
+        if proto == PROTO_TCP and off + 20 <= size:
+            sport, dport = _PORTS.unpack_from(data, off)
+            return version, src_ip, dst_ip, proto, sport, dport, off + (data[off + 12] >> 4) * 4
+    except (struct.error, ValueError, IndexError):
+        pass
+    return None
+
+
+def flow_partition(data, linktype: int, partitions: int) -> int:
+    """Partición estable (igual en todos los procesos) y simétrica de la 5-tupla de una trama."""
+    _, _, version, src_ip, dst_ip, proto, _, sport, dport, _ = parse_headers(data, linktype)
+    if not version:
+        return 0
+    a = src_ip + (sport or 0).to_bytes(2, "big")
+    b = dst_ip + (dport or 0).to_bytes(2, "big")
+    key = bytes([proto]) + (a + b if a <= b else b + a)
+    return zlib.crc32(key) % partitions
+
+
+def decode_batch(frames: Iterable[Frame], iface: Optional[str] = None,
+                 linktype: int = LINKTYPE_ETHERNET) -> List[dict]:
+    return [decode_frame(ts, wirelen, data, iface, linktype) for ts, wirelen, data in frames]
+
+
+# ── Lectura de pcap ───────────────────────────────────────────────────────
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+def iter_pcap(path: str) -> Tuple[int, Iterator[Frame]]:
+    """Abre un pcap clásico (también .gz/.zst) y devuelve (linktype, iterador de tramas)."""
+    from segment_store import open_segment_file
+    f = open_segment_file(path, "rb")
+    header = f.read(24)
+    if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+        f.close()
+        raise ValueError(f"Not a pcap file: {path}")
+    endian, scale = _PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+
+    def frames():
+        with f:
+            while True:
+                hdr = f.read(record.size)
+                if len(hdr) < record.size:
+                    return
+                sec, frac, caplen, wirelen = record.unpack(hdr)
+                data = f.read(caplen)
+                if len(data) < caplen:
+                    return
+                yield sec + frac * scale, wirelen, data
+
+    return linktype, frames()
+
+
+def pcap_linktype(path: str) -> int:
+    """Linktype de la cabecera de un pcap (también .gz/.zst) sin leer las tramas."""
+    from segment_store import open_segment_file
+    with open_segment_file(path, "rb") as f:
+        header = f.read(24)
+    if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+        raise ValueError(f"Not a pcap file: {path}")
+    endian, _ = _PCAP_MAGIC[header[:4]]
+    return struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+
+
+def read_pcap(path: str) -> Tuple[int, List[Frame]]:
+    linktype, frames = iter_pcap(path)
+    return linktype, list(frames)
+
+
+def _benchmark(path: str, repeat: int = 3):
+    linktype, frames = read_pcap(path)
+    if not frames:
+        print("⚠️ Pcap vacío")
+        return
+    count = len(frames)
+    print(f"📦 {count} tramas en {path} (linktype {linktype})")
+
+    best = min(_timed(lambda: decode_batch(frames, "bench", linktype)) for _ in range(repeat))
+    print(f"⚡ struct decoder: {best / count * 1e6:.2f} µs/paquete ({count / best:.0f} pps)")
+
+    try:
+        from types import SimpleNamespace
+        from scapy.all import rdpcap
+        from collector import WindowsPacketCollector
+    except ImportError as e:
+        print(f"⚠️ Referencia scapy no disponible: {e}")
+        return
+
+    packets = rdpcap(path)
+    ref = SimpleNamespace(iface="bench")
+    extract = WindowsPacketCollector._extract_meta_ip
+    best_ref = min(_timed(lambda: [extract(ref, p) for p in packets]) for _ in range(repeat))
+    print(f"🐢 scapy _extract_meta_ip: {best_ref / count * 1e6:.2f} µs/paquete ({count / best_ref:.0f} pps)")
+    print(f"📈 Aceleración: x{best_ref / best:.1f}")
+
+    # Comprobar que los campos coinciden
+    fast = decode_batch(frames, "bench", linktype)
+    mismatches = sum(1 for a, p in zip(fast, packets) if a != extract(ref, p))
+    print(f"🔎 Diferencias de metadatos: {mismatches}/{count}")
+
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark del decodificador struct frente a scapy")
+    parser.add_argument("pcap", help="pcap grabado por el colector")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _benchmark(args.pcap, args.repeat)
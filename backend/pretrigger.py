@@ -0,0 +1,159 @@
+"""
+pretrigger.py – Captura pre-disparo: últimos N segundos / M MB de paquetes en memoria.
+
+``PacketRing`` guarda las tramas en un único ``bytearray`` reservado al
+arrancar (sin asignaciones por paquete): cada trama nueva pisa a las más
+antiguas y las que superan la ventana de tiempo se descartan al leer.
+
+Nada se escribe en disco hasta que llega un disparo:
+
+* ``send_trigger()``: datagrama UDP a ``127.0.0.1:<puerto>`` (lo usa NetGuard
+  cuando ``AnomalyDetector.predict`` marca una anomalía);
+* tocar un fichero vigilado (``touch``);
+* llamar a ``collector.trigger()`` desde Python.
+"""
+
+import logging
+import os
+import socket
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+DEFAULT_TRIGGER_PORT = 47470
+
+
+class PacketRing:
+    """Búfer circular preasignado de tramas ``(ts, wirelen, data)``."""
+
+    def __init__(self, max_bytes: int, max_seconds: float = 0.0):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.capacity = int(max_bytes)
+        self.max_seconds = float(max_seconds or 0.0)
+        self._buf = bytearray(self.capacity)
+        # (ts, wirelen, offset, length) en orden de llegada
+        self._records = deque()
+        self._head = 0
+        self._lock = threading.Lock()
+        self.overwritten = 0
+
+    def append(self, ts: float, wirelen: int, data):
+        n = len(data)
+        if n > self.capacity:
+            data, n = data[:self.capacity], self.capacity
+        with self._lock:
+            records = self._records
+            head = self._head
+            if head + n > self.capacity:
+                # No cabe al final: se descarta la cola y se vuelve al principio
+                while records and records[0][2] >= head:
+                    records.popleft()
+                    self.overwritten += 1
+                head = 0
+            end = head + n
+            while records and head <= records[0][2] < end:
+                records.popleft()
+                self.overwritten += 1
+            self._buf[head:end] = data
+            records.append((ts, wirelen, head, n))
+            self._head = end
+            self._expire(ts)
+
+    def _expire(self, now: float):
+        if not self.max_seconds:
+            return
+        records = self._records
+        limit = now - self.max_seconds
+        while records and records[0][0] < limit:
+            records.popleft()
+
+    def snapshot(self, since: Optional[float] = None) -> List[Tuple[float, int, bytes]]:
+        """Copia las tramas retenidas (desde ``since`` si se indica)."""
+        with self._lock:
+            if self._records:
+                self._expire(self._records[-1][0])
+            buf = self._buf
+            return [(ts, wirelen, bytes(buf[off:off + n])) for ts, wirelen, off, n in self._records
+                    if since is None or ts > since]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._head = 0
+
+    @property
+    def bytes_used(self) -> int:
+        return sum(r[3] for r in self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+
+def send_trigger(reason: str = "", port: int = DEFAULT_TRIGGER_PORT, host: str = "127.0.0.1") -> bool:
+    """Pide a un colector en modo pre-disparo que vuelque su ventana. No bloquea ni falla si nadie escucha."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(reason.encode("utf-8")[:1024], (host, port))
+        return True
+    except OSError:
+        return False
+
+
+class TriggerListener:
+    """Escucha disparos externos (UDP local y/o fichero vigilado) y llama a ``on_trigger(reason)``."""
+
+    def __init__(self, on_trigger: Callable[[str], None], port: Optional[int] = None,
+                 watch_file: Optional[str] = None, poll_interval: float = 0.5):
+        self.on_trigger = on_trigger
+        self.port = port
+        self.watch_file = watch_file
+        self.poll_interval = poll_interval
+        self._sock = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.port is not None:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.bind(("127.0.0.1", self.port))
+            self._sock.settimeout(self.poll_interval)
+            self._threads.append(threading.Thread(target=self._socket_worker, daemon=True))
+            logging.info("Trigger socket on udp://127.0.0.1:%d", self._sock.getsockname()[1])
+        if self.watch_file:
+            self._threads.append(threading.Thread(target=self._file_worker, daemon=True))
+            logging.info("Trigger file: %s", self.watch_file)
+        for t in self._threads:
+            t.start()
+
+    def _socket_worker(self):
+        while not self._stop_event.is_set():
+            try:
+                data, _ = self._sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.on_trigger(data.decode("utf-8", "replace").strip() or "socket")
+
+    def _file_worker(self):
+        def mtime():
+            try:
+                return os.stat(self.watch_file).st_mtime
+            except FileNotFoundError:
+                return None
+
+        last = mtime()
+        while not self._stop_event.wait(self.poll_interval):
+            current = mtime()
+            if current is not None and current != last:
+                self.on_trigger(f"file:{os.path.basename(self.watch_file)}")
+            last = current
+
+    def stop(self):
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        if self._sock:
+            self._sock.close()
+            self._sock = None
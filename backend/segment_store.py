@@ -0,0 +1,221 @@
+"""
+segment_store.py – Índice de segmentos de captura y compresión en segundo plano.
+
+``SegmentIndex`` mantiene en memoria los segmentos (``capture_<ts>_<n>``) de
+un directorio de salida en orden de creación: se reconstruye con un único
+``os.scandir`` al arrancar y después la retención solo saca el más antiguo,
+sin volver a listar el directorio.
+
+``SegmentCompressor`` comprime los ficheros ya cerrados en un proceso aparte
+(gzip, o zstd si está instalado ``zstandard``) para no frenar la captura.
+"""
+
+import gzip
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+CODECS = ("none", "auto", "gzip", "zstd")
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+_CHUNK = 1 << 20
+
+
+def resolve_codec(codec: str) -> Optional[str]:
+    """Traduce la opción de CLI al códec real (None = sin compresión)."""
+    if codec == "none":
+        return None
+    if codec == "auto":
+        return "zstd" if ZSTD_AVAILABLE else "gzip"
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        raise RuntimeError("zstd compression requires the 'zstandard' package")
+    if codec not in COMPRESSED_SUFFIXES:
+        raise ValueError(f"Unknown codec: {codec}")
+    return codec
+
+
+def compress_file(path: str, codec: str, level: Optional[int] = None) -> Optional[str]:
+    """Comprime ``path`` a ``path + sufijo`` y borra el original. Se ejecuta en otro proceso."""
+    target = path + COMPRESSED_SUFFIXES[codec]
+    tmp = target + ".tmp"
+    try:
+        with open(path, "rb") as src:
+            if codec == "zstd":
+                cctx = zstandard.ZstdCompressor(level=level or 3)
+                with open(tmp, "wb") as dst:
+                    cctx.copy_stream(src, dst, read_size=_CHUNK, write_size=_CHUNK)
+            else:
+                with gzip.open(tmp, "wb", compresslevel=level or 6) as dst:
+                    shutil.copyfileobj(src, dst, _CHUNK)
+    except FileNotFoundError:
+        # La retención borró el segmento antes de comprimirlo
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+    os.replace(tmp, target)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # La retención lo borró mientras se comprimía: la copia comprimida quedaría huérfana
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+        return None
+    return target
+
+
+def open_segment_file(path: str, mode: str = "rb"):
+    """Abre un fichero de segmento, comprimido o no, según su extensión."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    if path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Reading .zst segments requires the 'zstandard' package")
+        f = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+        if "b" in mode:
+            return reader
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, mode)
+
+
+def segment_base(filename: str) -> str:
+    return filename.split(".", 1)[0]
+
+
+class SegmentIndex:
+    """Segmentos de un directorio en orden de creación, con los ficheros de cada uno."""
+
+    def __init__(self, out_dir: str, prefix: str = "capture_"):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        # Solo los segmentos de este escritor: "capture_" no debe recoger los "capture_wNN_"
+        self._name_re = re.compile(re.escape(prefix) + r"\d{8}T\d{6}Z_\d+$")
+        self._segments: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.removed = 0
+
+    def rebuild(self):
+        groups: Dict[str, List[str]] = {}
+        with os.scandir(self.out_dir) as it:
+            for entry in it:
+                base = segment_base(entry.name)
+                if self._name_re.match(base) and not entry.name.endswith(".tmp"):
+                    groups.setdefault(base, []).append(entry.name)
+        with self._lock:
+            self._segments = OrderedDict((base, sorted(groups[base])) for base in sorted(groups))
+
+    def add_segment(self, base: str):
+        with self._lock:
+            self._segments.setdefault(base, [])
+
+    def add_file(self, base: str, filename: str):
+        with self._lock:
+            files = self._segments.get(base)
+            if files is not None and filename not in files:
+                files.append(filename)
+
+    def replace_file(self, base: str, old: str, new: str):
+        with self._lock:
+            files = self._segments.get(base)
+            if files is None:
+                return
+            if old in files:
+                files.remove(old)
+            files.append(new)
+
+    def enforce(self, max_segments: int, stop_at: Optional[str] = None) -> List[str]:
+        """Borra los segmentos más antiguos por encima de ``max_segments``, sin llegar a ``stop_at``."""
+        removed = []
+        while True:
+            with self._lock:
+                if len(self._segments) <= max_segments:
+                    break
+                base = next(iter(self._segments))
+                if base == stop_at:
+                    break               # todavía abierto: él y los siguientes se conservan
+                files = self._segments.pop(base)
+            for name in files:
+                for candidate in [name] + [name + s for s in COMPRESSED_SUFFIXES.values()]:
+                    try:
+                        os.remove(os.path.join(self.out_dir, candidate))
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        print(f"⚠️ No se pudo borrar {candidate}: {e}")
+            removed.append(base)
+            self.removed += 1
+        return removed
+
+    def segments(self) -> List[str]:
+        with self._lock:
+            return list(self._segments)
+
+    def files(self, base: str) -> List[str]:
+        with self._lock:
+            return [os.path.join(self.out_dir, f) for f in self._segments.get(base, [])]
+
+    def __len__(self):
+        return len(self._segments)
+
+
+class SegmentCompressor:
+    """Comprime ficheros cerrados en un proceso aparte y avisa al índice al terminar."""
+
+    def __init__(self, codec: str, level: Optional[int] = None,
+                 on_done: Optional[Callable[[str, str], None]] = None):
+        self.codec = codec
+        self.level = level
+        self.on_done = on_done
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.compressed = 0
+        self.failed = 0
+
+    def submit(self, path: str):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            self._pending += 1
+        future = self._executor.submit(compress_file, path, self.codec, self.level)
+        future.add_done_callback(lambda f, p=path: self._finished(p, f))
+
+    def _finished(self, path: str, future):
+        with self._lock:
+            self._pending -= 1
+        try:
+            target = future.result()
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Error comprimiendo {path}: {e}")
+            return
+        if target:
+            self.compressed += 1
+            if self.on_done:
+                self.on_done(path, target)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
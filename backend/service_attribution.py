@@ -0,0 +1,360 @@
+"""
+service_attribution.py – Atribución pasiva de servicios por DNS y TLS SNI.
+
+Los rangos IP no distinguen servicios que comparten CDN (YouTube y Google,
+Facebook e Instagram...). Esta etapa del colector mira dos cosas que ya
+pasan por la red, sin hacer ninguna consulta activa:
+
+* respuestas DNS (UDP, puerto origen 53): cada IP de un registro A/AAAA se
+  asocia al nombre preguntado, con el TTL del propio registro;
+* ClientHello TLS (TCP, puerto destino 443): la IP destino se asocia al SNI.
+
+``AttributionCache`` guarda IP → (dominio, servicio, caducidad) en un
+``OrderedDict`` acotado (LRU); una consulta es un acceso a diccionario.
+``traffic_classifier.classify_service`` la consulta antes que los rangos CIDR.
+
+La caché vive en el proceso del colector: con ``--attribution --stats-port``
+se publica en ``/attribution`` y ``AttributionSync`` la copia en segundo
+plano a la caché de otro proceso (la arranca ``AccountingClient`` en NetGuard).
+"""
+
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+from capture_health import DEFAULT_STATS_PORT
+from packet_decoder import parse_l4, PROTO_TCP, PROTO_UDP
+
+# Sufijo de dominio → servicio (gana el sufijo más largo)
+SERVICE_DOMAINS = {
+    "youtube.com": "YouTube",
+    "youtu.be": "YouTube",
+    "googlevideo.com": "YouTube",
+    "ytimg.com": "YouTube",
+    "youtube-nocookie.com": "YouTube",
+    "google.com": "Google",
+    "googleapis.com": "Google",
+    "gstatic.com": "Google",
+    "googleusercontent.com": "Google",
+    "gmail.com": "Google",
+    "facebook.com": "Facebook",
+    "facebook.net": "Facebook",
+    "fbcdn.net": "Facebook",
+    "messenger.com": "Facebook",
+    "instagram.com": "Instagram",
+    "cdninstagram.com": "Instagram",
+    "whatsapp.net": "WhatsApp",
+    "whatsapp.com": "WhatsApp",
+    "tiktok.com": "TikTok",
+    "tiktokcdn.com": "TikTok",
+    "tiktokv.com": "TikTok",
+    "byteoversea.com": "TikTok",
+    "ibytedtos.com": "TikTok",
+    "netflix.com": "Netflix",
+    "nflxvideo.net": "Netflix",
+    "nflximg.net": "Netflix",
+    "nflxext.com": "Netflix",
+}
+
+_DNS_HEADER = struct.Struct("!HHHHHH")
+_DNS_RR = struct.Struct("!HHIH")
+_TYPE_A = 1
+_TYPE_CNAME = 5
+_TYPE_AAAA = 28
+
+_domain_cache: Dict[str, Optional[str]] = {}
+_DOMAIN_CACHE_MAX = 8192
+
+
+def domain_service(domain: str) -> Optional[str]:
+    """Servicio de un dominio por su sufijo más largo conocido (``a.b.youtube.com`` → YouTube)."""
+    service = _domain_cache.get(domain, False)
+    if service is not False:
+        return service
+    service = None
+    labels = domain.split(".")
+    for i in range(len(labels) - 1):
+        service = SERVICE_DOMAINS.get(".".join(labels[i:]))
+        if service:
+            break
+    if len(_domain_cache) >= _DOMAIN_CACHE_MAX:
+        _domain_cache.clear()
+    _domain_cache[domain] = service
+    return service
+
+
+def _read_name(msg, off: int) -> Tuple[str, int]:
+    """Nombre DNS (con punteros de compresión) y offset tras el nombre en el mensaje."""
+    labels = []
+    end = None
+    for _ in range(64):
+        length = msg[off]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = off + 2
+            off = ((length & 0x3F) << 8) | msg[off + 1]
+            continue
+        off += 1
+        if not length:
+            break
+        labels.append(bytes(msg[off:off + length]).decode("ascii", "replace"))
+        off += length
+    return ".".join(labels).lower(), end if end is not None else off
+
+
+def parse_dns_answers(msg) -> Iterator[Tuple[str, bytes, int]]:
+    """``(nombre preguntado, IP en bytes, TTL)`` de cada registro A/AAAA de una respuesta DNS."""
+    try:
+        _, flags, qdcount, ancount, _, _ = _DNS_HEADER.unpack_from(msg, 0)
+        if not flags & 0x8000 or flags & 0x000F or not ancount:
+            return      # no es respuesta, o rcode de error
+        off = _DNS_HEADER.size
+        qname = None
+        for _ in range(qdcount):
+            name, off = _read_name(msg, off)
+            qname = qname or name
+            off += 4
+        for _ in range(ancount):
+            name, off = _read_name(msg, off)
+            rtype, _, ttl, rdlen = _DNS_RR.unpack_from(msg, off)
+            off += _DNS_RR.size
+            if rtype == _TYPE_A and rdlen == 4 or rtype == _TYPE_AAAA and rdlen == 16:
+                # Tras una cadena CNAME el nombre útil es el que preguntó el cliente
+                yield qname or name, bytes(msg[off:off + rdlen]), ttl
+            off += rdlen
+    except (IndexError, struct.error):
+        return
+
+
+def parse_tls_sni(payload) -> Optional[str]:
+    """SNI de un ClientHello TLS que empieza en ``payload`` (None si no lo hay o está cortado)."""
+    try:
+        if payload[0] != 0x16 or payload[5] != 0x01:
+            return None
+        off = 9 + 2 + 32                      # cabeceras de registro y handshake, versión, random
+        off += 1 + payload[off]               # session id
+        off += 2 + int.from_bytes(payload[off:off + 2], "big")     # cipher suites
+        off += 1 + payload[off]               # compresión
+        end = off + 2 + int.from_bytes(payload[off:off + 2], "big")
+        off += 2
+        while off + 4 <= end:
+            ext_type = int.from_bytes(payload[off:off + 2], "big")
+            ext_len = int.from_bytes(payload[off + 2:off + 4], "big")
+            off += 4
+            if ext_type == 0:                 # server_name
+                # lista (2) + tipo (1) + longitud (2) + nombre
+                name_len = int.from_bytes(payload[off + 3:off + 5], "big")
+                name = bytes(payload[off + 5:off + 5 + name_len])
+                if len(name) != name_len:
+                    return None
+                return name.decode("ascii", "replace").lower()
+            off += ext_len
+    except IndexError:
+        return None
+    return None
+
+
+class AttributionCache:
+    """IP → (dominio, servicio) con caducidad por TTL y tamaño acotado (LRU)."""
+
+    def __init__(self, max_entries: int = 65536, min_ttl: int = 30, max_ttl: int = 86400,
+                 sni_ttl: int = 3600):
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.sni_ttl = sni_ttl
+        self._entries: "OrderedDict[bytes, Tuple[str, Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dns_answers = 0
+        self.sni_seen = 0
+        self.evicted = 0
+        self.imported = 0
+        self.clock = 0.0            # hora del paquete más reciente observado
+
+    def _store(self, ip: bytes, domain: str, ttl: float, now: float):
+        entry = (domain, domain_service(domain), now + ttl)
+        with self._lock:
+            if now > self.clock:
+                self.clock = now
+            self._entries[ip] = entry
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def observe_dns(self, domain: str, ip: bytes, ttl: int, now: Optional[float] = None):
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        self._store(ip, domain, ttl, time.time() if now is None else now)
+        self.dns_answers += 1
+
+    def observe_sni(self, ip: bytes, domain: str, now: Optional[float] = None):
+        self._store(ip, domain, self.sni_ttl, time.time() if now is None else now)
+        self.sni_seen += 1
+
+    def lookup_raw(self, ip: bytes, now: Optional[float] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        (dominio, servicio) para una IP en bytes (4 o 16), o None.
+        ``now`` debe estar en el mismo reloj que las observaciones (el de los paquetes).
+        """
+        entry = self._entries.get(ip)
+        if entry is not None and entry[2] >= (time.time() if now is None else now):
+            self.hits += 1
+            return entry[0], entry[1]
+        self.misses += 1
+        return None
+
+    def lookup(self, ip: str, now: Optional[float] = None) -> Optional[Tuple[str, Optional[str]]]:
+        try:
+            raw = socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip)
+        except OSError:
+            return None
+        return self.lookup_raw(raw, now)
+
+    def export(self, limit: int = 8192) -> dict:
+        """Las ``limit`` entradas más recientes vigentes, con el TTL restante según el reloj de los paquetes."""
+        with self._lock:
+            clock = self.clock
+            recent = list(self._entries.items())[-limit:]
+        entries = {}
+        for ip, (domain, service, expires) in recent:
+            if expires > clock:
+                family = socket.AF_INET if len(ip) == 4 else socket.AF_INET6
+                entries[socket.inet_ntop(family, ip)] = [domain, service, round(expires - clock, 1)]
+        return {"clock": clock, "entries": entries}
+
+    def merge(self, exported: dict, now: Optional[float] = None) -> int:
+        """Añade las entradas de ``export()`` de otro proceso; caducan a partir de ``now`` (este reloj)."""
+        now = time.time() if now is None else now
+        count = 0
+        for ip, item in (exported.get("entries") or {}).items():
+            try:
+                domain, _, ttl_left = item
+                raw = socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip)
+            except (OSError, TypeError, ValueError):
+                continue
+            self._store(raw, domain, float(ttl_left), now)
+            count += 1
+        self.imported += count
+        return count
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "dns_answers": self.dns_answers,
+            "sni": self.sni_seen,
+            "evicted": self.evicted,
+            "imported": self.imported,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache: Optional[AttributionCache] = None
+
+
+def get_attribution_cache() -> AttributionCache:
+    """Caché compartida del proceso (la alimenta el colector, la consulta traffic_classifier)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AttributionCache()
+    return _default_cache
+
+
+class AttributionSync:
+    """Hilo que copia cada ``interval`` s la caché publicada por el colector en ``/attribution``.
+
+    Las consultas nunca esperan a la red: leen la caché local, que este hilo
+    va rellenando. Si el colector no responde se reintenta en el siguiente ciclo.
+    """
+
+    def __init__(self, cache: Optional[AttributionCache] = None, port: int = DEFAULT_STATS_PORT,
+                 host: str = "127.0.0.1", interval: float = 10.0, timeout: float = 2.0):
+        self.cache = cache if cache is not None else get_attribution_cache()
+        self.url = f"http://{host}:{port}/attribution"
+        self.interval = interval
+        self.timeout = timeout
+        self.last_ok = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def fetch(self) -> int:
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as resp:
+                exported = json.loads(resp.read().decode("utf-8"))
+        except (OSError, ValueError):
+            return 0
+        self.last_ok = time.time()
+        return self.cache.merge(exported)
+
+    def _run(self):
+        while True:
+            self.fetch()
+            if self._stop_event.wait(self.interval):
+                return
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class AttributionSink:
+    """Etapa del colector que alimenta la caché con DNS y SNI; no escribe ficheros."""
+
+    name = "attribution"
+    compressible = False
+
+    def __init__(self, cache: Optional[AttributionCache] = None):
+        self.cache = cache if cache is not None else get_attribution_cache()
+        self.path = None
+        self.records = 0
+
+    def open(self, base):
+        pass
+
+    def write(self, batch):
+        linktype = batch.linktype
+        cache = self.cache
+        for ts, _, data in batch.frames:
+            parsed = parse_l4(data, linktype)
+            if parsed is None:
+                continue
+            _, _, dst_ip, proto, sport, dport, off = parsed
+            if proto == PROTO_UDP and sport == 53:
+                for domain, ip, ttl in parse_dns_answers(memoryview(data)[off:]):
+                    cache.observe_dns(domain, ip, ttl, ts)
+            elif proto == PROTO_TCP and dport == 443 and len(data) > off + 5 and data[off] == 0x16:
+                sni = parse_tls_sni(memoryview(data)[off:])
+                if sni:
+                    cache.observe_sni(dst_ip, sni, ts)
+        self.records += len(batch.frames)
+
+    def stats(self):
+        return self.cache.stats()
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
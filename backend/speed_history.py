@@ -0,0 +1,274 @@
+"""
+speed_history.py – Historial de tests de velocidad y tests programados.
+
+Cada test correcto se guarda con fecha, SSID y BSSID en ``speed_history.json``
+(escritura atómica); las estimaciones por ping no, porque sus velocidades no
+son medidas. La retención está acotada:
+
+* resultados individuales de los últimos ``raw_days`` días, como mucho
+  ``max_entries`` en total;
+* lo que sale de esa ventana se agrega por red y día (media, mínimo y máximo)
+  y se guarda ``daily_days`` días.
+
+``SpeedTestScheduler`` es un hilo opcional que lanza tests cortos cada
+``interval`` segundos, pero solo cuando ``TrafficMonitor`` marca poca carga
+varias muestras seguidas, para no medir (ni molestar) con la red ocupada.
+Solo funciona con servidor de throughput propio (ESCANER_SPEED_SERVER): sin
+él, cada test "corto" sería un speedtest completo que satura el enlace.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from network_speed import test_network_speed, speed_server
+from network_status import get_connected_wifi_info
+
+try:
+    from network.core.monitor import TrafficMonitor
+    MONITOR_OK = True
+except ImportError:
+    MONITOR_OK = False
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "speed_history.json")
+FIELDS = ("download_mbps", "upload_mbps", "ping_ms", "jitter_ms", "loss_pct",
+          "bufferbloat_ms", "method")
+# Métodos que inventan las velocidades a partir del ping: no son resultados
+ESTIMATED_METHODS = ("ping_estimation",)
+
+# Un solo test a la vez (el manual espera, el programado se salta la ronda)
+_test_lock = threading.Lock()
+
+
+def _network_key(bssid: Optional[str], ssid: Optional[str]) -> str:
+    return (bssid or "").upper() or f"ssid:{ssid or ''}"
+
+
+class SpeedHistory:
+    """Resultados recientes por red más agregados diarios, persistidos en JSON."""
+
+    def __init__(self, path: str = HISTORY_FILE, max_entries: int = 500,
+                 raw_days: int = 14, daily_days: int = 180):
+        self.path = path
+        self.max_entries = max_entries
+        self.raw_days = raw_days
+        self.daily_days = daily_days
+        self.entries: List[Dict] = []
+        self.daily: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()      # una escritura del fichero a la vez
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.entries = [e for e in data.get("entries", []) if isinstance(e, dict) and "ts" in e
+                                and e.get("method") not in ESTIMATED_METHODS]
+                self.daily = dict(data.get("daily", {}))
+        except Exception as e:
+            print(f"⚠️ Error cargando historial de velocidad: {e}")
+
+    def _save(self):
+        try:
+            with self._save_lock:
+                with self._lock:
+                    data = {"entries": list(self.entries), "daily": dict(self.daily)}
+                tmp_file = self.path + ".tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, self.path)
+        except Exception as e:
+            print(f"⚠️ Error guardando historial de velocidad: {e}")
+
+    def _fold(self, entry: Dict):
+        """Suma un resultado al agregado diario de su red."""
+        day = datetime.fromtimestamp(entry["ts"]).strftime("%Y-%m-%d")
+        key = f"{entry['key']}|{day}"
+        agg = self.daily.setdefault(key, {
+            "day": day, "key": entry["key"], "ssid": entry.get("ssid"), "bssid": entry.get("bssid"),
+            "count": 0, "download_sum": 0.0, "upload_sum": 0.0, "ping_sum": 0.0,
+            "download_min": None, "download_max": None,
+        })
+        agg["count"] += 1
+        agg["download_sum"] += entry.get("download_mbps") or 0.0
+        agg["upload_sum"] += entry.get("upload_mbps") or 0.0
+        agg["ping_sum"] += entry.get("ping_ms") or 0.0
+        down = entry.get("download_mbps") or 0.0
+        agg["download_min"] = down if agg["download_min"] is None else min(agg["download_min"], down)
+        agg["download_max"] = down if agg["download_max"] is None else max(agg["download_max"], down)
+
+    def _apply_retention(self, now: float):
+        raw_cutoff = now - self.raw_days * 86400
+        keep = [e for e in self.entries if e["ts"] >= raw_cutoff]
+        old = [e for e in self.entries if e["ts"] < raw_cutoff]
+        if len(keep) > self.max_entries:
+            old += keep[:-self.max_entries]
+            keep = keep[-self.max_entries:]
+        for entry in old:
+            self._fold(entry)
+        self.entries = keep
+        day_cutoff = datetime.fromtimestamp(now - self.daily_days * 86400).strftime("%Y-%m-%d")
+        self.daily = {k: v for k, v in self.daily.items() if v["day"] >= day_cutoff}
+
+    def record(self, result: Dict, ssid: Optional[str] = None, bssid: Optional[str] = None,
+               scheduled: bool = False) -> Optional[Dict]:
+        """Guarda un resultado de ``test_network_speed`` (solo si fue correcto y medido)."""
+        if not result.get("success") or result.get("method") in ESTIMATED_METHODS:
+            return None
+        now = time.time()
+        entry = {"ts": now, "key": _network_key(bssid, ssid), "ssid": ssid, "bssid": bssid,
+                 "scheduled": scheduled}
+        entry.update({f: result[f] for f in FIELDS if result.get(f) is not None})
+        with self._lock:
+            self.entries.append(entry)
+            self._apply_retention(now)
+        self._save()
+        return entry
+
+    def _for_network(self, bssid: Optional[str], ssid: Optional[str]) -> List[Dict]:
+        key = _network_key(bssid, ssid)
+        with self._lock:
+            rows = [e for e in self.entries if e["key"] == key]
+            if not rows and ssid:
+                # Misma red por otro punto de acceso (BSSID distinto)
+                rows = [e for e in self.entries if e.get("ssid") == ssid]
+        return rows
+
+    def latest(self, bssid: Optional[str] = None, ssid: Optional[str] = None) -> Optional[Dict]:
+        """Último resultado guardado de la red (o de cualquiera si no se indica)."""
+        if bssid or ssid:
+            rows = self._for_network(bssid, ssid)
+        else:
+            with self._lock:
+                rows = list(self.entries)
+        return rows[-1] if rows else None
+
+    def trend(self, bssid: Optional[str] = None, ssid: Optional[str] = None, last: int = 10) -> Dict:
+        """Últimas descargas de la red y variación (%) de la mitad reciente frente a la anterior."""
+        rows = self._for_network(bssid, ssid)[-last:]
+        values = [e.get("download_mbps", 0.0) for e in rows]
+        change = None
+        if len(values) >= 4:
+            half = len(values) // 2
+            before = sum(values[:half]) / half
+            after = sum(values[half:]) / (len(values) - half)
+            if before > 0:
+                change = round(100.0 * (after - before) / before, 1)
+        return {"download_mbps": values, "count": len(values), "change_pct": change,
+                "avg_mbps": round(sum(values) / len(values), 2) if values else None}
+
+    def daily_summary(self, bssid: Optional[str] = None, ssid: Optional[str] = None) -> List[Dict]:
+        """Agregados diarios de la red, del más antiguo al más reciente."""
+        key = _network_key(bssid, ssid)
+        with self._lock:
+            rows = sorted((v for v in self.daily.values() if v["key"] == key), key=lambda v: v["day"])
+        return [{"day": v["day"], "count": v["count"],
+                 "download_avg": round(v["download_sum"] / v["count"], 2),
+                 "upload_avg": round(v["upload_sum"] / v["count"], 2),
+                 "ping_avg": round(v["ping_sum"] / v["count"], 1),
+                 "download_min": v["download_min"], "download_max": v["download_max"]}
+                for v in rows]
+
+
+_default_history: Optional[SpeedHistory] = None
+
+
+def get_speed_history() -> SpeedHistory:
+    global _default_history
+    if _default_history is None:
+        _default_history = SpeedHistory()
+    return _default_history
+
+
+def measure_and_record(scheduled: bool = False, blocking: bool = True, **kwargs) -> Optional[Dict]:
+    """
+    Ejecuta ``test_network_speed`` y guarda el resultado con la red conectada.
+    Con ``blocking=False`` devuelve None si ya hay otro test en marcha.
+    """
+    if not _test_lock.acquire(blocking):
+        return None
+    try:
+        result = test_network_speed(**kwargs)
+    finally:
+        _test_lock.release()
+    try:
+        wifi = get_connected_wifi_info()
+    except Exception:
+        wifi = {}
+    if wifi.get("connected"):
+        result["ssid"] = wifi.get("ssid")
+        result["bssid"] = wifi.get("bssid")
+    get_speed_history().record(result, result.get("ssid"), result.get("bssid"), scheduled)
+    return result
+
+
+class SpeedTestScheduler:
+    """Hilo que lanza tests cortos periódicos cuando la red está tranquila."""
+
+    def __init__(self, interval: float = 3600.0, check_every: float = 30.0,
+                 quiet_kb: float = 100.0, quiet_samples: int = 3,
+                 duration: float = 3.0, warmup: float = 1.0, streams: int = 2,
+                 target: Optional[str] = None):
+        self.target = speed_server(target)
+        self.interval = interval
+        self.check_every = check_every
+        self.quiet_kb = quiet_kb            # KB/s totales por debajo de los cuales la red está "tranquila"
+        self.quiet_samples = quiet_samples
+        # native_only: si el servidor no responde se salta la ronda, sin caer a speedtest-cli
+        self.test_kwargs = {"target": self.target, "native_only": True,
+                            "duration": duration, "warmup": warmup, "streams": streams}
+        self.monitor = TrafficMonitor() if MONITOR_OK else None
+        self.last_run = get_speed_history().latest()
+        self.last_run = self.last_run["ts"] if self.last_run else 0.0
+        self.last_result: Optional[Dict] = None
+        self._quiet = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_quiet(self) -> bool:
+        """True tras ``quiet_samples`` muestras seguidas con poca carga (sin monitor, siempre)."""
+        if self.monitor is None:
+            return True
+        traffic = self.monitor.get_traffic()
+        self._quiet = self._quiet + 1 if traffic["total_kb"] < self.quiet_kb else 0
+        return self._quiet >= self.quiet_samples
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_every):
+            quiet = self.is_quiet()
+            if time.time() - self.last_run < self.interval or not quiet:
+                continue
+            print("⏱️ Test de velocidad programado (red tranquila)...")
+            try:
+                result = measure_and_record(scheduled=True, blocking=False,
+                                            cancel_event=self._stop_event, **self.test_kwargs)
+            except Exception as e:
+                print(f"⚠️ Error en test programado: {e}")
+                result = None
+            # También tras un fallo: no se reintenta hasta el siguiente intervalo
+            self.last_run = time.time()
+            self._quiet = 0
+            if result is not None:
+                self.last_result = result
+
+    def start(self) -> bool:
+        """Arranca el hilo; False si no hay servidor de throughput configurado."""
+        if not self.target:
+            print("⚠️ Tests programados desactivados: configura ESCANER_SPEED_SERVER")
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
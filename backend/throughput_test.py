@@ -0,0 +1,285 @@
+"""
+throughput_test.py – Test de throughput TCP propio: N flujos paralelos con asyncio.
+
+Un extremo ejecuta el servidor ligero (``python throughput_test.py --server``)
+y el cliente abre ``streams`` conexiones TCP en paralelo contra él. Protocolo
+(una línea de texto por conexión y luego datos en bruto):
+
+* ``DOWN <segundos>``: el servidor envía datos durante esos segundos y cierra;
+* ``UP <segundos>``: el cliente envía, el servidor los descarta.
+
+La medida descarta el arranque de TCP: los primeros ``warmup`` segundos no
+cuentan y la tasa sale de los bytes movidos en la ventana estable siguiente
+(``duration`` segundos). Se informa de la tasa de cada flujo y del total.
+
+Sirve igual para LAN (servidor en otro equipo de la red), WAN (servidor
+propio en internet) o ``127.0.0.1`` como sustituto local para pruebas.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PORT = 47480
+CHUNK_SIZE = 128 * 1024
+MAX_SECONDS = 120.0             # el servidor no atiende peticiones más largas
+_PAYLOAD = bytes(CHUNK_SIZE)
+
+
+# ==============================================
+# SERVIDOR
+# ==============================================
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout=10)
+        parts = line.decode("ascii", "replace").split()
+        if len(parts) != 2 or parts[0] not in ("DOWN", "UP"):
+            return
+        seconds = min(max(float(parts[1]), 0.0), MAX_SECONDS)
+        if parts[0] == "DOWN":
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                writer.write(_PAYLOAD)
+                await writer.drain()
+        else:
+            # Se lee hasta que el cliente cierra (con margen por si no lo hace)
+            end = time.monotonic() + seconds + 10
+            while time.monotonic() < end:
+                data = await asyncio.wait_for(reader.read(CHUNK_SIZE), timeout=end - time.monotonic())
+                if not data:
+                    break
+    except (ConnectionError, asyncio.TimeoutError, ValueError, OSError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def serve(host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+    """Servidor de throughput (corre hasta que se cancela la tarea)."""
+    server = await asyncio.start_server(_handle, host, port)
+    addrs = ", ".join(str(s.getsockname()[:2]) for s in server.sockets)
+    print(f"📡 Servidor de throughput escuchando en {addrs}")
+    async with server:
+        await server.serve_forever()
+
+
+def run_server(host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        print("🛑 Servidor detenido")
+
+
+def start_server_thread(host: str = "127.0.0.1", port: int = 0) -> Tuple[int, Callable[[], None]]:
+    """Servidor en un hilo propio (sustituto local para pruebas): devuelve (puerto, parar)."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(_handle, host, port))
+    bound = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True, name="throughput-server")
+    thread.start()
+
+    def stop():
+        async def close():
+            server.close()
+            await server.wait_closed()
+            # Conexiones que siguen abiertas (p. ej. un UP esperando su margen)
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(close(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+    return bound, stop
+
+
+# ==============================================
+# CLIENTE
+# ==============================================
+class ThroughputTest:
+    """Cliente de N flujos TCP paralelos con ventana de calentamiento y ventana estable.
+
+    ``cancel()`` (o el ``threading.Event`` pasado como ``cancel_event``) se
+    puede usar desde otro hilo: el test se corta y devuelve lo medido hasta
+    ese momento con ``cancelled=True``.
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_PORT, streams: int = 4,
+                 duration: float = 8.0, warmup: float = 2.0, connect_timeout: float = 5.0,
+                 cancel_event: Optional[threading.Event] = None):
+        if streams < 1:
+            raise ValueError("streams must be >= 1")
+        self.host = host
+        self.port = port
+        self.streams = streams
+        self.duration = float(duration)
+        self.warmup = float(warmup)
+        self.connect_timeout = connect_timeout
+        self.cancel_event = cancel_event or threading.Event()
+        self.connect_ms: List[float] = []
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    async def _connect(self, command: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self.connect_timeout)
+        self.connect_ms.append((time.perf_counter() - start) * 1000)
+        writer.write(command.encode("ascii") + b"\n")
+        await writer.drain()
+        return reader, writer
+
+    @staticmethod
+    async def _download(reader: asyncio.StreamReader, counters: List[int], i: int):
+        while True:
+            data = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            counters[i] += len(data)
+
+    @staticmethod
+    async def _upload(writer: asyncio.StreamWriter, counters: List[int], i: int):
+        # Búfer de escritura pequeño: lo contado está ya en el socket, no en memoria
+        writer.transport.set_write_buffer_limits(high=CHUNK_SIZE)
+        while True:
+            writer.write(_PAYLOAD)
+            await writer.drain()
+            counters[i] += CHUNK_SIZE
+
+    async def _wait(self, seconds: float) -> bool:
+        """Espera ``seconds`` salvo cancelación; True si se ha cancelado."""
+        end = time.monotonic() + seconds
+        while not self.cancelled:
+            left = end - time.monotonic()
+            if left <= 0:
+                return False
+            await asyncio.sleep(min(left, 0.1))
+        return True
+
+    async def measure(self, direction: str) -> Dict:
+        """Mide ``download`` o ``upload``; tasas en Mbps (10^6 bits/s) de la ventana estable."""
+        if direction not in ("download", "upload"):
+            raise ValueError(f"unknown direction: {direction}")
+        total = self.warmup + self.duration
+        command = f"{'DOWN' if direction == 'download' else 'UP'} {total + 1:.1f}"
+        conns = await asyncio.gather(*(self._connect(command) for _ in range(self.streams)),
+                                     return_exceptions=True)
+        errors = [c for c in conns if isinstance(c, BaseException)]
+        if errors:
+            for c in conns:
+                if not isinstance(c, BaseException):
+                    c[1].close()
+            raise errors[0]
+        counters = [0] * self.streams
+        worker = self._download if direction == "download" else self._upload
+        tasks = [asyncio.ensure_future(worker(r if direction == "download" else w, counters, i))
+                 for i, (r, w) in enumerate(conns)]
+        try:
+            started = time.monotonic()
+            cancelled = await self._wait(self.warmup)
+            base, base_t = list(counters), time.monotonic()
+            if not cancelled:
+                cancelled = await self._wait(self.duration)
+            end, end_t = list(counters), time.monotonic()
+            failed = [t for t in tasks if t.done() and not t.cancelled() and t.exception()]
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for _, w in conns:
+                w.close()
+            await asyncio.gather(*(w.wait_closed() for _, w in conns), return_exceptions=True)
+
+        if failed:
+            raise failed[0].exception()
+        window = end_t - base_t
+        if window <= 0:
+            # Cancelado durante el calentamiento: lo único que hay es el total
+            base, window = [0] * self.streams, end_t - started
+        per_stream = [
+            {"stream": i, "bytes": end[i] - base[i],
+             "mbps": round((end[i] - base[i]) * 8 / window / 1e6, 2) if window > 0 else 0.0}
+            for i in range(self.streams)
+        ]
+        moved = sum(s["bytes"] for s in per_stream)
+        return {
+            "mbps": round(moved * 8 / window / 1e6, 2) if window > 0 else 0.0,
+            "bytes": moved,
+            "seconds": round(window, 3),
+            "warmup_s": self.warmup,
+            "streams": per_stream,
+            "cancelled": cancelled,
+        }
+
+    async def run_async(self, directions=("download", "upload")) -> Dict:
+        result = {"host": self.host, "port": self.port, "streams": self.streams, "cancelled": False}
+        for direction in directions:
+            if self.cancelled:
+                break
+            result[direction] = await self.measure(direction)
+        result["cancelled"] = self.cancelled
+        if self.connect_ms:
+            result["connect_ms"] = round(min(self.connect_ms), 2)
+        return result
+
+    def run(self, directions=("download", "upload")) -> Dict:
+        """Versión bloqueante (para hilos como ``SpeedTestWorker``)."""
+        return asyncio.run(self.run_async(directions))
+
+
+def parse_target(target: str) -> Tuple[str, int]:
+    """``host``, ``host:puerto`` o ``[ipv6]:puerto`` → (host, puerto)."""
+    target = target.strip()
+    if target.startswith("["):
+        host, _, rest = target[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else DEFAULT_PORT
+    if target.count(":") == 1:
+        host, port = target.split(":")
+        return host, int(port)
+    return target, DEFAULT_PORT
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Test de throughput TCP multi-flujo (cliente y servidor)")
+    parser.add_argument("target", nargs="?", help="servidor host[:puerto] (modo cliente)")
+    parser.add_argument("--server", action="store_true", help="arranca el servidor")
+    parser.add_argument("--bind", default="0.0.0.0", help="dirección de escucha del servidor")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="puerto del servidor")
+    parser.add_argument("--streams", type=int, default=4, help="flujos TCP paralelos")
+    parser.add_argument("--duration", type=float, default=8.0, help="segundos de ventana estable")
+    parser.add_argument("--warmup", type=float, default=2.0, help="segundos de calentamiento descartados")
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.bind, args.port)
+    elif not args.target:
+        parser.error("indica un servidor o usa --server")
+    else:
+        host, port = parse_target(args.target)
+        if ":" not in args.target:
+            port = args.port
+        test = ThroughputTest(host, port, args.streams, args.duration, args.warmup)
+        try:
+            res = test.run()
+        except KeyboardInterrupt:
+            raise SystemExit(1)
+        for direction in ("download", "upload"):
+            if direction in res:
+                r = res[direction]
+                flows = ", ".join(f"{s['mbps']}" for s in r["streams"])
+                print(f"{'📥' if direction == 'download' else '📤'} {direction}: {r['mbps']} Mbps "
+                      f"en {r['seconds']} s ({flows})")
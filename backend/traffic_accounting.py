@@ -0,0 +1,459 @@
+"""
+traffic_accounting.py – Contabilidad continua de tráfico por servicio, host local y ASN remoto.
+
+``TrafficAccounting`` consume los paquetes del colector (etapa
+``AccountingSink``), registros de metadatos (JSONL o columnar) o registros de
+flujo, y mantiene contadores de bytes y paquetes en arrays de tamaño fijo por
+resolución temporal:
+
+* ``1s``: 60 cubos (último minuto)
+* ``1m``: 60 cubos (última hora)
+* ``1h``: 24 cubos (último día)
+
+Cada resolución lleva además el total de su ventana, actualizado al entrar y
+al caducar cada cubo, así que ``top()`` no depende del volumen de tráfico:
+es un ``argpartition`` sobre como mucho ``max_keys`` claves.
+
+El ASN remoto sale de un fichero ip2asn (``ip2asn-v4.tsv`` / ``ip2asn-v6.tsv``
+de iptoasn.com) si existe; si no, se agrupa por red remota (/24 o /48).
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from capture_health import DEFAULT_STATS_PORT
+from meta_columnar import encode_batch, ip_key, ip_text
+from service_attribution import AttributionSync, get_attribution_cache
+from traffic_classifier import ServiceClassifier, get_classifier
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASN_FILES = (os.path.join(_BASE_DIR, "ip2asn-v4.tsv"), os.path.join(_BASE_DIR, "ip2asn-v6.tsv"))
+
+# resolución → (segundos por cubo, número de cubos)
+RESOLUTIONS = {"1s": (1, 60), "1m": (60, 60), "1h": (3600, 24)}
+DIMENSIONS = ("service", "host", "asn")
+
+LOCAL_NETS = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "169.254.0.0/16", "100.64.0.0/10",
+              "127.0.0.0/8", "fc00::/7", "fe80::/10", "::1/128"]
+
+OTHER = "Otros"
+_V4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+
+def load_asn_table(paths: Iterable[str] = ASN_FILES) -> Optional[ServiceClassifier]:
+    """Tabla rango IP → "ASxxxx descripción" desde ficheros TSV de ip2asn (None si no hay)."""
+    labels: List[str] = []
+    label_codes: Dict[str, int] = {}
+    v4, v6 = [], []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) < 3 or parts[2] == "0":
+                    continue        # AS0: no anunciado
+                try:
+                    start = ipaddress.ip_address(parts[0])
+                    end = ipaddress.ip_address(parts[1])
+                except ValueError:
+                    continue
+                label = f"AS{parts[2]} {parts[4]}" if len(parts) > 4 else f"AS{parts[2]}"
+                code = label_codes.get(label)
+                if code is None:
+                    code = label_codes[label] = len(labels)
+                    labels.append(label)
+                (v4 if start.version == 4 else v6).append((int(start), int(end), code))
+    if not labels:
+        return None
+    return ServiceClassifier.from_intervals(labels, v4, v6)
+
+
+class _KeyIndex:
+    """Clave → columna fija; cuando se llena reutiliza columnas sin tráfico en el último día."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.slots: Dict[str, int] = {OTHER: 0}
+        self.names: List[Optional[str]] = [OTHER] + [None] * (max_keys - 1)
+        self._free = list(range(max_keys - 1, 0, -1))
+
+    def slot(self, key: str, reclaim) -> int:
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+        if not self._free:
+            for idle in reclaim():
+                self.slots.pop(self.names[idle], None)
+                self.names[idle] = None
+                self._free.append(int(idle))
+        if not self._free:
+            return 0        # tabla llena: se acumula en "Otros"
+        slot = self._free.pop()
+        self.slots[key] = slot
+        self.names[slot] = key
+        return slot
+
+
+class _Buckets:
+    """Cubos circulares ``[cubo, clave]`` de bytes y paquetes con el total de la ventana."""
+
+    def __init__(self, width: int, count: int, max_keys: int):
+        self.width = width
+        self.count = count
+        self.bytes = np.zeros((count, max_keys), dtype=np.int64)
+        self.packets = np.zeros((count, max_keys), dtype=np.int64)
+        self.window_bytes = np.zeros(max_keys, dtype=np.int64)
+        self.window_packets = np.zeros(max_keys, dtype=np.int64)
+        self.epoch = None       # número del cubo más reciente
+
+    def advance(self, epoch: int):
+        if self.epoch is None:
+            self.epoch = epoch
+            return
+        if epoch <= self.epoch:
+            return
+        # Cada cubo que se reutiliza sale antes del total de la ventana
+        for e in range(self.epoch + 1, min(epoch, self.epoch + self.count) + 1):
+            i = e % self.count
+            self.window_bytes -= self.bytes[i]
+            self.window_packets -= self.packets[i]
+            self.bytes[i] = 0
+            self.packets[i] = 0
+        self.epoch = epoch
+
+    def add(self, epochs: np.ndarray, slots: np.ndarray, nbytes: np.ndarray, npackets: np.ndarray):
+        self.advance(int(epochs.max()))
+        valid = epochs > self.epoch - self.count     # cubos ya caducados se ignoran
+        if not valid.all():
+            epochs, slots, nbytes, npackets = epochs[valid], slots[valid], nbytes[valid], npackets[valid]
+        rows = epochs % self.count
+        np.add.at(self.bytes, (rows, slots), nbytes)
+        np.add.at(self.packets, (rows, slots), npackets)
+        np.add.at(self.window_bytes, slots, nbytes)
+        np.add.at(self.window_packets, slots, npackets)
+
+    def last(self, n: int, now_epoch: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Totales de los últimos ``n`` cubos hasta ``now_epoch``."""
+        self.advance(now_epoch)
+        n = min(n, self.count)
+        rows = [(now_epoch - k) % self.count for k in range(n)]
+        return self.bytes[rows].sum(axis=0), self.packets[rows].sum(axis=0)
+
+
+class _Dimension:
+    def __init__(self, max_keys: int):
+        self.keys = _KeyIndex(max_keys)
+        self.buckets = {name: _Buckets(width, count, max_keys) for name, (width, count) in RESOLUTIONS.items()}
+
+    def _idle_slots(self):
+        day = self.buckets["1h"]
+        idle = np.flatnonzero(day.window_packets == 0)
+        return [s for s in idle if s != 0]
+
+    def add(self, ts: np.ndarray, keys: List[str], inverse: np.ndarray, nbytes, npackets):
+        slot_of = np.array([self.keys.slot(k, self._idle_slots) for k in keys], dtype=np.int64)
+        slots = slot_of[inverse]
+        for b in self.buckets.values():
+            b.add((ts // b.width).astype(np.int64), slots, nbytes, npackets)
+
+
+class TrafficAccounting:
+    """Contadores rodantes por servicio, host local y ASN remoto, con consultas top-K."""
+
+    def __init__(self, local_nets: Iterable[str] = LOCAL_NETS, max_keys: int = 1024,
+                 classifier: Optional[ServiceClassifier] = None, asn_table: Optional[ServiceClassifier] = None,
+                 use_attribution: bool = True):
+        self.local = ServiceClassifier({"local": list(local_nets)})
+        self.classifier = classifier or get_classifier()
+        self.asn_table = asn_table if asn_table is not None else load_asn_table()
+        self.attribution = get_attribution_cache() if use_attribution else None
+        self.dimensions = {name: _Dimension(max_keys) for name in DIMENSIONS}
+        self._lock = threading.Lock()
+        self.packets = 0
+        self.bytes = 0
+        self.upload_bytes = 0
+        self.download_bytes = 0
+        self.attributed = 0         # IPs remotas etiquetadas por DNS/SNI (una por lote)
+        # Reloj de los paquetes: hora del más reciente y cuándo llegó (monotónico)
+        self.clock: Optional[float] = None
+        self._clock_at = 0.0
+
+    # ── Entrada ─────────────────────────────────────────────────────────
+
+    def add_records(self, records: np.ndarray):
+        """Registros ``META_DTYPE`` (meta_columnar): la ruta vectorizada."""
+        records = records[records["ip_version"] != 0]
+        if not len(records):
+            return
+        self.add_arrays(records["ts_ns"] / 1e9, records["src_ip"], records["dst_ip"], records["len"])
+
+    def add_arrays(self, ts: np.ndarray, src: np.ndarray, dst: np.ndarray, nbytes: np.ndarray,
+                   npackets: Optional[np.ndarray] = None):
+        """Acumula eventos: IPs como claves ``S16`` (IPv4 como ::ffff:a.b.c.d)."""
+        ts = np.asarray(ts, dtype=np.float64)
+        nbytes = np.asarray(nbytes, dtype=np.int64)
+        npackets = np.ones(len(ts), dtype=np.int64) if npackets is None else np.asarray(npackets, dtype=np.int64)
+        src = np.asarray(src, dtype="S16")
+        dst = np.asarray(dst, dtype="S16")
+
+        src_local = self.local.codes_many(src) >= 0
+        local = np.where(src_local, src, dst)
+        remote = np.where(src_local, dst, src)
+
+        # Las etiquetas se calculan una vez por IP distinta del lote, no por paquete
+        hosts, host_inv = np.unique(local, return_inverse=True)
+        remotes, remote_inv = np.unique(remote, return_inverse=True)
+        services = self._service_labels(remotes, float(ts.max()))
+        asns = self._asn_labels(remotes)
+
+        with self._lock:
+            newest = float(ts.max())
+            if self.clock is None or newest > self.clock:
+                self.clock = newest
+                self._clock_at = time.monotonic()
+            self.dimensions["service"].add(ts, services, remote_inv, nbytes, npackets)
+            self.dimensions["host"].add(ts, [_key_text(h) for h in hosts], host_inv, nbytes, npackets)
+            self.dimensions["asn"].add(ts, asns, remote_inv, nbytes, npackets)
+            self.packets += int(npackets.sum())
+            self.bytes += int(nbytes.sum())
+            up = int(nbytes[src_local].sum())
+            self.upload_bytes += up
+            self.download_bytes += int(nbytes.sum()) - up
+
+    def _service_labels(self, remotes: np.ndarray, now: float) -> List[str]:
+        """Servicio de cada IP remota; la caché DNS/SNI se consulta con la hora de los paquetes."""
+        names = self.classifier.classify_many(remotes)
+        labels = []
+        for key, name in zip(remotes, names):
+            if self.attribution is not None:
+                # Cuenta en hits/misses de la caché: en el colector son sus únicas consultas
+                hit = self.attribution.lookup_raw(_raw_ip(key), now)
+                if hit and hit[1]:
+                    name = hit[1]
+                    self.attributed += 1
+            labels.append(name)
+        return labels
+
+    def _asn_labels(self, remotes: np.ndarray) -> List[str]:
+        if self.asn_table is not None:
+            return list(self.asn_table.classify_many(remotes))
+        # Sin base ip2asn: la red remota (/24 o /48) hace de agrupación
+        labels = []
+        for key in remotes:
+            raw = bytes(key).ljust(16, b"\x00")
+            if raw[:12] == _V4_MAPPED:
+                labels.append(socket.inet_ntoa(raw[12:15] + b"\x00") + "/24")
+            else:
+                labels.append(socket.inet_ntop(socket.AF_INET6, raw[:6] + b"\x00" * 10) + "/48")
+        return labels
+
+    def add_batch(self, frames, linktype: int):
+        """Tramas crudas del colector."""
+        self.add_records(encode_batch(frames, linktype))
+
+    def add_meta(self, metas: Iterable[dict]):
+        """Dicts de metadatos (formato JSONL del colector)."""
+        ts, src, dst, nbytes = [], [], [], []
+        for m in metas:
+            if "src_ip" not in m:
+                continue
+            ts.append(_parse_ts(m["ts"]))
+            src.append(ip_key(m["src_ip"]))
+            dst.append(ip_key(m["dst_ip"]))
+            nbytes.append(m["len"])
+        if ts:
+            self.add_arrays(np.array(ts), np.array(src, dtype="S16"), np.array(dst, dtype="S16"),
+                            np.array(nbytes))
+
+    def add_flows(self, flows: Iterable[dict]):
+        """Registros de flujo (``*.flows.jsonl``): cada sentido se cuenta en el instante ``last``."""
+        ts, src, dst, nbytes, npackets = [], [], [], [], []
+        for f in flows:
+            when = _parse_ts(f["last"])
+            a, b = ip_key(f["src_ip"]), ip_key(f["dst_ip"])
+            for s, d, nb, np_ in ((a, b, f["bytes"], f["pkts"]), (b, a, f["rbytes"], f["rpkts"])):
+                if np_:
+                    ts.append(when)
+                    src.append(s)
+                    dst.append(d)
+                    nbytes.append(nb)
+                    npackets.append(np_)
+        if ts:
+            self.add_arrays(np.array(ts), np.array(src, dtype="S16"), np.array(dst, dtype="S16"),
+                            np.array(nbytes), np.array(npackets))
+
+    # ── Consultas ───────────────────────────────────────────────────────
+
+    def now(self) -> float:
+        """Hora en el reloj de los paquetes: la del último visto más lo transcurrido desde entonces.
+
+        Con una captura en vivo coincide con ``time.time()``; con un pcap
+        antiguo o reproducido, las consultas ven la ventana de ese pcap.
+        """
+        if self.clock is None:
+            return time.time()
+        return self.clock + (time.monotonic() - self._clock_at)
+
+    def top(self, dimension: str = "service", k: int = 10, resolution: str = "1s",
+            last: Optional[int] = None, metric: str = "bytes", now: Optional[float] = None) -> List[dict]:
+        """Las ``k`` claves con más tráfico en la ventana de ``resolution``.
+
+        Sin ``last`` se usa el total mantenido de la ventana completa (60 s,
+        60 min o 24 h); con ``last`` se suman los últimos N cubos.
+        """
+        dim = self.dimensions[dimension]
+        buckets = dim.buckets[resolution]
+        with self._lock:
+            if buckets.epoch is None:
+                return []
+            epoch = int((self.now() if now is None else now) // buckets.width)
+            if last is None:
+                buckets.advance(epoch)
+                nbytes, npackets = buckets.window_bytes.copy(), buckets.window_packets.copy()
+                span = buckets.width * buckets.count
+            else:
+                nbytes, npackets = buckets.last(last, epoch)
+                span = buckets.width * min(last, buckets.count)
+            names = list(dim.keys.names)
+        values = nbytes if metric == "bytes" else npackets
+        k = min(k, len(values))
+        candidates = np.argpartition(values, -k)[-k:]
+        ranked = candidates[np.argsort(values[candidates])[::-1]]
+        return [
+            {"key": names[i], "bytes": int(nbytes[i]), "packets": int(npackets[i]),
+             "bytes_per_s": round(float(nbytes[i]) / span, 1)}
+            for i in ranked if values[i] > 0 and names[i] is not None
+        ]
+
+    def snapshot(self, k: int = 5, resolution: str = "1s", last: Optional[int] = 10) -> dict:
+        """Top-K de todas las dimensiones (lo que muestra NetGuard en cada tick)."""
+        return {
+            "time": self.now(),
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "upload_bytes": self.upload_bytes,
+            "download_bytes": self.download_bytes,
+            "attributed": self.attributed,
+            "top": {dim: self.top(dim, k, resolution, last) for dim in DIMENSIONS},
+        }
+
+
+def _key_text(key: bytes) -> str:
+    raw = bytes(key).ljust(16, b"\x00")
+    return ip_text(raw, 4 if raw[:12] == _V4_MAPPED else 6)
+
+
+def _raw_ip(key: bytes) -> bytes:
+    raw = bytes(key).ljust(16, b"\x00")
+    return raw[12:] if raw[:12] == _V4_MAPPED else raw
+
+
+def _parse_ts(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class AccountingSink:
+    """Etapa del colector que alimenta ``TrafficAccounting``; no escribe ficheros.
+
+    Con ``upstream`` (la ``AttributionSink``) cada lote pasa primero por la
+    atribución, en el mismo hilo, para que el DNS/SNI de un lote ya cuente
+    al etiquetar ese mismo lote.
+    """
+
+    name = "accounting"
+    compressible = False
+
+    def __init__(self, accounting: TrafficAccounting, upstream=None):
+        self.accounting = accounting
+        self.upstream = upstream
+        self.path = None
+        self.records = 0
+
+    def open(self, base):
+        pass
+
+    def write(self, batch):
+        if self.upstream is not None:
+            self.upstream.write(batch)
+        self.accounting.add_batch(batch.frames, batch.linktype)
+        self.records += len(batch.frames)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class AccountingClient:
+    """Lee el top-K de un colector con ``--accounting --stats-port`` (lo usa NetGuard).
+
+    Las peticiones HTTP las hace un hilo propio cada ``interval`` segundos;
+    ``snapshot()`` solo devuelve la última respuesta, así que el refresco de
+    la interfaz nunca espera a la red. Si el colector no responde se deja de
+    preguntar durante ``retry_seconds``.
+
+    Con ``sync_attribution`` arranca y para junto a él un ``AttributionSync``
+    que copia la caché DNS/SNI del colector a la de este proceso (la que
+    consulta ``traffic_classifier.classify_service``).
+    """
+
+    def __init__(self, port: int = DEFAULT_STATS_PORT, host: str = "127.0.0.1", timeout: float = 0.3,
+                 retry_seconds: float = 30.0, interval: float = 2.0, sync_attribution: bool = True):
+        self.url = f"http://{host}:{port}/top"
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.interval = interval
+        self.attribution_sync = AttributionSync(port=port, host=host) if sync_attribution else None
+        self._latest: Optional[dict] = None
+        self._latest_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def fetch(self) -> Optional[dict]:
+        """Una consulta síncrona al colector (la usa el hilo de sondeo)."""
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as resp:
+                snap = json.loads(resp.read().decode("utf-8"))
+        except (OSError, ValueError):
+            self._latest = None
+            return None
+        self._latest, self._latest_at = snap, time.monotonic()
+        return snap
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            wait = self.interval if self.fetch() is not None else self.retry_seconds
+            self._stop_event.wait(wait)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if self.attribution_sync is not None:
+            self.attribution_sync.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.attribution_sync is not None:
+            self.attribution_sync.stop()
+
+    def snapshot(self) -> Optional[dict]:
+        """Última respuesta del colector (None si no hay o tiene más de tres intervalos)."""
+        if self._latest is None or time.monotonic() - self._latest_at > 3 * self.interval:
+            return None
+        return self._latest
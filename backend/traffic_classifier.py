@@ -2,30 +2,206 @@
 # traffic_classifier.py
 # Clasificador pasivo de tráfico por servicio
 # ==========================================
+#
+# Los rangos CIDR de cada servicio (service_ip_ranges.json y, si existen,
+# service_ranges/<Servicio>.txt) se compilan en intervalos enteros ordenados
+# y disjuntos: cada intervalo lleva el servicio del prefijo más largo que lo
+# cubre. Una consulta es una búsqueda binaria (np.searchsorted), así que
+# classify_many() clasifica arrays de millones de IPs de una vez.
+#
+# IPv6 se indexa por los 64 bits altos: prefijos más largos que /64 se
+# tratan como su /64.
+#
+# classify_service() consulta antes la caché DNS/SNI de service_attribution,
+# que sí distingue servicios alojados en la misma CDN. Fuera del colector esa
+# caché solo tiene datos si alguien arranca un AttributionSync (lo hace
+# AccountingClient); la consulta en sí nunca abre hilos ni conexiones.
 
-from typing import Tuple
-
-# Mapa simple de servicios por rangos IP conocidos (CDN)
-SERVICE_IP_MAP = {
-    "YouTube": [
-        "142.250.", "172.217.", "216.58."
-    ],
-    "Google": [
-        "142.250.", "172.217.", "216.58."
-    ],
-    "Facebook": [
-        "157.240."
-    ],
-    "Instagram": [
-        "157.240."
-    ],
-    "TikTok": [
-        "161.117.", "47.88."
-    ],
-    "Netflix": [
-        "52.89.", "54.148.", "34.210."
-    ]
-}
+import ipaddress
+import json
+import os
+import socket
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from service_attribution import get_attribution_cache
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RANGES_FILE = os.path.join(_BASE_DIR, "service_ip_ranges.json")
+RANGES_DIR = os.path.join(_BASE_DIR, "service_ranges")
+
+UNKNOWN = "Desconocido"
+_V4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+
+def load_service_ranges(json_path: str = RANGES_FILE,
+                        ranges_dir: Optional[str] = RANGES_DIR) -> Dict[str, List[str]]:
+    """Servicio → lista de CIDR, en orden de prioridad (para prefijos iguales)."""
+    ranges: Dict[str, List[str]] = {}
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for service, cidrs in data.items():
+            if not service.startswith("_"):
+                ranges.setdefault(service, []).extend(cidrs)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No se pudieron cargar los rangos de servicios ({json_path}): {e}")
+
+    if ranges_dir and os.path.isdir(ranges_dir):
+        for name in sorted(os.listdir(ranges_dir)):
+            if not name.endswith(".txt"):
+                continue
+            service = name[:-4]
+            with open(os.path.join(ranges_dir, name), "r", encoding="utf-8") as f:
+                cidrs = [line.split("#", 1)[0].strip() for line in f]
+            ranges.setdefault(service, []).extend(c for c in cidrs if c)
+    return ranges
+
+
+class _IntervalTable:
+    """Intervalos disjuntos ``[starts[i], starts[i+1])`` con un código de servicio cada uno."""
+
+    def __init__(self, ranges: List[Tuple[int, int, int, int]], space_bits: int):
+        # ranges: (inicio, fin inclusivo, longitud de prefijo, orden de prioridad)
+        top = 1 << space_bits
+        bounds = {0}
+        for start, end, _, _ in ranges:
+            bounds.add(start)
+            if end + 1 < top:
+                bounds.add(end + 1)
+        starts = np.array(sorted(bounds), dtype=np.uint64)
+        codes = np.full(len(starts), -1, dtype=np.int32)
+        # Se pinta de menos a más específico: el prefijo más largo queda encima.
+        # Con el mismo prefijo se pinta al final el servicio de mayor prioridad.
+        for start, end, _, code in sorted(ranges, key=lambda r: (r[2], -r[3])):
+            lo = np.searchsorted(starts, np.uint64(start))
+            hi = len(starts) if end + 1 >= top else np.searchsorted(starts, np.uint64(end + 1))
+            codes[lo:hi] = code
+        # Intervalos vecinos con el mismo servicio se fusionan
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = codes[1:] != codes[:-1]
+        self.starts = starts[keep]
+        self.codes = codes[keep]
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        pos = np.searchsorted(self.starts, keys.astype(np.uint64, copy=False), side="right") - 1
+        return self.codes[pos]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class ServiceClassifier:
+    """Clasificador por prefijo más largo sobre rangos CIDR compilados."""
+
+    def __init__(self, service_ranges: Dict[str, Iterable[str]]):
+        self.services: List[str] = list(service_ranges)
+        v4, v6 = [], []
+        for code, service in enumerate(self.services):
+            for cidr in service_ranges[service]:
+                try:
+                    net = ipaddress.ip_network(cidr.strip(), strict=False)
+                except ValueError:
+                    print(f"⚠️ CIDR inválido para {service}: {cidr!r}")
+                    continue
+                start, end = int(net.network_address), int(net.broadcast_address)
+                if net.version == 4:
+                    v4.append((start, end, net.prefixlen, code))
+                else:
+                    v6.append((start >> 64, end >> 64, min(net.prefixlen, 64), code))
+        self._build(v4, v6)
+
+    def _build(self, v4, v6):
+        self._v4 = _IntervalTable(v4, 32)
+        self._v6 = _IntervalTable(v6, 64)
+        self._names = np.array(self.services + [UNKNOWN], dtype=object)
+
+    @classmethod
+    def from_files(cls, json_path: str = RANGES_FILE, ranges_dir: Optional[str] = RANGES_DIR):
+        return cls(load_service_ranges(json_path, ranges_dir))
+
+    @classmethod
+    def from_intervals(cls, labels: List[str], v4: Iterable[Tuple[int, int, int]],
+                       v6: Iterable[Tuple[int, int, int]] = ()):
+        """Construye desde rangos arbitrarios ``(inicio, fin inclusivo, índice en labels)``.
+
+        Sirve para tablas que no son CIDR (p. ej. ip2asn); los rangos no deben solaparse.
+        """
+        self = cls.__new__(cls)
+        self.services = list(labels)
+        self._build([(start, end, 0, code) for start, end, code in v4],
+                    [(start >> 64, end >> 64, 0, code) for start, end, code in v6])
+        return self
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """Servicio de una IP en texto (o None)."""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 4:
+            code = self._v4.lookup(np.array([int(addr)], dtype=np.uint64))[0]
+        else:
+            code = self._v6.lookup(np.array([int(addr) >> 64], dtype=np.uint64))[0]
+        return self.services[code] if code >= 0 else None
+
+    def codes_many(self, ips: np.ndarray) -> np.ndarray:
+        """Índices en ``self.services`` (-1 = desconocido) para un array de IPs.
+
+        Acepta enteros IPv4 (uint32), claves de 16 bytes (``S16``, IPv4 como
+        ::ffff:a.b.c.d, igual que meta_columnar) o IPs en texto.
+        """
+        ips = np.asarray(ips)
+        if ips.dtype.kind in "iu":
+            return self._v4.lookup(ips)
+        if ips.dtype.kind == "S":
+            return self._codes_keys(ips)
+        keys = np.array([_text_key(ip) for ip in ips.ravel()], dtype="S16").reshape(ips.shape)
+        return self._codes_keys(keys)
+
+    def _codes_keys(self, keys: np.ndarray) -> np.ndarray:
+        raw = np.ascontiguousarray(keys, dtype="S16").reshape(-1).view(np.uint8).reshape(-1, 16)
+        hi = raw[:, :8].copy().view(">u8").ravel()
+        lo = raw[:, 8:].copy().view(">u8").ravel()
+        codes = np.full(len(hi), -1, dtype=np.int32)
+        is_v4 = (hi == 0) & ((lo >> np.uint64(32)) == 0xFFFF)
+        if is_v4.any():
+            codes[is_v4] = self._v4.lookup(lo[is_v4] & np.uint64(0xFFFFFFFF))
+        is_v6 = ~is_v4 & ((hi != 0) | (lo != 0))
+        if is_v6.any():
+            codes[is_v6] = self._v6.lookup(hi[is_v6])
+        return codes.reshape(keys.shape)
+
+    def classify_many(self, ips: np.ndarray) -> np.ndarray:
+        """Nombre de servicio por IP (``Desconocido`` si no está en ningún rango)."""
+        return self._names[self.codes_many(ips)]
+
+
+def _text_key(ip) -> bytes:
+    if isinstance(ip, bytes):
+        ip = ip.decode("ascii")
+    try:
+        if ":" in ip:
+            return socket.inet_pton(socket.AF_INET6, ip)
+        return _V4_MAPPED + socket.inet_aton(ip)
+    except (OSError, TypeError):
+        return b""
+
+
+_default_classifier: Optional[ServiceClassifier] = None
+
+
+def get_classifier() -> ServiceClassifier:
+    """Clasificador compartido, construido la primera vez que se usa."""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = ServiceClassifier.from_files()
+    return _default_classifier
+
+
+def classify_many(ips: np.ndarray) -> np.ndarray:
+    return get_classifier().classify_many(ips)
 
 
 def classify_service(ip: str, port: int) -> Tuple[str, str]:
@@ -34,10 +210,7 @@ def classify_service(ip: str, port: int) -> Tuple[str, str]:
     Retorna: (servicio, protocolo)
     """
     protocol = "HTTPS" if port == 443 else "HTTP" if port == 80 else "Otro"
-
-    for service, prefixes in SERVICE_IP_MAP.items():
-        for prefix in prefixes:
-            if ip.startswith(prefix):
-                return service, protocol
-
-    return "Desconocido", protocol
+    attributed = get_attribution_cache().lookup(ip)
+    if attributed and attributed[1]:
+        return attributed[1], protocol
+    return get_classifier().lookup(ip) or UNKNOWN, protocol
@@ -14,8 +14,10 @@ import time
 import subprocess
 import platform
 import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple, Iterable
 
 # Limpiar pantalla según sistema operativo
 system_name = platform.system().lower()
@@ -563,7 +565,20 @@ class VendorLookup:
         self.mac_detector = MACDetector()
         self.cache_file = os.path.join(os.path.dirname(__file__), "mac_vendors.json")
         self.max_cache_age = 30
+
+        # Cache persistente de consultas remotas (aciertos y "Desconocido")
+        self.remote_cache_file = os.path.join(os.path.dirname(__file__), "vendor_cache.json")
+        self.remote_hit_ttl = 30 * 24 * 3600     # 30 días para fabricantes encontrados
+        self.remote_miss_ttl = 24 * 3600         # 1 día para OUIs sin resultado
+        self.remote_min_interval = 1.0           # segundos entre consultas a las APIs
+        self.remote_max_workers = 4
+        self._remote_cache: Dict[str, Dict] = {}
+        self._cache_lock = threading.Lock()
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
+
         self._load_database()
+        self._load_remote_cache()
     
     def _load_database(self) -> bool:
         """Cargar base de datos desde cache o descargar"""
@@ -772,6 +787,85 @@ class VendorLookup:
             print(f"💾 Base guardada: {len(self.vendors)} fabricantes")
         except Exception as e:
             print(f"⚠️ Error guardando base: {e}")
+
+    def _load_remote_cache(self):
+        """Cargar cache de consultas remotas ({OUI: {"vendor", "ts"}})"""
+        try:
+            if not os.path.exists(self.remote_cache_file):
+                return
+            with open(self.remote_cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            for key, entry in data.items():
+                oui = self._format_oui(key)
+                if not oui:
+                    continue
+                # Formato antiguo {"D401C3": "Desconocido"}: sin fecha, se trata como expirado
+                if isinstance(entry, str):
+                    entry = {'vendor': entry, 'ts': 0}
+                if isinstance(entry, dict) and entry.get('vendor'):
+                    self._remote_cache[oui] = {'vendor': entry['vendor'], 'ts': float(entry.get('ts', 0))}
+
+            print(f"✅ Cache remoto cargado: {len(self._remote_cache)} OUIs")
+        except Exception as e:
+            print(f"⚠️ Error cargando cache remoto: {e}")
+
+    def _save_remote_cache(self):
+        """Guardar cache de consultas remotas (escritura atómica)"""
+        try:
+            with self._cache_lock:
+                data = dict(self._remote_cache)
+            tmp_file = self.remote_cache_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.remote_cache_file)
+        except Exception as e:
+            print(f"⚠️ Error guardando cache remoto: {e}")
+
+    def _get_cached_remote(self, oui: str) -> Optional[str]:
+        """Devuelve el resultado remoto cacheado si no ha expirado, o None."""
+        with self._cache_lock:
+            entry = self._remote_cache.get(oui)
+        if not entry:
+            return None
+        ttl = self.remote_miss_ttl if entry['vendor'] == "Desconocido" else self.remote_hit_ttl
+        if time.time() - entry['ts'] > ttl:
+            return None
+        return entry['vendor']
+
+    def _store_remote(self, oui: str, vendor: str):
+        """Registra en memoria un resultado remoto (acierto o "Desconocido")."""
+        with self._cache_lock:
+            self._remote_cache[oui] = {'vendor': vendor, 'ts': time.time()}
+            if vendor != "Desconocido":
+                self.vendors[oui] = vendor
+
+    def _format_oui(self, value: str) -> Optional[str]:
+        """Normaliza 'AABBCC', 'AA-BB-CC' o una MAC completa a 'AA:BB:CC'."""
+        hex_chars = re.sub(r'[^0-9A-Fa-f]', '', value or '').upper()
+        if len(hex_chars) < 6:
+            return None
+        return f"{hex_chars[0:2]}:{hex_chars[2:4]}:{hex_chars[4:6]}"
+
+    def _parse_oui(self, mac_address: str) -> Tuple[Optional[str], str]:
+        """
+        Valida la MAC y devuelve (oui, mac_limpia).
+        Si no es válida devuelve (None, valor_a_retornar).
+        """
+        if not mac_address or len(mac_address) < 8:
+            return None, "Desconocido"
+
+        mac_clean = mac_address.upper().replace('-', ':').replace('.', ':')
+        parts = mac_clean.split(':')
+
+        if len(parts) < 3:
+            return None, "Desconocido"
+
+        for part in parts[:3]:
+            if len(part) != 2 or not all(c in '0123456789ABCDEF' for c in part):
+                return None, "Formato MAC inválido"
+
+        return ':'.join(parts[:3]), mac_clean
     
     def lookup(self, mac_address: str, ssid: str = None) -> str:
         """
@@ -781,21 +875,10 @@ class VendorLookup:
             mac_address: Dirección MAC a consultar
             ssid: SSID de la red (opcional, para detección de MAC aleatoria)
         """
-        if not mac_address or len(mac_address) < 8:
-            return "Desconocido"
-        
         try:
-            mac_clean = mac_address.upper().replace('-', ':').replace('.', ':')
-            parts = mac_clean.split(':')
-            
-            if len(parts) < 3:
-                return "Desconocido"
-            
-            for part in parts[:3]:
-                if len(part) != 2 or not all(c in '0123456789ABCDEF' for c in part):
-                    return "Formato MAC inválido"
-            
-            oui = ':'.join(parts[:3])
+            oui, mac_clean = self._parse_oui(mac_address)
+            if not oui:
+                return mac_clean
             
             # Buscar en base de datos local primero
             if oui in self.vendors:
@@ -847,24 +930,99 @@ class VendorLookup:
         except Exception:
             return False
     
-    def _search_realtime(self, oui: str) -> str:
-        """Búsqueda en tiempo real desde API externa"""
+    def get_vendors(self, macs: Iterable[str]) -> Dict[str, str]:
+        """
+        Busca el fabricante de varias MACs en una sola pasada.
+
+        Agrupa por OUI, responde desde la base local y el cache remoto, y
+        resuelve los OUIs restantes en paralelo respetando el límite de
+        consultas. No intenta recuperar la MAC original de las aleatorias.
+
+        Returns:
+            Diccionario {mac_original: fabricante}
+        """
+        results: Dict[str, str] = {}
+        pending: Dict[str, List[Tuple[str, str]]] = {}
+
+        for mac in macs:
+            if not mac or mac in results:
+                continue
+
+            oui, mac_clean = self._parse_oui(mac)
+            if not oui:
+                results[mac] = mac_clean
+                continue
+
+            is_random = self._is_random_mac(mac_clean)
+            if oui in self.vendors:
+                results[mac] = "MAC Aleatoria" if is_random else self.vendors[oui]
+                continue
+
+            # Los OUIs con bit local no están registrados: no vale la pena consultarlos
+            if is_random:
+                results[mac] = "MAC Aleatoria"
+                continue
+
+            cached = self._get_cached_remote(oui)
+            if cached is not None:
+                results[mac] = cached
+                continue
+
+            pending.setdefault(oui, []).append((mac, mac_clean))
+
+        if pending:
+            print(f"🌐 [VendorLookup] Consultando {len(pending)} OUIs remotos...")
+            workers = max(1, min(self.remote_max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                resolved = dict(zip(pending, executor.map(self._query_remote, pending)))
+            self._save_remote_cache()
+
+            for oui, entries in pending.items():
+                for mac, _ in entries:
+                    results[mac] = resolved.get(oui, "Desconocido")
+
+        return results
+
+    def _wait_rate_limit(self):
+        """Espera el turno para la siguiente consulta remota (límite global entre hilos)."""
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request_at)
+            self._next_request_at = slot + self.remote_min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _query_remote(self, oui: str) -> str:
+        """Consulta las APIs externas y registra el resultado (también "Desconocido")."""
         apis = [
             self._query_macvendors_api,
             self._query_maclookup_api,
         ]
-        
+
+        vendor = "Desconocido"
         for api in apis:
             try:
-                vendor = api(oui)
-                if vendor and vendor != "Desconocido":
-                    self.vendors[oui] = vendor
-                    self._save_database()
-                    return vendor
+                self._wait_rate_limit()
+                result = api(oui)
+                if result and result != "Desconocido":
+                    vendor = result
+                    break
             except:
                 continue
-        
-        return "Desconocido"
+
+        self._store_remote(oui, vendor)
+        return vendor
+
+    def _search_realtime(self, oui: str) -> str:
+        """Búsqueda en tiempo real desde API externa (con cache persistente)"""
+        cached = self._get_cached_remote(oui)
+        if cached is not None:
+            return cached
+
+        vendor = self._query_remote(oui)
+        self._save_remote_cache()
+        return vendor
     
     def _query_macvendors_api(self, oui: str) -> str:
         """Consultar API de macvendors.com"""
@@ -921,6 +1079,26 @@ def get_vendor(bssid: str, ssid: str = None) -> str:
         print(f"❌ Error crítico en get_vendor: {e}")
         return "Desconocido"
 
+def get_vendors(macs: Iterable[str]) -> Dict[str, str]:
+    """
+    Obtiene el fabricante de varias MACs en una sola llamada.
+    Pensado para refrescos de listas (redes escaneadas, dispositivos conectados).
+    
+    Args:
+        macs: Direcciones MAC a consultar
+    """
+    try:
+        macs = [mac for mac in macs if mac]
+        if not macs:
+            return {}
+        
+        lookup = _get_vendor_lookup()
+        return lookup.get_vendors(macs)
+        
+    except Exception as e:
+        print(f"❌ Error crítico en get_vendors: {e}")
+        return {mac: "Desconocido" for mac in macs}
+
 def get_enhanced_vendor_info(bssid: str, ssid: str = None) -> Dict[str, Optional[str]]:
     """
     Obtiene información completa del fabricante incluyendo detección de MACs aleatorias.
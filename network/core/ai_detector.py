@@ -690,8 +690,10 @@ SECURITY_KEYWORDS = set([
 # =============================================================
 
 class AnomalyDetector:
-    def __init__(self, contamination=0.08):
+    def __init__(self, contamination=0.08, on_anomaly=None):
         self.contamination  = contamination
+        # Callback opcional con el resultado de cada anomalia (p. ej. volcar la captura pre-disparo)
+        self.on_anomaly     = on_anomaly
         self.is_trained     = False
         self.model          = None
         self.scaler         = None
@@ -807,11 +809,17 @@ class AnomalyDetector:
             except Exception:
                 pass
 
-        return {
+        result = {
             "label":    "ANOMALIA" if reasons else "NORMAL",
             "severity": severity if reasons else "NORMAL",
             "reasons":  reasons,
         }
+        if reasons and self.on_anomaly:
+            try:
+                self.on_anomaly(result)
+            except Exception as e:
+                print(f"Error en callback de anomalia: {e}")
+        return result
 
     def get_stats(self) -> dict:
         return self.stats
@@ -31,6 +31,18 @@ from core.ai_detector import (
     SecurityChatbot, DocumentTrainer, SYSTEM_LANG, t
 )
 
+# Disparo de la captura pre-disparo del colector (backend/pretrigger.py), si esta disponible
+try:
+    from pretrigger import send_trigger
+except ImportError:
+    send_trigger = None
+
+# Top de trafico por servicio/host/ASN de un colector con --accounting (backend/traffic_accounting.py)
+try:
+    from traffic_accounting import AccountingClient
+except ImportError:
+    AccountingClient = None
+
 # =============================================================
 # ESTILO
 # =============================================================
@@ -236,7 +248,10 @@ class MainWindow(QMainWindow):
         # Modulos
         self.scanner           = NetworkScanner(output_callback=self._on_scanner_raw)
         self.monitor           = TrafficMonitor()
-        self.anomaly_detector  = AnomalyDetector()
+        self.talkers           = AccountingClient() if AccountingClient else None
+        self.anomaly_detector  = AnomalyDetector(
+            on_anomaly=self._trigger_capture if send_trigger else None
+        )
         self.vuln_analyzer     = VulnerabilityAnalyzer()
         self.doc_trainer       = DocumentTrainer()
         self.chatbot           = SecurityChatbot(self.doc_trainer)
@@ -579,6 +594,29 @@ class MainWindow(QMainWindow):
         self.traffic_log.setObjectName("console")
         self.traffic_log.setReadOnly(True)
         left_l.addWidget(self.traffic_log, 1)
+
+        # Top de trafico (servicio / host local / ASN) de los ultimos 10 s
+        lbl_talkers = QLabel(self._txt("QUIEN USA LA RED (ULTIMOS 10 s)", "TOP TALKERS (LAST 10 s)"))
+        lbl_talkers.setObjectName("lbl_section")
+        left_l.addWidget(lbl_talkers)
+        self.talkers_table = QTableWidget(0, 4)
+        self.talkers_table.setHorizontalHeaderLabels([
+            self._txt("Tipo", "Type"),
+            self._txt("Nombre", "Name"),
+            "KB/s",
+            self._txt("Paquetes", "Packets"),
+        ])
+        self.talkers_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.talkers_table.verticalHeader().setVisible(False)
+        self.talkers_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.talkers_table.setMaximumHeight(200)
+        left_l.addWidget(self.talkers_table)
+        self.lbl_talkers_hint = QLabel(self._txt(
+            "Requiere el colector: python backend/collector.py --accounting --stats-port 47471",
+            "Requires the collector: python backend/collector.py --accounting --stats-port 47471"
+        ))
+        self.lbl_talkers_hint.setStyleSheet("font-size:10px; color:#484f58; padding:2px 0;")
+        left_l.addWidget(self.lbl_talkers_hint)
         mon_splitter.addWidget(left_w)
 
         # Tabla de puertos abiertos (derecha)
@@ -1176,11 +1214,19 @@ class MainWindow(QMainWindow):
         self.lbl_status.setStyleSheet("QLabel#lbl_info { color:#58a6ff; }")
         self.card_status._value_label.setText(self._txt("Activo", "Active"))
         self.monitor.initialize()
+        if self.talkers:
+            self.talkers.start()
         self.timer.start(2000)
 
+    def _trigger_capture(self, result):
+        # Un colector en modo --pretrigger-seconds vuelca los paquetes de la anomalia; sin colector no pasa nada
+        send_trigger(f"{result['severity']}: {'; '.join(result['reasons'])}")
+
     def _stop_monitoring(self):
         if not self.monitoring_active: return
         self.timer.stop()
+        if self.talkers:
+            self.talkers.stop()
         self.monitoring_active = False
         self.btn_monitor.setEnabled(True)
         self.btn_stop.setEnabled(False)
@@ -1274,6 +1320,27 @@ class MainWindow(QMainWindow):
                 col
             )
 
+        self._update_talkers()
+
+    def _update_talkers(self):
+        # El hilo de AccountingClient trae el top; el tick solo pinta la última respuesta
+        snap = self.talkers.snapshot() if self.talkers else None
+        self.lbl_talkers_hint.setVisible(snap is None)
+        if snap is None:
+            return
+        kinds = (
+            ("service", self._txt("Servicio", "Service"), 5),
+            ("host",    self._txt("Equipo", "Host"),      5),
+            ("asn",     self._txt("Red remota", "Remote network"), 3),
+        )
+        rows = [(label, entry) for dim, label, k in kinds for entry in snap["top"].get(dim, [])[:k]]
+        self.talkers_table.setRowCount(len(rows))
+        for r, (label, entry) in enumerate(rows):
+            self.talkers_table.setItem(r, 0, QTableWidgetItem(label))
+            self.talkers_table.setItem(r, 1, QTableWidgetItem(str(entry["key"])))
+            self.talkers_table.setItem(r, 2, QTableWidgetItem(f"{entry['bytes_per_s'] / 1024:.1f}"))
+            self.talkers_table.setItem(r, 3, QTableWidgetItem(str(entry["packets"])))
+
     # ==========================================================
     # ENTRENAMIENTO MODELO DE TRAFICO
     # ==========================================================
@@ -1504,6 +1571,8 @@ class MainWindow(QMainWindow):
             self.timer.stop()
         except Exception:
             pass
+        if self.talkers:
+            self.talkers.stop()
 
         # ── 3. Cancelar workers (sólo marcan su flag interno, no tocan C++) ──
         try:
@@ -107,8 +107,6 @@ def signal_color_by_dbm(signal_dbm: Optional[float]) -> str:
 # PEGA AQUÍ EL RESTO DEL CÓDIGO ORIGINAL DE card.py (clase Card y lo demás)
 # Solo se corrigió el bloque de imports de arriba — nada más cambia.
 # ═══════════════════════════════════════════════════════════════════════════
-from vistas.workers import RouterCapacityWorker
-
 class Card(QFrame):
     def __init__(self, red: dict, parent=None):
         super().__init__(parent)
@@ -118,9 +116,8 @@ class Card(QFrame):
         # Verificar si es la red conectada y aplicar estilo
         self._apply_connection_style()
         
+        # La información del router la resuelve MainWindow en lote
         self._build_ui()
-        # Cargar información del router en segundo plano
-        self._load_router_info()
 
     def _apply_connection_style(self):
         """Aplicar estilo de borde según si está conectado o no"""
@@ -156,26 +153,6 @@ class Card(QFrame):
                 }}
             """)
 
-    def _load_router_info(self):
-        """Cargar información del router en segundo plano"""
-        mac = self.red.get("BSSID")
-        vendor = self.red.get("Fabricante")
-        wifi_tech = self.red.get("Tecnologia", "")
-        
-        if mac and vendor:
-            self.router_worker = RouterCapacityWorker(mac, vendor, wifi_tech)
-            self.router_worker.finished.connect(self._on_router_info_loaded)
-            self.router_worker.error.connect(lambda e: print(f"Error router info: {e}"))
-            self.router_worker.start()
-
-    def _on_router_info_loaded(self, router_info):
-        """Callback cuando se carga la información del router"""
-        if router_info and router_info.get("max_devices"):
-            self.red["router_max_devices"] = router_info["max_devices"]
-            self.red["router_model"] = router_info.get("model", "No detectado")
-            # Actualizar la UI con el modelo del router
-            self._update_router_model()
-
     def _update_router_model(self):
         """Actualizar el modelo del router en la tarjeta"""
         try:
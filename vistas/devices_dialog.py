@@ -6,6 +6,7 @@ import sys
 import os
 import subprocess
 import platform
+from datetime import datetime
 from typing import Optional, Dict
 
 # ── Rutas del proyecto ────────────────────────────────────────────────────
@@ -24,7 +25,7 @@ from PyQt6.QtWidgets import (
     QTextEdit, QHBoxLayout, QFormLayout, QMessageBox
 )
 from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QFont, QIcon, QCursor, QMouseEvent
+from PyQt6.QtGui import QFont, QIcon, QCursor, QMouseEvent, QTextCursor
 
 # ── Imports del backend (prefijo explícito) ───────────────────────────────
 from backend.main import scan_wifi
@@ -67,6 +68,12 @@ except ImportError:
         return {"model": "No detectado", "max_devices": 50,
                 "wifi_standard": "Desconocido", "confidence": "low"}
 
+try:
+    from backend.speed_history import get_speed_history
+    SPEED_HISTORY_OK = True
+except ImportError:
+    SPEED_HISTORY_OK = False
+
 try:
     from network.ui_ia.main_window import MainWindow as NetGuardWindow
     NETGUARD_OK = True
@@ -157,6 +164,18 @@ class SuggestionWindow(QDialog):
         """)
         text_area.setText(texto)
         layout.addWidget(text_area)
+        self.text_area = text_area
+
+    def append_text(self, fragmento: str):
+        """Añade un fragmento al final (respuesta en streaming)."""
+        cursor = self.text_area.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(fragmento)
+        self.text_area.setTextCursor(cursor)
+        self.text_area.ensureCursorVisible()
+
+    def set_text(self, texto: str):
+        self.text_area.setText(texto)
 
     def set_icon(self):
         icon_path = os.path.join(os.path.dirname(__file__),"../img", "wifi.png")
@@ -212,6 +231,7 @@ class DevicesDialog(QDialog):
         self.setWindowTitle(f"Dispositivos Conectados - {red_meta.get('SSID', 'Red')}")
         self.setMinimumSize(900, 700)
         self.setup_ui()
+        self._show_cached_speed()
 
         # Timer de actualización automática cada 2 minutos
         self.refresh_timer = QTimer(self)
@@ -332,6 +352,16 @@ class DevicesDialog(QDialog):
         self.ping_lbl.setFont(QFont("Segoe UI", 9))
         speed_layout.addWidget(self.ping_lbl)
 
+        self.latency_lbl = QLabel("")
+        self.latency_lbl.setFont(QFont("Segoe UI", 9))
+        self.latency_lbl.setToolTip("Latencia en reposo y bajo carga")
+        speed_layout.addWidget(self.latency_lbl)
+
+        self.speed_trend_lbl = QLabel("")
+        self.speed_trend_lbl.setFont(QFont("Segoe UI", 9))
+        self.speed_trend_lbl.setStyleSheet(f"color: {COLOR_MUTED};")
+        speed_layout.addWidget(self.speed_trend_lbl)
+
         speed_layout.addStretch()
 
         self.speed_btn = QPushButton("📊 Medir")
@@ -496,19 +526,77 @@ class DevicesDialog(QDialog):
         self.speed_worker.error.connect(self._on_speed_test_error)
         self.speed_worker.start()
 
+    def _show_cached_speed(self):
+        """Último resultado guardado de esta red, sin esperar a un test nuevo."""
+        if not SPEED_HISTORY_OK:
+            return
+        cached = get_speed_history().latest(self.red_meta.get("BSSID"), self.red_meta.get("SSID"))
+        if not cached:
+            return
+        self.speed_data = dict(cached, success=True)
+        self._show_speed(self.speed_data)
+        when = datetime.fromtimestamp(cached["ts"]).strftime("%d/%m %H:%M")
+        self.download_lbl.setToolTip(f"Último test guardado: {when}")
+        self._show_speed_trend()
+
+    def _show_speed_trend(self):
+        if not SPEED_HISTORY_OK:
+            return
+        trend = get_speed_history().trend(self.red_meta.get("BSSID"), self.red_meta.get("SSID"))
+        if trend["count"] < 2:
+            self.speed_trend_lbl.setText("")
+            return
+        change = trend["change_pct"]
+        arrow = "→" if change is None or abs(change) < 10 else "↗" if change > 0 else "↘"
+        text = f"{arrow} media {trend['avg_mbps']:.1f}Mbps ({trend['count']} tests)"
+        if change is not None:
+            text += f" {change:+.0f}%"
+        self.speed_trend_lbl.setText(text)
+        self.speed_trend_lbl.setToolTip(
+            "Descarga en los últimos tests: " + ", ".join(f"{v:.1f}" for v in trend["download_mbps"]))
+
+    def _show_speed(self, result):
+        self.download_lbl.setText(f"⬇ {result.get('download_mbps', 0):.1f}Mbps")
+        self.upload_lbl.setText(f"⬆ {result.get('upload_mbps', 0):.1f}Mbps")
+        self.ping_lbl.setText(f"🏓 {result.get('ping_ms', 0):.1f}ms")
+        self._show_link_quality(result)
+
     def _on_speed_test_finished(self, result):
         self.speed_data = result
         if result.get('success', False):
-            self.download_lbl.setText(f"⬇ {result.get('download_mbps', 0):.1f}Mbps")
-            self.upload_lbl.setText(f"⬆ {result.get('upload_mbps', 0):.1f}Mbps")
-            self.ping_lbl.setText(f"🏓 {result.get('ping_ms', 0):.1f}ms")
+            self._show_speed(result)
+            self.download_lbl.setToolTip("")
+            self._show_speed_trend()
         self.speed_btn.setEnabled(True)
         self.speed_btn.setText("📊 Medir")
 
+    def _show_link_quality(self, result):
+        """Jitter/pérdida en reposo y latencia bajo carga (bufferbloat) si el test las trae."""
+        if result.get("jitter_ms") is None:
+            self.latency_lbl.setText("")
+            return
+        parts = [f"± {result['jitter_ms']:.1f}ms", f"pérdida {result.get('loss_pct', 0):.0f}%"]
+        bloat = result.get("bufferbloat_ms")
+        if bloat is not None:
+            color = COLOR_SUCCESS if bloat < 30 else COLOR_WARNING if bloat < 100 else COLOR_ERROR
+            parts.append(f"<span style='color: {color};'>carga +{bloat:.0f}ms</span>")
+        self.latency_lbl.setText(" · ".join(parts))
+        idle = result.get("latency", {}).get("idle", {})
+        tip = []
+        if idle.get("received"):
+            tip.append(f"Reposo: p50 {idle['p50_ms']} · p90 {idle['p90_ms']} · p99 {idle['p99_ms']} ms")
+        for direction, name in (("download", "Descarga"), ("upload", "Subida")):
+            loaded = result.get("latency", {}).get(direction, {})
+            if loaded.get("received"):
+                tip.append(f"{name}: p50 {loaded['p50_ms']} · p99 {loaded['p99_ms']} ms, "
+                           f"pérdida {loaded['loss_pct']}%")
+        self.latency_lbl.setToolTip("\n".join(tip))
+
     def _on_speed_test_error(self, error_msg):
         self.download_lbl.setText("⬇ Error")
         self.upload_lbl.setText("⬆ Error")
         self.ping_lbl.setText("🏓 Error")
+        self.latency_lbl.setText("")
         self.speed_btn.setEnabled(True)
         self.speed_btn.setText("📊 Medir")
 
@@ -6,6 +6,7 @@ import sys
 import os
 import subprocess
 import platform
+import time
 from typing import Optional, Dict
 
 # ── Rutas del proyecto ────────────────────────────────────────────────────
@@ -44,6 +45,14 @@ except ImportError:
         return {"success": False, "error": "Módulo no disponible",
                 "download_mbps": 0.0, "upload_mbps": 0.0, "ping_ms": 999.0}
 
+try:
+    from backend.speed_history import SpeedTestScheduler
+except ImportError:
+    SpeedTestScheduler = None
+
+# Tests de velocidad en segundo plano cada N minutos con la red tranquila (vacío = desactivado)
+SPEED_SCHEDULE_ENV = "ESCANER_SPEED_SCHEDULE"
+
 try:
     from backend.vendor_lookup import get_vendor, get_enhanced_vendor_info
 except Exception:
@@ -103,7 +112,7 @@ def signal_color_by_dbm(signal_dbm: Optional[float]) -> str:
         return COLOR_MUTED
 
 
-from vistas.workers import ScanWorker, RouterCapacityWorker
+from vistas.workers import ScanWorker, VendorBatchWorker, RouterBatchWorker, SuggestionPrefetchWorker
 from vistas.card import Card
 from vistas.network_details import NetworkDetailsDialog
 
@@ -125,6 +134,11 @@ class MainWindow(QMainWindow):
 
         # Workers activos
         self.scan_worker = None
+        self.router_worker = None
+        self.vendor_worker = None
+        self.vendor_cache = {}
+        self.prefetch_worker = None
+        self._last_prefetch = 0.0
         self.active_workers = []
 
         central = QWidget()
@@ -223,6 +237,16 @@ class MainWindow(QMainWindow):
         self.timer.start(3000)
         self.lanzar_scan()
 
+        self.speed_scheduler = None
+        minutes = os.environ.get(SPEED_SCHEDULE_ENV, "").strip()
+        if SpeedTestScheduler and minutes:
+            try:
+                self.speed_scheduler = SpeedTestScheduler(interval=float(minutes) * 60)
+                if not self.speed_scheduler.start():
+                    self.speed_scheduler = None
+            except ValueError:
+                print(f"⚠️ {SPEED_SCHEDULE_ENV} inválido: {minutes!r}")
+
         self.setStyleSheet(f"QMainWindow {{ background-color: {COLOR_BG}; }}")
 
     def set_icon(self):
@@ -237,6 +261,18 @@ class MainWindow(QMainWindow):
         if self.scan_worker and self.scan_worker.isRunning():
             self.scan_worker.stop()
 
+        if self.router_worker and self.router_worker.isRunning():
+            self.router_worker.stop()
+
+        if self.vendor_worker and self.vendor_worker.isRunning():
+            self.vendor_worker.stop()
+
+        if self.prefetch_worker and self.prefetch_worker.isRunning():
+            self.prefetch_worker.stop()
+
+        if self.speed_scheduler:
+            self.speed_scheduler.stop()
+
         if self.active_dialog and self.active_dialog.isVisible():
             self.active_dialog.close()
 
@@ -268,6 +304,9 @@ class MainWindow(QMainWindow):
 
     def _scan_done(self, redes):
         self.redes = redes
+        for red in redes:
+            if red.get("BSSID") in self.vendor_cache:
+                red["Fabricante"] = self.vendor_cache[red["BSSID"]]
         self.cantidad_label.setText(f"Redes detectadas: {len(redes)}")
 
         if self.is_first_scan and redes:
@@ -275,7 +314,44 @@ class MainWindow(QMainWindow):
             self.is_first_scan = False
 
         self.construir_cards()
-        QTimer.singleShot(2000, self.update_router_capacities)
+        self.update_vendors()
+        self._prefetch_suggestions()
+
+    def update_vendors(self):
+        """Resuelve en segundo plano los fabricantes que faltan (las tarjetas ya están pintadas).
+
+        La detección de routers se lanza una sola vez, cuando los fabricantes están resueltos.
+        """
+        if self.vendor_worker and self.vendor_worker.isRunning():
+            return
+        pendientes = [red["BSSID"] for red in self.redes
+                      if red.get("BSSID") and red["BSSID"] not in self.vendor_cache]
+        if not pendientes:
+            self.update_router_capacities()
+            return
+        self.vendor_worker = VendorBatchWorker(pendientes)
+        self.vendor_worker.finished.connect(self._on_vendors_loaded)
+        self.vendor_worker.error.connect(lambda e: print(f"Error fabricantes: {e}"))
+        self.vendor_worker.start()
+
+    def _on_vendors_loaded(self, vendors):
+        self.vendor_cache.update(vendors)
+        for red in self.redes:
+            if red.get("BSSID") in vendors:
+                red["Fabricante"] = vendors[red["BSSID"]]
+        # Con el fabricante ya se puede buscar el modelo de router
+        self.update_router_capacities()
+
+    def _prefetch_suggestions(self):
+        """Precarga las sugerencias IA de las redes visibles (como mucho una vez por minuto)."""
+        if not self.redes or time.time() - self._last_prefetch < 60:
+            return
+        if self.prefetch_worker and self.prefetch_worker.isRunning():
+            return
+        self._last_prefetch = time.time()
+        self.prefetch_worker = SuggestionPrefetchWorker(self.redes)
+        self.prefetch_worker.error.connect(lambda e: print(f"Error precargando sugerencias: {e}"))
+        self.prefetch_worker.start()
 
     def construir_cards(self):
         for i in reversed(range(self.grid.count())):
@@ -307,45 +383,50 @@ class MainWindow(QMainWindow):
             card = Card(red)
             self.grid.addWidget(card, row, col)
 
+        self._apply_router_info()
+
     def update_router_capacities(self):
+        """Lanza un único worker para todos los routers que aún no están en cache."""
+        if self.router_worker and self.router_worker.isRunning():
+            return
+
+        pendientes = [
+            # Una MAC aleatoria no identifica al fabricante: se detecta sin él
+            dict(red, Fabricante="" if red["Fabricante"] == "MAC Aleatoria" else red["Fabricante"])
+            for red in self.redes
+            if red.get("BSSID") in self.vendor_cache and red.get("Fabricante") is not None and
+            red["BSSID"] not in self.router_info_cache
+        ]
+        if not pendientes:
+            return
+
+        self.router_worker = RouterBatchWorker(pendientes)
+        self.router_worker.finished.connect(self._on_router_batch_loaded)
+        self.router_worker.error.connect(lambda e: print(f"Error router capacity: {e}"))
+        self.router_worker.start()
+
+    def _on_router_batch_loaded(self, router_infos):
+        try:
+            for bssid, router_info in router_infos.items():
+                if router_info and router_info.get("max_devices"):
+                    self.router_info_cache[bssid] = router_info
+            self._apply_router_info()
+        except Exception as e:
+            print(f"Error procesando información del router: {e}")
+
+    def _apply_router_info(self):
+        """Copia la información cacheada de routers a las tarjetas visibles."""
         for i in range(self.grid.count()):
             item = self.grid.itemAt(i)
-            if item and item.widget():
-                card = item.widget()
-                if (hasattr(card, 'red') and
-                    card.red.get("BSSID") and
-                    card.red.get("Fabricante") and
-                    card.red.get("BSSID") not in self.router_info_cache):
-                    self._load_router_info_for_card(card)
-
-    def _load_router_info_for_card(self, card):
-        mac = card.red["BSSID"]
-        vendor = card.red["Fabricante"]
-        wifi_tech = card.red.get("Tecnologia", "")
-
-        worker = RouterCapacityWorker(mac, vendor, wifi_tech)
-        worker.finished.connect(lambda info, c=card: self._on_card_router_info_loaded(info, c))
-        worker.error.connect(lambda e: print(f"Error router capacity: {e}"))
-
-        self.active_workers.append(worker)
-        worker.start()
-
-    def _on_card_router_info_loaded(self, router_info, card):
-        try:
-            if router_info and router_info.get("max_devices"):
-                self.router_info_cache[card.red["BSSID"]] = router_info
+            card = item.widget() if item else None
+            if not card or not hasattr(card, 'red'):
+                continue
+            router_info = self.router_info_cache.get(card.red.get("BSSID"))
+            if router_info:
                 card.red["router_max_devices"] = router_info["max_devices"]
                 card.red["router_model"] = router_info.get("model", "No detectado")
                 card._update_router_model()
 
-            if hasattr(self, 'active_workers'):
-                for i, worker in enumerate(self.active_workers):
-                    if not worker.isRunning():
-                        self.active_workers.pop(i)
-                        break
-        except Exception as e:
-            print(f"Error procesando información del router: {e}")
-
     def resizeEvent(self, event):
         self.construir_cards()
         return super().resizeEvent(event)
@@ -28,7 +28,7 @@ from PyQt6.QtGui import QFont, QIcon, QCursor, QMouseEvent
 
 # ── Imports del backend (prefijo explícito) ───────────────────────────────
 from backend.main import scan_wifi
-from backend.ai_suggestions import sugerencia_tecnologia, sugerencia_protocolo
+from backend.ai_suggestions import sugerencia_tecnologia, sugerencia_protocolo, respuesta_local
 from backend.network_status import (
     get_connected_wifi_info,
     is_current_network,
@@ -90,6 +90,9 @@ COLOR_ERROR       = "#E81123"
 COLOR_MUTED       = "#848484"
 COLOR_NoCONETCT   = "#79A3A1"
 
+# Separador entre la recomendación local y el refinado de la IA
+SEPARADOR_IA = "\n\n── 🤖 Análisis IA ──\n"
+
 
 def signal_color_by_dbm(signal_dbm: Optional[float]) -> str:
     try:
@@ -137,6 +140,9 @@ class NetworkDetailsDialog(QDialog):
         # Textos originales de botones (para restaurar después de "Analizando...")
         self.botones_texto_original = {}
 
+        # Ventanas de sugerencia abiertas (respuesta local + refinado de la IA en streaming)
+        self.suggestion_windows = {}
+
         self.set_icon()
         self.setWindowTitle(f"Análisis de Red - {red_meta.get('SSID', 'Red')}")
         self.setMinimumSize(800, 650)
@@ -390,16 +396,23 @@ class NetworkDetailsDialog(QDialog):
 
         if tipo == "tecnologia":
             self.botones_texto_original[tipo] = self.btn_tecn.text()
-            self.btn_tecn.setText("🔄 Analizando...")
+            self.btn_tecn.setText("🔄 Refinando...")
             self.btn_tecn.setEnabled(False)
         else:
             self.botones_texto_original[tipo] = self.btn_proto.text()
-            self.btn_proto.setText("🔄 Analizando...")
+            self.btn_proto.setText("🔄 Refinando...")
             self.btn_proto.setEnabled(False)
 
+        # La recomendación local se muestra al instante; la IA la refina en segundo plano
+        local = respuesta_local(self.red_meta, tipo)
+        window = SuggestionWindow(self._titulo_sugerencia(tipo), local, parent=self)
+        self.suggestion_windows[tipo] = {"window": window, "local": local, "ia": False}
+        window.show()
+
         worker = SuggestionWorker(self.red_meta, tipo)
         self.suggestion_workers[tipo] = worker
 
+        worker.chunk.connect(lambda fragmento: self._on_suggestion_chunk(tipo, fragmento))
         worker.finished.connect(lambda result: self._on_suggestion_finished(tipo, result))
         worker.error.connect(lambda e: self._on_suggestion_error(tipo, e))
         worker.finished.connect(worker.deleteLater)
@@ -426,6 +439,7 @@ class NetworkDetailsDialog(QDialog):
 
         if tipo in self.suggestion_workers:
             del self.suggestion_workers[tipo]
+        self.suggestion_windows.pop(tipo, None)
         self._update_buttons_state()
 
     def _on_suggestion_finished(self, tipo, result):
@@ -443,10 +457,29 @@ class NetworkDetailsDialog(QDialog):
             del self.suggestion_workers[tipo]
             self._update_buttons_state()
 
-            if not self._is_closing:
-                titulo = "Análisis de Tecnología" if tipo == "tecnologia" else "Análisis de Protocolo"
-                suggestion_dialog = SuggestionWindow(titulo, result, parent=self)
-                suggestion_dialog.exec()
+            entry = self.suggestion_windows.pop(tipo, None)
+            if entry is not None and not self._is_closing:
+                if result:
+                    entry["window"].set_text(entry["local"] + SEPARADOR_IA + result)
+                elif entry["ia"]:
+                    # La IA cortó la respuesta: se quitan los fragmentos ya mostrados
+                    entry["window"].set_text(entry["local"] + "\n\n(La respuesta de la IA se interrumpió: "
+                                             "se muestra la recomendación local)")
+                else:
+                    entry["window"].append_text("\n\n(IA no disponible: se muestra la recomendación local)")
+
+    def _titulo_sugerencia(self, tipo):
+        return "Análisis de Tecnología" if tipo == "tecnologia" else "Análisis de Protocolo"
+
+    def _on_suggestion_chunk(self, tipo, fragmento):
+        """Los fragmentos de la IA se añaden debajo de la recomendación local."""
+        entry = self.suggestion_windows.get(tipo)
+        if self._is_closing or entry is None:
+            return
+        if not entry["ia"]:
+            entry["ia"] = True
+            entry["window"].append_text(SEPARADOR_IA)
+        entry["window"].append_text(fragmento)
 
     def _show_devices(self):
         """Abrir ventana de dispositivos — independiente, no modal.
@@ -499,6 +532,7 @@ class NetworkDetailsDialog(QDialog):
 
         self.vendor_worker = None
         self.suggestion_workers.clear()
+        self.suggestion_windows.clear()
         self.botones_texto_original.clear()
 
         event.accept()
\ No newline at end of file
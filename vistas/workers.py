@@ -4,6 +4,7 @@ vistas/workers.py – Workers QThread para el escáner WiFi
 # ── stdlib ────────────────────────────────────────────────────────────────
 import sys
 import os
+import threading
 from typing import Optional, Dict
 
 # ── Rutas del proyecto ────────────────────────────────────────────────────
@@ -24,7 +25,10 @@ from PyQt6.QtGui import QFont, QIcon
 
 # ── Imports del backend (prefijo explícito) ───────────────────────────────
 from backend.main import scan_wifi
-from backend.ai_suggestions import sugerencia_tecnologia, sugerencia_protocolo
+from backend.ai_suggestions import (
+    sugerencia_tecnologia, sugerencia_protocolo, prefetch_sugerencias, stream_sugerencia,
+    LLMError,
+)
 from backend.network_status import (
     get_connected_wifi_info,
     is_current_network,
@@ -36,14 +40,21 @@ from backend.network_status import (
 try:
     from backend.network_speed import test_network_speed
 except ImportError:
-    def test_network_speed():
+    def test_network_speed(**kwargs):
         return {"success": False, "error": "Módulo no disponible",
                 "download_mbps": 0.0, "upload_mbps": 0.0, "ping_ms": 999.0}
 
 try:
-    from backend.vendor_lookup import get_vendor, get_enhanced_vendor_info
+    from backend.speed_history import measure_and_record
+except ImportError:
+    def measure_and_record(scheduled=False, blocking=True, **kwargs):
+        return test_network_speed(**kwargs)
+
+try:
+    from backend.vendor_lookup import get_vendor, get_vendors, get_enhanced_vendor_info
 except Exception:
     def get_vendor(_): return "Desconocido"
+    def get_vendors(macs): return {mac: "Desconocido" for mac in macs if mac}
     def get_enhanced_vendor_info(bssid, ssid=None):
         return {"vendor": "Desconocido", "is_random": False,
                 "original_mac": bssid, "original_vendor": "Desconocido"}
@@ -57,11 +68,13 @@ except Exception:
     def get_devices_count(red_info=None): return 0
 
 try:
-    from backend.mac_capacidad import get_router_info
+    from backend.mac_capacidad import get_router_info, get_routers_info
 except ImportError:
     def get_router_info(mac: str, wifi_tech: str = "", vendor: str = "") -> Dict:
         return {"model": "No detectado", "max_devices": 50,
                 "wifi_standard": "Desconocido", "confidence": "low"}
+    def get_routers_info(redes: list) -> Dict:
+        return {r["BSSID"]: get_router_info(r["BSSID"]) for r in redes if r.get("BSSID")}
 
 try:
     from network.ui_ia.main_window import MainWindow as NetGuardWindow
@@ -136,11 +149,13 @@ class SpeedTestWorker(QThread):
     def __init__(self):
         super().__init__()
         self._is_running = True
+        self._cancel = threading.Event()   # corta el test nativo multi-flujo
 
     def run(self):
         if not self._is_running: return
         try:
-            result = test_network_speed()
+            # Se guarda en el historial con el SSID/BSSID de la red conectada
+            result = measure_and_record(cancel_event=self._cancel)
             if self._is_running:
                 self.finished.emit(result)
         except Exception as e:
@@ -149,6 +164,7 @@ class SpeedTestWorker(QThread):
 
     def stop(self):
         self._is_running = False
+        self._cancel.set()
         if self.isRunning():
             self.quit()
             if not self.wait(3000):   # speedtest puede ser lento
@@ -156,6 +172,9 @@ class SpeedTestWorker(QThread):
 
 
 class SuggestionWorker(QThread):
+    """Sugerencia IA en streaming: ``chunk`` por cada fragmento, ``finished`` con el texto completo
+    (vacío si la IA no está disponible o cortó la respuesta: la vista se queda con la recomendación local)."""
+    chunk    = pyqtSignal(str)
     finished = pyqtSignal(str)
     error    = pyqtSignal(str)
 
@@ -167,12 +186,22 @@ class SuggestionWorker(QThread):
 
     def run(self):
         if not self._is_running: return
+        partes = []
         try:
-            result = (sugerencia_tecnologia(self.red_meta)
-                      if self.tipo == "tecnologia"
-                      else sugerencia_protocolo(self.red_meta))
+            stream = stream_sugerencia(self.red_meta, self.tipo)
+            try:
+                for fragmento in stream:
+                    if not self._is_running:
+                        stream.close()     # corta la conexión con el modelo
+                        return
+                    partes.append(fragmento)
+                    self.chunk.emit(fragmento)
+            except LLMError as e:
+                # Un corte a mitad de respuesta deja un texto incompleto: no se entrega
+                print(f"⚠️ IA no disponible, se mantiene la recomendación local: {e}")
+                partes = []
             if self._is_running:
-                self.finished.emit(result)
+                self.finished.emit("".join(partes).strip())
         except Exception as e:
             if self._is_running:
                 self.error.emit(f"Error: {e}")
@@ -185,6 +214,37 @@ class SuggestionWorker(QThread):
                 self.terminate(); self.wait(1000)
 
 
+class SuggestionPrefetchWorker(QThread):
+    """Precarga en segundo plano las sugerencias IA de las redes visibles."""
+    finished = pyqtSignal(int)
+    error    = pyqtSignal(str)
+
+    def __init__(self, redes: list):
+        super().__init__()
+        self.redes       = [
+            {k: r.get(k) for k in ("Seguridad", "Banda", "Tecnologia", "Señal")}
+            for r in redes
+        ]
+        self._is_running = True
+
+    def run(self):
+        if not self._is_running: return
+        try:
+            pedidas = prefetch_sugerencias(self.redes)
+            if self._is_running:
+                self.finished.emit(pedidas)
+        except Exception as e:
+            if self._is_running:
+                self.error.emit(str(e))
+
+    def stop(self):
+        self._is_running = False
+        if self.isRunning():
+            self.quit()
+            if not self.wait(1000):
+                self.terminate(); self.wait(1000)
+
+
 class VendorWorker(QThread):
     finished = pyqtSignal(str)
     error    = pyqtSignal(str)
@@ -271,6 +331,66 @@ class RouterCapacityWorker(QThread):
                 self.terminate(); self.wait(1000)
 
 
+class VendorBatchWorker(QThread):
+    """Fabricantes de todos los BSSID de un escaneo en un solo lote (puede consultar APIs)."""
+    finished = pyqtSignal(dict)
+    error    = pyqtSignal(str)
+
+    def __init__(self, bssids: list):
+        super().__init__()
+        self.bssids      = [b for b in bssids if b]
+        self._is_running = True
+
+    def run(self):
+        if not self._is_running: return
+        try:
+            vendors = get_vendors(self.bssids)
+            if self._is_running:
+                self.finished.emit(vendors)
+        except Exception as e:
+            if self._is_running:
+                self.error.emit(str(e))
+
+    def stop(self):
+        self._is_running = False
+        if self.isRunning():
+            self.quit()
+            if not self.wait(1000):
+                self.terminate(); self.wait(1000)
+
+
+class RouterBatchWorker(QThread):
+    """Resuelve en una sola pasada el router de todas las tarjetas."""
+    finished = pyqtSignal(dict)
+    error    = pyqtSignal(str)
+
+    def __init__(self, redes: list):
+        super().__init__()
+        self.redes       = [
+            {"BSSID": r.get("BSSID"), "Fabricante": r.get("Fabricante"),
+             "Tecnologia": r.get("Tecnologia", "")}
+            for r in redes
+        ]
+        self._is_running = True
+
+    def run(self):
+        if not self._is_running: return
+        try:
+            infos = get_routers_info(self.redes)
+            if self._is_running:
+                self.finished.emit(infos)
+        except Exception as e:
+            if self._is_running:
+                self.error.emit(str(e))
+
+    def stop(self):
+        self._is_running = False
+        if self.isRunning():
+            self.quit()
+            if not self.wait(1000):
+                self.terminate(); self.wait(1000)
+
+
 # ─────────────────────────────────────────────────────────────────────────
 # UI: SuggestionWindow
 # ─────────────────────────────────────────────────────────────────────────